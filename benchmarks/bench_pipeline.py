@@ -0,0 +1,289 @@
+"""
+Measure the query -> pivot -> render pipeline on synthetic usage data,
+offline, with a fake cost_management_client injected into Core.
+
+    python benchmarks/bench_pipeline.py [--rows 10000 100000 1000000]
+    python benchmarks/bench_pipeline.py --save-baseline
+    python benchmarks/bench_pipeline.py --compare [--tolerance 0.3]
+
+Every stage reports the best time of --repeat runs, rows per second and the
+peak memory allocated while it ran (measured in a separate run, because
+tracemalloc slows everything down).
+"""
+
+import argparse
+from datetime import date, timedelta
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from azurecost.core import Core
+from azurecost.date_util import DateUtil
+from azurecost.pivot import Pivot
+from azurecost.scheduler import RequestScheduler
+
+SUBSCRIPTION_ID = "00000000-0000-0000-0000-000000000000"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+class FakeCostManagementClient:
+    """
+    Answers query.usage with generated rows for every period of the requested
+    time period, split into pages that are followed with $skiptoken.
+    """
+
+    def __init__(
+        self,
+        granularity: str,
+        dimensions: list,
+        rows_per_period: int,
+        cardinality: int = 50,
+        currency: str = "USD",
+        page_size: int = 5000,
+        seed: int = 0,
+    ):
+        self.granularity = granularity
+        self.dimensions = dimensions
+        self.rows_per_period = rows_per_period
+        self.cardinality = cardinality
+        self.currency = currency
+        self.page_size = page_size
+        self.seed = seed
+        self.query = self
+        self.calls = 0
+        self._periods = {}
+        self._windows = {}
+
+    def usage(self, scope: str, parameters: dict, params: dict = None, **kwargs):
+        self.calls += 1
+        time_period = parameters["time_period"]
+        window = (time_period.from_property.date(), time_period.to.date())
+        if window not in self._windows:
+            self._windows[window] = [
+                row
+                for period in self._get_periods(*window)
+                for row in self._rows(period)
+            ]
+        rows = self._windows[window]
+
+        offset = int((params or {}).get("$skiptoken", 0))
+        end = offset + self.page_size
+        columns = ["Cost", DateUtil.get_date_column(self.granularity)]
+        if parameters["dataset"].get("grouping"):
+            columns += self.dimensions
+        columns.append("Currency")
+        return SimpleNamespace(
+            columns=[SimpleNamespace(name=name) for name in columns],
+            rows=rows[offset:end],
+            next_link=(
+                f"https://management.azure.com{scope}/providers/Microsoft.CostManagement/query?$skiptoken={end}"
+                if end < len(rows)
+                else None
+            ),
+        )
+
+    def _get_periods(self, start: date, end: date):
+        if self.granularity == "MONTHLY":
+            month = start.replace(day=1)
+            while month <= end:
+                yield month
+                month = (month + timedelta(days=32)).replace(day=1)
+        else:
+            day = start
+            while day <= end:
+                yield day
+                day += timedelta(days=1)
+
+    def _rows(self, period: date):
+        if period not in self._periods:
+            rng = random.Random(f"{self.seed}:{period}")
+            raw_date = (
+                period.strftime("%Y-%m-%dT00:00:00")
+                if self.granularity == "MONTHLY"
+                else int(period.strftime("%Y%m%d"))
+            )
+            self._periods[period] = [
+                [round(rng.expovariate(0.1), 6), raw_date]
+                + [
+                    self._value(dimension, rng.randrange(self.cardinality))
+                    for dimension in self.dimensions
+                ]
+                + [self.currency]
+                for _ in range(self.rows_per_period)
+            ]
+        return self._periods[period]
+
+    def _value(self, dimension: str, i: int):
+        if dimension == "ResourceId":
+            return (
+                f"/subscriptions/{SUBSCRIPTION_ID}/resourcegroups/rg-{i % 10}"
+                f"/providers/microsoft.compute/virtualmachines/vm-{i}"
+            )
+        return f"{dimension.lower()}-{i}"
+
+
+def make_core(args, rows: int):
+    start, end = DateUtil.get_start_and_end(args.granularity, args.ago)
+    client = FakeCostManagementClient(
+        args.granularity,
+        args.dimensions,
+        rows_per_period=1,
+        cardinality=args.cardinality,
+        page_size=args.page_size,
+    )
+    periods = len(list(client._get_periods(start.date(), end.date())))
+    client.rows_per_period = max(1, rows // periods)
+    os.environ["AZURE_SUBSCRIPTION_ID"] = SUBSCRIPTION_ID
+    return Core(
+        False,
+        args.granularity,
+        args.dimensions,
+        cost_management_client=client,
+        subscription_client=object(),
+        scheduler=RequestScheduler(rate=float("inf"), burst=sys.maxsize),
+    )
+
+
+def get_stages(core: Core, ago: int):
+    """
+    Return (stage, func) pairs for the pipeline. Later stages use the
+    results of get_usage.
+    """
+    state = {}
+
+    def get_usage():
+        state["results"] = core.get_usage(ago)[1]
+
+    def pivot():
+        pivot = Pivot(core.granularity, core.dimensions)
+        pivot.add_table(state["results"], with_total=True)
+        pivot.to_rows(core._format_key)
+
+    def convert_tabulate():
+        core.convert_tabulate(None, state["results"])
+
+    def stream():
+        core.convert_tabulate(None, core.iter_usage(ago))
+
+    return [
+        ("get_usage", get_usage),
+        ("pivot", pivot),
+        ("convert_tabulate", convert_tabulate),
+        ("stream", stream),
+    ], state
+
+
+def measure(args, rows: int) -> dict:
+    core = make_core(args, rows)
+    stages, state = get_stages(core, args.ago)
+    # Warm up, so that generating the synthetic rows is not measured.
+    for _, func in stages:
+        func()
+    count = len(state["results"])
+
+    results = {}
+    for _ in range(args.repeat):
+        for stage, func in stages:
+            start = time.perf_counter()
+            func()
+            seconds = time.perf_counter() - start
+            best = results.setdefault(stage, {"rows": count, "seconds": seconds})
+            best["seconds"] = min(best["seconds"], seconds)
+
+    tracemalloc.start()
+    try:
+        for stage, func in stages:
+            # Resets the peak, blocks allocated before are not counted.
+            tracemalloc.clear_traces()
+            func()
+            results[stage]["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+def compare(baseline: dict, key: str, results: dict, tolerance: float) -> list:
+    """
+    Return a message for every stage that is slower or allocates more than
+    the baseline allows.
+    """
+    failures = []
+    for stage, result in results.items():
+        base = baseline.get(key, {}).get(stage)
+        if base is None:
+            continue
+        for metric in ("seconds", "peak_bytes"):
+            if result[metric] > base[metric] * (1 + tolerance):
+                failures.append(
+                    f"{key} {stage}: {metric} {result[metric]:.6g} > "
+                    f"baseline {base[metric]:.6g} (+{tolerance:.0%})"
+                )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument(
+        "--granularity", choices=["MONTHLY", "DAILY"], default="MONTHLY"
+    )
+    parser.add_argument(
+        "--dimensions", nargs="+", default=["ServiceName", "ResourceGroup"]
+    )
+    parser.add_argument(
+        "--cardinality", type=int, default=50, help="Values per dimension."
+    )
+    parser.add_argument("--ago", type=int, default=6)
+    parser.add_argument("--page-size", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.3,
+        help="Allowed regression over the baseline, as a fraction.",
+    )
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'stage':<17} {'seconds':>9} {'rows/s':>12} {'peak MiB':>9}")
+    measured = {}
+    for rows in args.rows:
+        key = f"{args.granularity}:{','.join(args.dimensions)}:{rows}"
+        measured[key] = measure(args, rows)
+        for stage, result in measured[key].items():
+            print(
+                f"{rows:>8} {stage:<17} {result['seconds']:>9.4f} "
+                f"{result['rows'] / result['seconds']:>12,.0f} "
+                f"{result['peak_bytes'] / 2**20:>9.1f}"
+            )
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(measured)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"saved baseline: {args.baseline}")
+
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = []
+        for key, results in measured.items():
+            failures += compare(baseline, key, results, args.tolerance)
+        if failures:
+            sys.exit("\n".join(["regressions:"] + failures))
+        print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
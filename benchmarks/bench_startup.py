@@ -0,0 +1,57 @@
+"""
+Measure the startup time of `azurecost --version` and fail when it is over
+budget or when the Azure SDK is imported on the way.
+
+    python benchmarks/bench_startup.py [--runs 20] [--budget 0.3]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ["azure.identity", "azure.mgmt", "azure.core", "tabulate"]
+
+VERSION_SCRIPT = """
+import sys
+from azurecost.commands import main
+sys.argv = ["azurecost", "--version"]
+try:
+    main()
+except SystemExit:
+    pass
+heavy = [m for m in sys.modules if m.startswith(tuple(%r))]
+if heavy:
+    sys.exit("imported during --version: " + ", ".join(sorted(heavy)))
+""" % (HEAVY_MODULES,)
+
+
+def measure(command: list, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument(
+        "--budget", type=float, default=0.3, help="Budget for the median in seconds."
+    )
+    args = parser.parse_args()
+
+    # Python itself is part of every run, report it for reference.
+    baseline = measure([sys.executable, "-c", "pass"], args.runs)
+    median = measure([sys.executable, "-c", VERSION_SCRIPT], args.runs)
+    print(f"python startup:      {baseline * 1000:.1f} ms")
+    print(f"azurecost --version: {median * 1000:.1f} ms (median of {args.runs})")
+    if median > args.budget:
+        sys.exit(f"over budget: {median:.3f}s > {args.budget:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,11 @@ run-test() {
   tox -e pytest
 }
 
+run-bench() {
+  python3 benchmarks/bench_startup.py
+  python3 benchmarks/bench_pipeline.py --compare
+}
+
 release() {
   # upload pypi
   tox -e release
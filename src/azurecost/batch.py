@@ -0,0 +1,173 @@
+import json
+import os
+
+from . import constants
+from .date_util import DateUtil
+from .logger import get_logger
+from .server import convert_json, make_core, parse_query, Query
+
+OUTPUT_FORMATS = ["table", "json"]
+QUERY_KEYS = {
+    "subscription",
+    "resource_group",
+    "scope",
+    "scopes",
+    "all_subscriptions",
+    "granularity",
+    "dimensions",
+    "ago",
+    "filter",
+    "tag",
+}
+
+
+def load_specs(path: str) -> list:
+    """
+    Read a list of query specs from a JSON or YAML file.
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("PyYAML is required to read YAML files.")
+        specs = yaml.safe_load(text)
+    else:
+        specs = json.loads(text)
+    if not isinstance(specs, list) or not all(isinstance(s, dict) for s in specs):
+        raise ValueError(f"{path}: expected a list of query specs.")
+    return specs
+
+
+def make_query(spec: dict, defaults: dict = None) -> Query:
+    """
+    Build a Query from a spec, keys are named like the options of the CLI.
+    Missing keys are taken from defaults (a dict of Query fields).
+    """
+    unknown = set(spec) - QUERY_KEYS - {"output", "format"}
+    if unknown:
+        raise ValueError(f"Unknown keys: {', '.join(sorted(unknown))}")
+    values = {"scope" if k == "scopes" else k: v for k, v in (defaults or {}).items()}
+    # Query fields hold (name, values) pairs, specs use the CLI syntax.
+    for field, key in [("filters", "filter"), ("tags", "tag")]:
+        pairs = values.pop(field, ())
+        if pairs:
+            values[key] = [f"{name}={','.join(v)}" for name, v in pairs]
+    values.update(
+        ("scope" if k == "scopes" else k, v) for k, v in spec.items() if k in QUERY_KEYS
+    )
+    params = {}
+    for name, value in values.items():
+        if value is None:
+            continue
+        value = value if isinstance(value, (list, tuple)) else [value]
+        params[name] = [
+            str(v).lower() if isinstance(v, bool) else str(v) for v in value
+        ]
+    return parse_query(params)
+
+
+class BatchRunner:
+    """
+    Runs many queries together. Queries that only differ by ``ago`` are
+    answered from one query over the widest window, and the rest run
+    concurrently with the shared session and scheduler. With
+    ``derive_total=False``, the ungrouped total query is sent once for all
+    queries over the same scopes and granularity.
+    """
+
+    def __init__(
+        self,
+        debug: bool = False,
+        max_workers: int = constants.DEFAULT_MAX_WORKERS,
+        core_factory=None,
+        **core_options,
+    ):
+        self.debug = debug
+        self.max_workers = max_workers
+        self.derive_total = core_options.pop("derive_total", True)
+        self.core_options = dict(core_options, max_workers=max_workers)
+        self.core_factory = core_factory or self._create_core
+        self.logger = get_logger(debug)
+
+    def plan(self, queries: list):
+        """
+        Return ({query: widest query}, {query: widest total query or None}).
+        """
+        widest = {}
+        for query in queries:
+            key = query._replace(ago=0)
+            if key not in widest or widest[key].ago < query.ago:
+                widest[key] = query
+        totals = {}
+        if not self.derive_total:
+            for query in widest.values():
+                key = query._replace(dimensions=(), ago=0)
+                if key not in totals or totals[key].ago < query.ago:
+                    totals[key] = query._replace(dimensions=())
+        return (
+            {q: widest[q._replace(ago=0)] for q in queries},
+            {q: totals.get(q._replace(dimensions=(), ago=0)) for q in queries},
+        )
+
+    def run(self, queries: list) -> list:
+        """
+        Return (core, total_results, results) for each query, in order.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        grouped, totals = self.plan(queries)
+        fetches = set(grouped.values()) | {q for q in totals.values() if q}
+        self.logger.debug("%d queries, %d sent to the API", len(queries), len(fetches))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {q: executor.submit(self._fetch, q) for q in fetches}
+            fetched = {q: future.result() for q, future in futures.items()}
+
+        outputs = []
+        for query in queries:
+            core, total_results, results = fetched[grouped[query]]
+            start = core.get_window(query.ago)[0]
+            date_key = DateUtil.get_date_column(query.granularity)
+            if totals[query] is not None:
+                total_results = fetched[totals[query]][2]
+                if totals[query].ago != query.ago:
+                    total_results = total_results.since(date_key, start.date())
+            elif grouped[query].ago != query.ago:
+                total_results = total_results.since(date_key, start.date())
+            if grouped[query].ago != query.ago:
+                results = results.since(date_key, start.date())
+            outputs.append((core, total_results, results))
+        return outputs
+
+    def write(self, specs: list, defaults: dict = None, echo=print):
+        """
+        Run the specs and write each output to its "output" path, or with
+        echo when it has none.
+        """
+        for spec in specs:
+            if spec.get("format", "table") not in OUTPUT_FORMATS:
+                raise ValueError(f"Invalid format: {spec['format']}")
+        queries = [make_query(spec, defaults) for spec in specs]
+        for spec, (core, total_results, results) in zip(specs, self.run(queries)):
+            if spec.get("format", "table") == "json":
+                output = json.dumps(convert_json(core, total_results, results))
+            else:
+                output = core.convert_tabulate(total_results, results)
+            path = spec.get("output")
+            if path:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(output + "\n")
+            else:
+                echo(output)
+
+    def _fetch(self, query: Query):
+        core = self.core_factory(query)
+        total_results, results = core.get_usage(query.ago)
+        return core, total_results, results
+
+    def _create_core(self, query: Query):
+        # Totals are derived, or sent once per scope as a query without
+        # dimensions.
+        return make_core(query, self.debug, derive_total=True, **self.core_options)
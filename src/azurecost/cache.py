@@ -0,0 +1,142 @@
+from datetime import date, datetime, timedelta
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from . import constants
+from .date_util import DateUtil
+
+
+class QueryCache:
+    """
+    On-disk cache of query.usage results.
+
+    Entries for settled windows never expire, entries that still
+    include the open period expire after ``ttl`` seconds and are deleted
+    once they have expired. Use split to cache the settled periods of a
+    window apart from its open tail.
+    """
+
+    def __init__(self, cache_dir: str = None, ttl: int = constants.DEFAULT_CACHE_TTL):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.ttl = ttl
+
+    def make_key(self, scope: str, payload: dict) -> str:
+        start, end = get_time_period(payload)
+        canonical = json.dumps(
+            {
+                "scope": scope.lower(),
+                "payload": {k: v for k, v in payload.items() if k != "time_period"},
+                "from": _to_date(start).isoformat(),
+                "to": _to_date(end).isoformat(),
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        for closed in [True, False]:
+            path = self._path(key, closed)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if _is_expired(entry):
+                _unlink(path)
+                return None
+            return entry
+        return None
+
+    def set(self, key: str, columns: list, rows: list, closed: bool = False):
+        entry = {
+            "expires_at": None if closed else time.time() + self.ttl,
+            "columns": columns,
+            "rows": rows,
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if not closed:
+            self._delete_expired()
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, separators=(",", ":"))
+            os.replace(tmp_path, self._path(key, closed))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def split(self, payload: dict) -> list:
+        """
+        Return the (start, end, closed) parts of the window of payload: the
+        settled days or whole months, and the periods that are still open.
+        """
+        start, end = get_time_period(payload)
+        settled_until = DateUtil.get_settled_until(payload["dataset"]["granularity"])
+        if _to_date(end) <= settled_until:
+            return [(start, end, True)]
+        if settled_until < _to_date(start):
+            return [(start, end, False)]
+        open_from = settled_until + timedelta(days=1)
+        return [
+            (start, _at(settled_until, 23, 59, 59, start.tzinfo), True),
+            (_at(open_from, 0, 0, 0, start.tzinfo), end, False),
+        ]
+
+    def _path(self, key: str, closed: bool) -> str:
+        # Open entries are kept apart, so expired ones are found without
+        # reading the settled ones.
+        return os.path.join(self.cache_dir, key + (".json" if closed else ".open.json"))
+
+    def _delete_expired(self):
+        # The keys of open periods change every day, so their entries are
+        # not always asked for again once they expire.
+        for path in glob.glob(os.path.join(self.cache_dir, "*.open.json")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if _is_expired(entry):
+                _unlink(path)
+
+
+def default_cache_dir() -> str:
+    if os.environ.get("AZURECOST_CACHE_DIR"):
+        return os.environ["AZURECOST_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "azurecost")
+
+
+def get_time_period(payload: dict):
+    time_period = payload["time_period"]
+    return time_period.from_property, time_period.to
+
+
+def _is_expired(entry: dict) -> bool:
+    expires_at = entry.get("expires_at")
+    return expires_at is not None and expires_at < time.time()
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _at(day: date, hour: int, minute: int, second: int, tz) -> datetime:
+    return datetime(day.year, day.month, day.day, hour, minute, second, tzinfo=tz)
+
+
+def _to_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    return value
@@ -1,6 +1,16 @@
 import click
+import os
 import sys
-from .core import Core
+from .core import Core, make_scope_path
+from .cache import QueryCache, default_cache_dir
+from .store import CostStore
+from .scheduler import RequestScheduler
+from .session import Session, CREDENTIAL_TYPES
+from .profiler import Profiler
+from .rollup import RollupIndex
+from .output import OUTPUT_FORMATS, LAYOUTS
+from .filters import parse_filters, parse_tags, TAG_PREFIX
+from .date_util import DateUtil
 from . import constants
 
 
@@ -26,6 +36,39 @@ class Mash(object):
     type=str,
     help="Filter costs by a specific resource group. Can be omitted if AZURE_RESOURCE_GROUP environment variable is set.",
 )
+@click.option(
+    "--scope",
+    "scopes",
+    type=str,
+    multiple=True,
+    help="Query multiple scopes concurrently, given as SUBSCRIPTION[/RESOURCE_GROUP] where SUBSCRIPTION is a display name or ID, or as a scope path such as /providers/Microsoft.Management/managementGroups/ID. Can be specified multiple times.",
+)
+@click.option(
+    "--management-group",
+    type=str,
+    help="Query every subscription below this management group ID in one query.",
+)
+@click.option(
+    "--billing-account",
+    type=str,
+    help="Query every subscription of this billing account ID in one query.",
+)
+@click.option(
+    "--billing-profile",
+    type=str,
+    help="Query every subscription of this billing profile ID of --billing-account in one query.",
+)
+@click.option(
+    "--all-subscriptions/--no-all-subscriptions",
+    default=False,
+    help="Query all visible subscriptions concurrently.",
+)
+@click.option(
+    "--max-workers",
+    type=int,
+    default=constants.DEFAULT_MAX_WORKERS,
+    help="Maximum number of concurrent queries when multiple scopes are queried. Default: 8.",
+)
 @click.option(
     "--dimensions",
     "-d",
@@ -34,6 +77,26 @@ class Mash(object):
     default=constants.DEFAULT_DIMENSIONS,
     help="Dimensions to aggregate costs by (e.g., ResourceGroup, ServiceName). Can be specified multiple times. Default: ServiceName.",
 )
+@click.option(
+    "--group-by-tag",
+    "tag_key",
+    type=str,
+    help="Also aggregate costs by the values of this tag key.",
+)
+@click.option(
+    "--filter",
+    "filter_values",
+    type=str,
+    multiple=True,
+    help="Only include costs whose dimension has one of the values, given as DIMENSION=VALUE[,VALUE...]. The filter is applied by the API. Can be specified multiple times.",
+)
+@click.option(
+    "--tag",
+    "tag_values",
+    type=str,
+    multiple=True,
+    help="Only include costs of resources tagged with one of the values, given as KEY=VALUE[,VALUE...]. Can be specified multiple times.",
+)
 @click.option(
     "--granularity",
     "-g",
@@ -44,10 +107,127 @@ class Mash(object):
 @click.option(
     "--ago",
     "-a",
-    type=int,
+    type=click.IntRange(min=0),
     default=constants.DEFAULT_AGO,
     help="Number of periods (months for MONTHLY, days for DAILY) to look back from today. For example, use 3 to get the past 3 months. Default: 1.",
 )
+@click.option(
+    "--from",
+    "start_date",
+    type=click.DateTime(["%Y-%m-%d"]),
+    help="First day of the window, as YYYY-MM-DD. Overrides --ago. MONTHLY windows start on the first day of its month.",
+)
+@click.option(
+    "--to",
+    "end_date",
+    type=click.DateTime(["%Y-%m-%d"]),
+    help="Last day of the window, as YYYY-MM-DD. Default: today. MONTHLY windows end on the last day of its month, or today.",
+)
+@click.option(
+    "--billing-timezone",
+    "time_zone",
+    type=str,
+    default="UTC",
+    help="Time zone of the calendar days and months of the window, like Asia/Tokyo or +09:00. Default: UTC.",
+)
+@click.option(
+    "--top",
+    type=click.IntRange(min=0),
+    help="Show only the N keys with the highest cost in the latest period, and sum the rest into an others row.",
+)
+@click.option(
+    "--min-cost",
+    type=float,
+    help="Show only the keys whose cost in the latest period is at least this amount, and sum the rest into an others row.",
+)
+@click.option(
+    "--output",
+    "output_format",
+    type=click.Choice(OUTPUT_FORMATS),
+    default="table",
+    help="Output format. csv and jsonl are written row by row, columnar is a compact binary of the usage rows for analytics tools. Default: table.",
+)
+@click.option(
+    "--layout",
+    type=click.Choice(LAYOUTS),
+    default="pivot",
+    help="Rows written by csv and jsonl: pivot for one row per key with a column per period, long for one row per key and period as returned by the API. Default: pivot.",
+)
+@click.option(
+    "--output-file",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the output to this file instead of stdout.",
+)
+@click.option(
+    "--derive-total/--no-derive-total",
+    default=True,
+    help="Compute the total row from the grouped result, which has every page, instead of sending a second query. Use --no-derive-total to ask the API for the total. Default: enabled.",
+)
+@click.option(
+    "--chunk-by-month/--no-chunk-by-month",
+    default=True,
+    help="Split DAILY queries that span several months into one query per month and run them concurrently. Default: enabled.",
+)
+@click.option(
+    "--rate-limit",
+    type=float,
+    default=constants.DEFAULT_RATE_LIMIT,
+    help="Maximum number of requests per minute sent to each scope. Default: 30.",
+)
+@click.option(
+    "--max-retries",
+    type=int,
+    default=constants.DEFAULT_MAX_RETRIES,
+    help="Maximum number of retries for throttled (429) or failed requests. Default: 5.",
+)
+@click.option(
+    "--credential",
+    type=click.Choice(CREDENTIAL_TYPES),
+    default="default",
+    help="Credential to authenticate with. Choosing a specific one skips the probing of DefaultAzureCredential. Default: default.",
+)
+@click.option(
+    "--persistent-token-cache/--no-persistent-token-cache",
+    default=False,
+    help="Persist tokens in the encrypted token cache shared between processes, for credentials that support it.",
+)
+@click.option(
+    "--endpoint",
+    help="Azure Resource Manager URL to send requests to instead of https://management.azure.com, e.g. the URL of azurecost emulate.",
+)
+@click.option(
+    "--record",
+    "record_dir",
+    type=click.Path(file_okay=False),
+    help="Write every query and subscription list response to this directory.",
+)
+@click.option(
+    "--replay",
+    "replay_dir",
+    type=click.Path(exists=True, file_okay=False),
+    help="Answer from the responses recorded with --record in this directory, without sending requests.",
+)
+@click.option(
+    "--cache/--no-cache",
+    default=False,
+    help="Cache query results and subscription names on disk. Settled periods are cached without expiry. Directory can be set with AZURECOST_CACHE_DIR.",
+)
+@click.option(
+    "--cache-ttl",
+    type=int,
+    default=constants.DEFAULT_CACHE_TTL,
+    help="Seconds to keep cached results that include the current, still changing period. Default: 3600.",
+)
+@click.option(
+    "--sync/--no-sync",
+    default=False,
+    help="Keep a local cost store up to date and read from it. Only periods that are new or still settling are fetched.",
+)
+@click.option(
+    "--profile/--no-profile",
+    default=False,
+    help="Print the time spent in each stage, with bytes and rows received and retry waits, to stderr.",
+)
 @click.option(
     "--version/--no-version",
     "-v",
@@ -56,14 +236,384 @@ class Mash(object):
 )
 @click.pass_context
 def cli(
-    ctx, debug, subscription, resource_group, dimensions, granularity, ago, version
+    ctx,
+    debug,
+    subscription,
+    resource_group,
+    scopes,
+    management_group,
+    billing_account,
+    billing_profile,
+    all_subscriptions,
+    max_workers,
+    dimensions,
+    tag_key,
+    filter_values,
+    tag_values,
+    granularity,
+    ago,
+    start_date,
+    end_date,
+    time_zone,
+    top,
+    min_cost,
+    output_format,
+    layout,
+    output_file,
+    derive_total,
+    chunk_by_month,
+    rate_limit,
+    max_retries,
+    credential,
+    persistent_token_cache,
+    endpoint,
+    record_dir,
+    replay_dir,
+    cache,
+    cache_ttl,
+    sync,
+    profile,
+    version,
 ):
     if version:
         print(constants.VERSION)
         sys.exit()
-    core = Core(debug, granularity, dimensions, subscription, resource_group)
-    total_results, results = core.get_usage(ago)
-    click.echo(core.convert_tabulate(total_results, results))
+    try:
+        filters = parse_filters(filter_values)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--filter")
+    try:
+        tags = parse_tags(tag_values)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--tag")
+    if tag_key:
+        dimensions = tuple(dimensions) + (TAG_PREFIX + tag_key,)
+    try:
+        scope_path = make_scope_path(management_group, billing_account, billing_profile)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    # Subcommands query the scope path as one more scope.
+    if scope_path and ctx.invoked_subcommand is None and (scopes or all_subscriptions):
+        raise click.UsageError(
+            "Management group and billing scopes can not be combined with --scope or --all-subscriptions."
+        )
+    try:
+        tz = DateUtil.get_timezone(time_zone)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--billing-timezone")
+    start_date = start_date.date() if start_date else None
+    end_date = end_date.date() if end_date else None
+    try:
+        DateUtil.get_start_and_end(granularity, ago, tz, start_date, end_date)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--from")
+    profiler = Profiler() if profile else None
+    options = dict(
+        cache=QueryCache(ttl=cache_ttl) if cache else None,
+        store=CostStore() if sync else None,
+        max_workers=max_workers,
+        derive_total=derive_total,
+        chunk_by_month=chunk_by_month,
+        time_zone=time_zone,
+        start_date=start_date,
+        end_date=end_date,
+        scheduler=RequestScheduler(
+            rate=rate_limit, max_retries=max_retries, profiler=profiler
+        ),
+        session=Session(
+            credential_type=credential,
+            persistent_token_cache=persistent_token_cache,
+            pool_size=max_workers,
+            debug=debug,
+            subscription_cache_path=(
+                os.path.join(default_cache_dir(), "subscriptions.json")
+                if cache
+                else None
+            ),
+            profiler=profiler,
+            rollup_index=RollupIndex(
+                os.path.join(default_cache_dir(), "rollup") if cache else None,
+                ttl=cache_ttl,
+            ),
+            endpoint=endpoint,
+            record_dir=record_dir,
+            replay_dir=replay_dir,
+        ),
+        profiler=profiler,
+    )
+    if ctx.invoked_subcommand is not None:
+        # The subcommands share the clients, and export the query options.
+        ctx.obj = dict(
+            debug=debug,
+            core_options=options,
+            query=dict(
+                subscription=subscription,
+                resource_group=resource_group,
+                # Subcommands get a management group or billing scope as a path.
+                scopes=tuple(scopes) + ((scope_path,) if scope_path else ()),
+                all_subscriptions=all_subscriptions,
+                granularity=granularity,
+                dimensions=tuple(dimensions),
+                ago=ago,
+                filters=tuple((name, tuple(v)) for name, v in filters.items()),
+                tags=tuple((key, tuple(v)) for key, v in tags.items()),
+            ),
+        )
+        return
+
+    core = Core(
+        debug,
+        granularity,
+        dimensions,
+        subscription,
+        resource_group,
+        scopes=list(scopes),
+        all_subscriptions=all_subscriptions,
+        filters=filters,
+        tags=tags,
+        management_group=management_group,
+        billing_account=billing_account,
+        billing_profile=billing_profile,
+        **options,
+    )
+    if output_format == "table":
+        if derive_total:
+            # Rows are pivoted while the pages are read.
+            output = core.convert_tabulate(
+                None, core.iter_usage(ago), top=top, min_cost=min_cost
+            )
+        else:
+            total_results, results = core.get_usage(ago)
+            output = core.convert_tabulate(
+                total_results, results, top=top, min_cost=min_cost
+            )
+        if output_file:
+            with open(output_file, "w", encoding="utf-8") as f:
+                f.write(output + "\n")
+        else:
+            click.echo(output)
+    else:
+        _write_output(core, ago, output_format, layout, output_file, top, min_cost)
+    core.logger.debug("scheduler stats = %s", core.scheduler.stats)
+    if profiler is not None:
+        click.echo(profiler.report(), err=True)
+
+
+def _write_output(core, ago, output_format, layout, output_file, top, min_cost):
+    from .output import write_long, write_pivot
+
+    binary = output_format == "columnar"
+    # "-" is stdout, which is not closed on exit.
+    with click.open_file(
+        output_file or "-", "wb" if binary else "w", None if binary else "utf-8"
+    ) as f:
+        if binary:
+            # Always the usage rows, there is no pivoted columnar layout.
+            core.get_usage(ago)[1].write_columnar(f)
+        elif layout == "long":
+            write_long(core, core.iter_usage(ago), output_format, f)
+        elif core.derive_total:
+            write_pivot(
+                core, None, core.iter_usage(ago), output_format, f, top, min_cost
+            )
+        else:
+            total_results, results = core.get_usage(ago)
+            write_pivot(core, total_results, results, output_format, f, top, min_cost)
+
+
+@cli.command()
+@click.option("--host", default="127.0.0.1", help="Address to listen on.")
+@click.option("--port", type=int, default=8000, help="Port to listen on.")
+@click.option(
+    "--max-results",
+    type=int,
+    default=constants.DEFAULT_SERVER_MAX_RESULTS,
+    help="Number of query results kept in memory. Default: 128.",
+)
+@click.option(
+    "--result-ttl",
+    type=int,
+    default=constants.DEFAULT_SERVER_TTL,
+    help="Seconds to keep query results in memory. Default: 300.",
+)
+@click.pass_obj
+def serve(obj, host, port, max_results, result_ttl):
+    """
+    Serve cost queries over a local HTTP/JSON API with warm clients.
+    """
+    from .server import CostServer
+
+    cost_server = CostServer(
+        obj["debug"],
+        max_results=max_results,
+        ttl=result_ttl,
+        **obj["core_options"],
+    )
+    server = cost_server.make_server(host, port)
+    click.echo(f"Serving on http://{host}:{server.server_address[1]}", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@cli.command()
+@click.option("--host", default="127.0.0.1", help="Address to listen on.")
+@click.option("--port", type=int, default=9464, help="Port to listen on.")
+@click.option(
+    "--interval",
+    type=int,
+    default=constants.DEFAULT_EXPORT_INTERVAL,
+    help="Seconds between refreshes of the targets. Default: 3600.",
+)
+@click.option(
+    "--target",
+    "targets",
+    multiple=True,
+    help="Query to export, given as URL query parameters like the /cost API of serve, e.g. name=daily&dimensions=ServiceName&granularity=DAILY&ago=7. Can be specified multiple times. Default: the query given by the options before export.",
+)
+@click.pass_obj
+def export(obj, host, port, interval, targets):
+    """
+    Export costs as Prometheus gauges, refreshed in the background.
+    """
+    from .exporter import CostExporter, parse_target
+    from .server import Query
+
+    try:
+        targets = [parse_target(target) for target in targets] or [
+            ("default", Query(**obj["query"]))
+        ]
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--target")
+    exporter = CostExporter(
+        targets, obj["debug"], interval=interval, **obj["core_options"]
+    )
+    exporter.start()
+    server = exporter.make_server(host, port)
+    click.echo(
+        f"Serving metrics on http://{host}:{server.server_address[1]}/metrics",
+        err=True,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@cli.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.pass_obj
+def batch(obj, path):
+    """
+    Run the queries listed in a JSON or YAML file and write their outputs.
+
+    Each query has the keys subscription, resource_group, scopes,
+    all_subscriptions, dimensions, granularity, ago, filter and tag,
+    defaulting to the options before batch, plus output (a file path, default: stdout) and
+    format (table or json).
+    """
+    from .batch import BatchRunner, load_specs
+
+    runner = BatchRunner(obj["debug"], **obj["core_options"])
+    try:
+        specs = load_specs(path)
+        runner.write(specs, obj["query"], echo=click.echo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+
+@cli.command()
+@click.option("--host", default="127.0.0.1", help="Address to listen on.")
+@click.option("--port", type=int, default=8100, help="Port to listen on.")
+@click.option(
+    "--subscriptions",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of subscriptions to list. Default: 1.",
+)
+@click.option(
+    "--rows-per-period",
+    type=click.IntRange(min=1),
+    default=100,
+    help="Rows generated for each scope and period. Default: 100.",
+)
+@click.option(
+    "--cardinality",
+    type=click.IntRange(min=1),
+    default=50,
+    help="Number of distinct values of each dimension. Default: 50.",
+)
+@click.option(
+    "--page-size",
+    type=click.IntRange(min=1),
+    default=5000,
+    help="Rows per page, the rest is returned through nextLink. Default: 5000.",
+)
+@click.option(
+    "--latency",
+    type=float,
+    default=0.0,
+    help="Seconds to wait before answering each request. Default: 0.",
+)
+@click.option(
+    "--throttle-rate",
+    type=click.FloatRange(0, 1),
+    default=0.0,
+    help="Fraction of the requests answered with 429 Too Many Requests. Default: 0.",
+)
+@click.option(
+    "--retry-after",
+    type=float,
+    default=1.0,
+    help="Seconds sent in the Retry-After headers of throttled requests. Default: 1.",
+)
+@click.option("--seed", type=int, default=0, help="Seed of the generated rows.")
+@click.pass_obj
+def emulate(
+    obj,
+    host,
+    port,
+    subscriptions,
+    rows_per_period,
+    cardinality,
+    page_size,
+    latency,
+    throttle_rate,
+    retry_after,
+    seed,
+):
+    """
+    Serve a local stand-in for the Cost Management query API with
+    generated rows, for offline load tests. Query it with
+    --endpoint http://HOST:PORT --credential none.
+    """
+    from .emulator import CostEmulator
+
+    emulator = CostEmulator(
+        subscriptions=subscriptions,
+        rows_per_period=rows_per_period,
+        cardinality=cardinality,
+        page_size=page_size,
+        latency=latency,
+        throttle_rate=throttle_rate,
+        retry_after=retry_after,
+        seed=seed,
+        debug=obj["debug"],
+    )
+    server = emulator.make_server(host, port)
+    click.echo(f"Emulating on http://{host}:{server.server_address[1]}", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        click.echo(f"emulator stats = {emulator.stats}", err=True)
 
 
 def main():
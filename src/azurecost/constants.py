@@ -1,10 +1,32 @@
-from importlib.metadata import version
+def __getattr__(name):
+    # Resolved on first access, importlib.metadata is slow to import.
+    if name == "VERSION":
+        from importlib.metadata import version
+
+        globals()["VERSION"] = version("azurecost")
+        return globals()["VERSION"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-VERSION = version("azurecost")
 
 DEFAULT_DIMENSIONS = ["ServiceName"]
 DEFAULT_GRANULARITY = "MONTHLY"
 DEFAULT_AGO = 1
+DEFAULT_CACHE_TTL = 3600
+DEFAULT_MAX_WORKERS = 8
+# Subscription display names rarely change, refresh the index once a day.
+DEFAULT_SUBSCRIPTION_TTL = 86400
+# Requests per minute and burst size allowed for each scope.
+DEFAULT_RATE_LIMIT = 30
+DEFAULT_RATE_BURST = 10
+DEFAULT_MAX_RETRIES = 5
+# Query results kept by `azurecost serve`, and for how many seconds.
+DEFAULT_SERVER_MAX_RESULTS = 128
+DEFAULT_SERVER_TTL = 300
+# Seconds between refreshes of `azurecost export`.
+DEFAULT_EXPORT_INTERVAL = 3600
+
+# Usage data can take up to 72 hours to be finalized.
+SETTLE_DAYS = 3
 
 AVAILABLE_GRANULARITY = [
     "MONTHLY",
@@ -1,16 +1,64 @@
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import SubscriptionClient
-from azure.mgmt.costmanagement import CostManagementClient
-from azure.mgmt.costmanagement.models import QueryTimePeriod
-from collections import defaultdict
-from datetime import datetime
-from tabulate import tabulate
+from collections import namedtuple
+from datetime import date, datetime, time
 import os
-import uuid
+import re
+from urllib.parse import parse_qs, urlparse
 
-from .logger import get_logger
+from .logger import get_logger, Summary
 from . import constants
 from .date_util import DateUtil
+from .scheduler import RequestScheduler
+from .result import CostTable
+from .pivot import Pivot
+from .session import Session
+from .profiler import NULL_PROFILER
+from .filters import make_filter, make_grouping, rename_tag_columns, TAG_PREFIX
+from .subscriptions import SubscriptionIndex
+
+SUBSCRIPTION_ID_PATTERN = re.compile(
+    r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.IGNORECASE
+)
+
+# The Azure SDK and tabulate are imported where they are first used, so that
+# importing this module (and running `azurecost --version`) stays fast.
+
+
+def make_time_period(start: datetime, end: datetime):
+    from azure.mgmt.costmanagement.models import QueryTimePeriod
+
+    return QueryTimePeriod(from_property=start, to=end)
+
+
+SCOPE_PATH_PATTERN = re.compile(
+    r"^/subscriptions/(?P<subscription_id>[^/]+)(/resourceGroups/(?P<resource_group>[^/]+))?$",
+    re.IGNORECASE,
+)
+
+Scope = namedtuple("Scope", ["name", "path", "subscription_id", "resource_group"])
+
+
+def make_scope_path(
+    management_group: str = None,
+    billing_account: str = None,
+    billing_profile: str = None,
+):
+    """
+    Return the path of a management group, billing account or billing
+    profile scope, or None when none is given. These scopes cover every
+    subscription below them in one query.
+    """
+    if billing_profile and not billing_account:
+        raise ValueError("A billing profile needs its billing account.")
+    if management_group and billing_account:
+        raise ValueError("Give a management group or a billing account, not both.")
+    if management_group:
+        return f"/providers/Microsoft.Management/managementGroups/{management_group}"
+    if not billing_account:
+        return None
+    path = f"/providers/Microsoft.Billing/billingAccounts/{billing_account}"
+    if billing_profile:
+        path += f"/billingProfiles/{billing_profile}"
+    return path
 
 
 class Core:
@@ -24,38 +72,164 @@ class Core:
         credential=None,
         cost_management_client=None,
         subscription_client=None,
+        cache=None,
+        store=None,
+        scopes: list = None,
+        all_subscriptions: bool = False,
+        max_workers: int = constants.DEFAULT_MAX_WORKERS,
+        derive_total: bool = True,
+        scheduler=None,
+        chunk_by_month: bool = True,
+        session=None,
+        profiler=None,
+        filters: dict = None,
+        tags: dict = None,
+        management_group: str = None,
+        billing_account: str = None,
+        billing_profile: str = None,
+        time_zone: str = None,
+        start_date: date = None,
+        end_date: date = None,
     ):
-        self.credential = credential or DefaultAzureCredential()
-        self.cost_management_client = cost_management_client or CostManagementClient(
-            self.credential,
-            # ClientType header with unique UUID is required to prevent "429 Too Many Requests" errors.
-            # Azure Cost Management API tracks clients by this header. Without a unique identifier,
-            # multiple requests from the same client instance are treated as a single client,
-            # causing rate limiting to be applied more aggressively and leading to 429 errors.
-            # By using a unique UUID per client instance, each instance is tracked separately,
-            # allowing rate limits to be distributed across instances rather than concentrated on one.
-            headers={"ClientType": str(uuid.uuid4())},
-            logging_enable=True,  # Enable request/response logging for debugging
+        if len([d for d in dimensions if d.startswith(TAG_PREFIX)]) > 1:
+            raise ValueError("Costs can be grouped by only one tag.")
+        self.profiler = profiler or NULL_PROFILER
+        if session is None:
+            session = (
+                Session(credential=credential) if credential else Session.default()
+            )
+        self.session = session
+        self.cost_management_client = (
+            cost_management_client or session.get_cost_management_client()
+        )
+        # An injected client gets its own index, others share the session's.
+        self.subscription_index = (
+            SubscriptionIndex(lambda: subscription_client)
+            if subscription_client
+            else session.subscription_index
         )
-        self._subscription_client = subscription_client
         self.logger = get_logger(debug)
         self.granularity = granularity
         self.dimensions = dimensions
-        self.subscription_id = self._get_subscription_id(subscription_name)
-        self.resource_group = (
-            resource_group if resource_group else os.environ.get("AZURE_RESOURCE_GROUP")
+        # Sent with the query, so only the matching rows are returned.
+        self.filter = make_filter(filters, tags)
+        self.max_workers = max_workers
+        self.derive_total = derive_total
+        self.scheduler = scheduler or RequestScheduler(profiler=self.profiler)
+        self.chunk_by_month = chunk_by_month
+        # Windows are calendar days and months of the billing time zone.
+        self.tz = DateUtil.get_timezone(time_zone)
+        self.start_date = start_date
+        self.end_date = end_date
+        self.scope_path = make_scope_path(
+            management_group, billing_account, billing_profile
         )
+        if self.scope_path and (scopes or all_subscriptions):
+            raise ValueError(
+                "Management group and billing scopes can not be combined with scopes."
+            )
+        if self.scope_path:
+            # One query covers every subscription in the scope.
+            self.subscription_id = None
+            self.resource_group = None
+            self.scopes = None
+        elif scopes or all_subscriptions:
+            self.subscription_id = None
+            self.resource_group = None
+            with self.profiler.span("subscriptions"):
+                self.scopes = self._get_scopes(scopes, all_subscriptions)
+            self._scopes_by_name = {scope.name: scope for scope in self.scopes}
+        else:
+            with self.profiler.span("subscriptions"):
+                self.subscription_id = self._get_subscription_id(subscription_name)
+            self.resource_group = (
+                resource_group
+                if resource_group
+                else os.environ.get("AZURE_RESOURCE_GROUP")
+            )
+            self.scopes = None
+        self.cache = cache
+        self.store = store
+
+    @property
+    def credential(self):
+        return self.session.credential
 
     def get_usage(
         self,
         ago: int = constants.DEFAULT_AGO,
     ):
-        start, end = DateUtil.get_start_and_end(self.granularity, ago)
-        time_period = QueryTimePeriod(from_property=start, to=end)
+        if self.scopes is None:
+            return self._get_usage(self._get_scope(), ago)
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        # Query every scope concurrently and tag the rows with the scope name.
+        total_tables, tables = [], []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self._get_usage, scope.path, ago)
+                for scope in self.scopes
+            ]
+            for scope, future in zip(self.scopes, futures):
+                scope_total_results, scope_results = future.result()
+                scope_total_results.add_column("Scope", scope.name)
+                scope_results.add_column("Scope", scope.name)
+                total_tables.append(scope_total_results)
+                tables.append(scope_results)
+        if not tables:
+            return CostTable([]), CostTable([])
+        return CostTable.concat(total_tables), CostTable.concat(tables)
+
+    def iter_usage(
+        self,
+        ago: int = constants.DEFAULT_AGO,
+    ):
+        """
+        Yield the rows of the grouped query while following continuation
+        pages, without keeping them. Pass the iterator to convert_tabulate
+        with total_results=None to compute the total on the fly.
+        """
+        if self.scopes is not None:
+            yield from self.get_usage(ago)[1]
+            return
 
+        scope = self._get_scope()
+        _, grouped_payload = self._get_payloads(scope, ago)
+        rollup_index = self.session.rollup_index
+        if rollup_index is not None:
+            # Kept on disk for later queries, or computed from a stored result.
+            results = (
+                self._get_results(scope, grouped_payload)
+                if rollup_index.index_dir
+                else self._find_rollup(scope, grouped_payload)
+            )
+            if results is not None:
+                yield from results
+                return
+        columns, rows = self._query(scope, grouped_payload)
+        for row in rows:
+            yield dict(zip(columns, row))
+
+    def _get_scope(self):
+        if self.scope_path:
+            return self.scope_path
         scope = "/subscriptions/" + self.subscription_id
         if self.resource_group:
             scope += "/resourceGroups/" + self.resource_group
+        return scope
+
+    def get_window(self, ago: int = constants.DEFAULT_AGO):
+        """
+        Return the (start, end) of the query for ago, or of --from and --to.
+        """
+        return DateUtil.get_start_and_end(
+            self.granularity, ago, self.tz, self.start_date, self.end_date
+        )
+
+    def _get_payloads(self, scope: str, ago: int):
+        start, end = self.get_window(ago)
+        time_period = make_time_period(start, end)
 
         payload = {
             "type": "ActualCost",
@@ -68,87 +242,364 @@ class Core:
                 },
             },
         }
-        self.logger.debug(f"{start} - {end}")
+        if self.filter is not None:
+            payload["dataset"]["filter"] = self.filter
+        self.logger.debug("%s - %s", start, end)
+        self.logger.debug("time_period = %s", time_period)
+        self.logger.debug("scope = %s", scope)
 
-        # total_cost
-        self.logger.debug(f"time_period = {time_period}")
-        self.logger.debug(f"scope = {scope}")
-        self.logger.debug(f"payload = {payload}")
-        usage = self.cost_management_client.query.usage(scope, payload)
-        columns = list(map(lambda col: col.name, usage.columns))
-        total_results = [dict(zip(columns, row)) for row in usage.rows]
-        self.logger.debug(f"total_results = {total_results}")
+        if not self.dimensions:
+            # Without dimensions the grouped query is the total query.
+            return payload, payload
+        grouped_payload = dict(
+            payload,
+            dataset=dict(
+                payload["dataset"],
+                grouping=make_grouping(self.dimensions),
+            ),
+        )
+        return payload, grouped_payload
+
+    def _get_usage(self, scope: str, ago: int):
+        payload, grouped_payload = self._get_payloads(scope, ago)
 
         # cost by dimensions
-        payload["dataset"]["grouping"] = [
-            {"type": "Dimension", "name": d} for d in self.dimensions
-        ]
-        self.logger.debug(f"payload = {payload}")
-        usage = self.cost_management_client.query.usage(scope, payload)
-        columns = list(map(lambda col: col.name, usage.columns))
-        results = [dict(zip(columns, row)) for row in usage.rows]
-        self.logger.debug(f"results = {results}")
+        self.logger.debug("payload = %s", Summary(grouped_payload))
+        results = self._get_results(scope, grouped_payload)
+        self.logger.debug("results = %s", Summary(results))
+
+        # total_cost
+        if self.derive_total:
+            total_results = self._sum_by_date(results)
+        else:
+            self.logger.debug("payload = %s", Summary(payload))
+            # The total is asked from the API, not computed from the results.
+            total_results = self._get_results(scope, payload, rollup=False)
+        self.logger.debug("total_results = %s", Summary(total_results))
         return total_results, results
 
-    def convert_tabulate(self, total_results: list, results: list):
-        dd = defaultdict(lambda: {})
-        view_format_date = "%Y-%m" if self.granularity == "MONTHLY" else "%Y-%m-%d"
-        format_date = "%Y-%m-%dT%H:%M:%S" if self.granularity == "MONTHLY" else "%Y%m%d"
-        date_key = "BillingMonth" if self.granularity == "MONTHLY" else "UsageDate"
-        currency = results[0].get("Currency") if results else "USD"
+    def _get_results(self, scope: str, payload: dict, rollup: bool = True):
+        rollup_index = self.session.rollup_index
+        if rollup_index is not None and rollup:
+            results = self._find_rollup(scope, payload)
+            if results is not None:
+                return results
 
-        for result in total_results:
-            d = datetime.strptime(str(result[date_key]), format_date).strftime(
-                view_format_date
-            )
-            # Set the decimal point to two digits.
-            dd["total"][d] = round(result["Cost"], 2)
+        columns, rows = self._query(scope, payload)
+        with self.profiler.span("materialize"):
+            results = CostTable.from_rows(columns, rows)
+        if rollup_index is not None:
+            rollup_index.add(scope, payload, results)
+        return results
+
+    def _find_rollup(self, scope: str, payload: dict):
+        results = self.session.rollup_index.find(scope, payload)
+        if results is not None:
+            self.logger.debug("computed from a stored result")
+            self.profiler.count("rollups")
+        return results
 
-        for result in results:
-            d = datetime.strptime(str(result[date_key]), format_date).strftime(
-                view_format_date
+    def _sum_by_date(self, results: CostTable):
+        date_key = DateUtil.get_date_column(self.granularity)
+        names = [date_key] + (["Currency"] if "Currency" in results.index else [])
+        total_results = CostTable(["Cost"] + names)
+        if not results:
+            return total_results
+        sums = results.group_sum(names)
+        for key in sorted(sums, key=lambda k: DateUtil.parse_date_key(k[0])):
+            total_results.append([sums[key]] + list(key))
+        return total_results
+
+    def _query(self, scope: str, payload: dict):
+        if self.store is None:
+            return self._fetch_chunked(scope, payload)
+
+        time_period = payload["time_period"]
+        start = time_period.from_property.date()
+        end = time_period.to.date()
+        key = self.store.make_key(scope, payload)
+        entry = self.store.load(key)
+        fetch_from = self.store.plan(entry, self.granularity, start, end)
+        if fetch_from is None:
+            self.logger.debug("store is up to date: %s", key)
+        else:
+            self.logger.debug("sync %s - %s: %s", fetch_from, end, key)
+            fetch_start = datetime.combine(
+                fetch_from, time.min, tzinfo=time_period.from_property.tzinfo
+            )
+            columns, rows = self._fetch_chunked(
+                scope,
+                dict(
+                    payload,
+                    time_period=make_time_period(fetch_start, time_period.to),
+                ),
+            )
+            entry = self.store.merge(
+                entry, self.granularity, start, end, fetch_from, columns, rows
             )
-            # Set the decimal point to two digits.
-            dimensions = ", ".join([result[dimension] for dimension in self.dimensions])
-            dd[dimensions][d] = round(result["Cost"], 2)
-
-        costs = []
-        for raw_key, sum_costs in dd.items():
-            key = raw_key.replace(f"/subscriptions/{self.subscription_id}", "")
-            if self.resource_group:
-                key = key.replace(f"/resourcegroups/{self.resource_group}", "")
-            d = {
-                f"({currency})": key.replace(
-                    f"/subscriptions/{self.subscription_id}", ""
+            self.store.save(key, entry)
+
+        columns = entry["columns"]
+        date_index = columns.index(DateUtil.get_date_column(self.granularity))
+        rows = [
+            row
+            for row in entry["rows"]
+            if start <= DateUtil.parse_date_key(row[date_index]) <= end
+        ]
+        return columns, rows
+
+    def _fetch_chunked(self, scope: str, payload: dict):
+        """
+        Split long DAILY windows into calendar months, fetch them
+        concurrently and return the rows in the order of the months.
+        """
+        time_period = payload["time_period"]
+        if self.granularity != "DAILY" or not self.chunk_by_month:
+            return self._fetch(scope, payload)
+        chunks = DateUtil.split_by_month(time_period.from_property, time_period.to)
+        if len(chunks) <= 1:
+            return self._fetch(scope, payload)
+
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.logger.debug("split into %d chunks", len(chunks))
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        pending = iter(chunks)
+        futures = deque()
+
+        def submit():
+            chunk = next(pending, None)
+            if chunk is not None:
+                futures.append(
+                    executor.submit(
+                        self._fetch_all,
+                        scope,
+                        dict(payload, time_period=make_time_period(*chunk)),
+                    )
                 )
-            }
-            d.update(sum_costs)
-            costs.append(d)
 
-        if not costs:
-            return "No data available."
+        # At most max_workers chunks are fetched or waiting to be read.
+        for _ in range(self.max_workers):
+            submit()
+        try:
+            columns = futures[0].result()[0]
+        except BaseException:
+            self._cancel(executor, futures)
+            raise
+        return columns, self._iter_chunks(executor, futures, submit)
+
+    def _fetch_all(self, scope: str, payload: dict):
+        columns, rows = self._fetch(scope, payload)
+        return columns, list(rows)
+
+    def _iter_chunks(self, executor, futures, submit):
+        try:
+            while futures:
+                # Rows of a chunk are dropped once they have been read.
+                rows = futures.popleft().result()[1]
+                submit()
+                yield from rows
+                rows = None
+        finally:
+            self._cancel(executor, futures)
 
-        # Get the most recent month
-        last_time = list(costs[0].keys())[-1]
+    def _cancel(self, executor, futures: list):
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
 
-        # Sort by most recent month
-        converts = sorted(
-            costs,
-            key=lambda x: 0 if x.get(last_time) is None else x.get(last_time),
-            reverse=True,
+    def _fetch(self, scope: str, payload: dict):
+        if self.cache is None:
+            return self._get_pages(scope, payload)
+
+        # Settled periods are cached for good, apart from the open ones.
+        parts = self.cache.split(payload)
+        columns, rows = None, []
+        for start, end, closed in parts:
+            part = (
+                payload
+                if len(parts) == 1
+                else dict(payload, time_period=make_time_period(start, end))
+            )
+            key = self.cache.make_key(scope, part)
+            entry = self.cache.get(key)
+            if entry is not None:
+                self.logger.debug("cache hit: %s", key)
+                self.profiler.count("cache_hits")
+                part_columns, part_rows = entry["columns"], entry["rows"]
+            else:
+                part_columns, part_rows = self._get_pages(scope, part)
+                part_rows = list(part_rows)
+                self.cache.set(key, part_columns, part_rows, closed=closed)
+            columns = columns or part_columns
+            rows.extend(part_rows)
+        return columns, rows
+
+    def _get_pages(self, scope: str, payload: dict):
+        """
+        Send the first request and return its columns with an iterator over
+        the rows of every page.
+        """
+        usage = self._usage(scope, payload)
+        columns = rename_tag_columns(
+            [col.name for col in usage.columns], self.dimensions
         )
-        return tabulate(converts, headers="keys")
+        return columns, self._iter_rows(scope, payload, usage)
+
+    def _iter_rows(self, scope: str, payload: dict, usage):
+        while True:
+            self.profiler.count("rows", len(usage.rows))
+            self.logger.debug("page: %d rows", len(usage.rows))
+            yield from usage.rows
+            if not usage.next_link:
+                return
+            skiptoken = parse_qs(urlparse(usage.next_link).query).get("$skiptoken")
+            if not skiptoken:
+                raise ValueError(f"Unexpected next_link: {usage.next_link}")
+            self.logger.debug("next page: %s", usage.next_link)
+            usage = self._usage(scope, payload, params={"$skiptoken": skiptoken[0]})
+
+    def _usage(self, scope: str, payload: dict, **kwargs):
+        if self.profiler.enabled:
+            kwargs["raw_response_hook"] = self._count_bytes
+        with self.profiler.span("query.usage"):
+            return self.scheduler.call(
+                scope,
+                self.cost_management_client.query.usage,
+                scope,
+                payload,
+                **kwargs,
+            )
+
+    def _count_bytes(self, response):
+        self.profiler.count("bytes", len(response.http_response.body() or b""))
+
+    def convert_tabulate(
+        self, total_results, results, top: int = None, min_cost: float = None
+    ):
+        """
+        results may be any iterable and is consumed once. When total_results
+        is None, the total row is summed from results in the same pass.
+        With top or min_cost, the other rows are summed into an "others" row.
+        """
+        pivot = self.pivot(total_results, results)
+        if pivot.is_empty():
+            return "No data available."
+
+        with self.profiler.span("render"):
+            from tabulate import tabulate
+
+            currency = pivot.currency or "USD"
+            converts = []
+            for scope_name, key, sum_costs in pivot.to_rows(
+                self.format_key, top=top, min_cost=min_cost
+            ):
+                d = {"Scope": scope_name or ""} if self.scopes is not None else {}
+                d[f"({currency})"] = key
+                # Set the decimal point to two digits.
+                d.update(sum_costs)
+                converts.append(d)
+            return tabulate(converts, headers="keys")
+
+    def pivot(self, total_results, results) -> Pivot:
+        """
+        Aggregate results into a Pivot, with the same arguments as
+        convert_tabulate.
+        """
+        # With an iterator, the pivot span includes fetching the pages.
+        with self.profiler.span("pivot"):
+            pivot = Pivot(self.granularity, self.dimensions)
+            if total_results is not None:
+                pivot.add_totals(total_results)
+            if isinstance(results, CostTable):
+                pivot.add_table(results, with_total=total_results is None)
+            else:
+                pivot.add_rows(results, with_total=total_results is None)
+        return pivot
+
+    def get_scope_label(self, scope_name: str = None) -> str:
+        """
+        Return the scope of a pivot row: its scope name with scopes, the path
+        of the queried scope without them, and "" for the total of scopes.
+        """
+        if scope_name:
+            return scope_name
+        return self._get_scope() if self.scopes is None else ""
+
+    def format_key(self, scope_name: str, key: tuple) -> str:
+        """
+        Return the label of a pivot key, with resource IDs shown relative
+        to the scope of the row.
+        """
+        if scope_name is None:
+            subscription_id = self.subscription_id
+            resource_group = self.resource_group
+        else:
+            scope = self._scopes_by_name[scope_name]
+            subscription_id = scope.subscription_id
+            resource_group = scope.resource_group
+        key = ", ".join(key)
+        # Resource IDs are shown relative to the scope. Keys of scopes above
+        # subscriptions keep them, they come from many subscriptions.
+        if subscription_id:
+            key = key.replace(f"/subscriptions/{subscription_id}", "")
+            if resource_group:
+                key = key.replace(f"/resourcegroups/{resource_group}", "")
+        return key
+
+    def _get_scopes(self, scopes: list, all_subscriptions: bool):
+        if all_subscriptions:
+            return [
+                Scope(
+                    subscription["name"],
+                    "/subscriptions/" + subscription["id"],
+                    subscription["id"],
+                    None,
+                )
+                for subscription in self.subscription_index.list()
+                if subscription["state"] in (None, "Enabled")
+            ]
+
+        names = [
+            name.partition("/")[0]
+            for name in scopes
+            if not name.startswith("/")
+            and not SUBSCRIPTION_ID_PATTERN.match(name.partition("/")[0])
+        ]
+        subscription_ids = self.subscription_index.resolve(names) if names else {}
+        results = []
+        for name in scopes:
+            if name.startswith("/"):
+                # A scope path, e.g. of a management group, is used as is.
+                match = SCOPE_PATH_PATTERN.match(name)
+                results.append(
+                    Scope(
+                        name,
+                        name,
+                        match.group("subscription_id") if match else None,
+                        match.group("resource_group") if match else None,
+                    )
+                )
+                continue
+            subscription, _, resource_group = name.partition("/")
+            if SUBSCRIPTION_ID_PATTERN.match(subscription):
+                subscription_id = subscription
+            else:
+                subscription_id = subscription_ids[subscription]
+                if subscription_id is None:
+                    raise ValueError(f"Subscription '{subscription}' not found.")
+            path = "/subscriptions/" + subscription_id
+            if resource_group:
+                path += "/resourceGroups/" + resource_group
+            results.append(Scope(name, path, subscription_id, resource_group or None))
+        return results
 
     def _get_subscription_id(self, subscription_name: str = None):
         if subscription_name:
-            if self._subscription_client is None:
-                self._subscription_client = SubscriptionClient(
-                    credential=self.credential
-                )
-            for subscription in self._subscription_client.subscriptions.list():
-                if subscription.display_name != subscription_name:
-                    continue
-                return subscription.subscription_id
+            subscription_id = self.subscription_index.get(subscription_name)
+            if subscription_id is not None:
+                return subscription_id
             raise ValueError(f"Subscription '{subscription_name}' not found.")
         elif os.environ.get("AZURE_SUBSCRIPTION_ID"):
             return os.environ.get("AZURE_SUBSCRIPTION_ID")
@@ -1,20 +1,155 @@
+from datetime import date
+from datetime import time
 from datetime import timedelta
 from datetime import datetime
 from datetime import timezone
+import re
+
+from . import constants
+
+UTC_OFFSET_PATTERN = re.compile(
+    r"^(?:UTC)?(?P<sign>[+-])(?P<hours>\d{2}):?(?P<minutes>\d{2})$"
+)
 
 
 class DateUtil:
     @staticmethod
-    def get_start_and_end(granularity, point):
+    def get_timezone(name: str = None):
         """
-        datapointのscaleをmonth, week, dayで自動調節する
+        請求のタイムゾーンを返す。"UTC", "+09:00"のようなオフセット、
+        "Asia/Tokyo"のようなIANAの名前を受け付ける
         """
-        if granularity == "MONTHLY":
-            days = 30 * point
+        if not name or name.upper() in ("UTC", "Z"):
+            return timezone.utc
+        match = UTC_OFFSET_PATTERN.match(name)
+        if match:
+            offset = timedelta(
+                hours=int(match.group("hours")), minutes=int(match.group("minutes"))
+            )
+            return timezone(-offset if match.group("sign") == "-" else offset)
+        try:
+            from zoneinfo import ZoneInfo
+        except ImportError:
+            raise ValueError(
+                f"Time zone names need Python 3.9 or later, use an offset like +09:00: {name}"
+            )
+        try:
+            return ZoneInfo(name)
+        except (ValueError, KeyError):
+            # ZoneInfoNotFoundError is a KeyError.
+            raise ValueError(f"Unknown time zone: {name}")
+
+    @staticmethod
+    def get_start_and_end(
+        granularity,
+        point,
+        tz=None,
+        start_date: date = None,
+        end_date: date = None,
+    ):
+        """
+        datapointのscaleをmonth, dayで自動調節する
+
+        期間は暦の月と日の境界に揃えるので、同じ日に同じ問い合わせをすると
+        同じ期間になる。MONTHLYはpoint月前の月初から、DAILYはpoint日前から、
+        end_date(省略時はtzでの今日)の終わりまで。start_dateとend_dateで
+        期間を明示でき、MONTHLYでは月の境界に広げる(未来には広げない)。
+
+        APIは日付で集計するので、tzでの日付をUTCの0時として返す。
+        """
+        today = datetime.now(tz or timezone.utc).date()
+        end = end_date or today
+        if start_date is not None:
+            start = start_date
+        elif granularity == "MONTHLY":
+            month = end.year * 12 + end.month - 1 - point
+            start = date(month // 12, month % 12 + 1, 1)
         elif granularity == "DAILY":
-            days = point
+            start = end - timedelta(days=point)
+        else:
+            raise ValueError(f"Invalid granularity: {granularity}")
+        if granularity == "MONTHLY":
+            start = start.replace(day=1)
+            if end_date is not None:
+                end = min(DateUtil.get_month_end(end), max(end, today))
+        if start > end:
+            raise ValueError(f"The window starts after it ends: {start} - {end}")
+        return (
+            datetime.combine(start, time.min, tzinfo=timezone.utc),
+            datetime.combine(end, time(23, 59, 59), tzinfo=timezone.utc),
+        )
+
+    @staticmethod
+    def get_month_end(value: date) -> date:
+        return (value.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(
+            days=1
+        )
+
+    @staticmethod
+    def is_settled(end: date, settle_days: int = constants.SETTLE_DAYS):
+        """
+        usageデータが確定済み(今後変化しない)かどうかを判定する
+        """
+        today = datetime.now(timezone.utc).date()
+        return end + timedelta(days=settle_days) < today
+
+    @staticmethod
+    def get_settled_until(granularity, settle_days: int = constants.SETTLE_DAYS):
+        """
+        usageデータが確定済みの最後の日を返す。MONTHLYでは確定済みの月の末日
+        """
+        today = datetime.now(timezone.utc).date()
+        settled_until = today - timedelta(days=settle_days + 1)
+        if granularity == "MONTHLY":
+            # Only whole months are settled.
+            settled_until = (settled_until + timedelta(days=1)).replace(
+                day=1
+            ) - timedelta(days=1)
+        return settled_until
 
-        start_datetime = datetime.now(timezone.utc) - timedelta(days=days)
+    @staticmethod
+    def get_date_column(granularity):
+        return "BillingMonth" if granularity == "MONTHLY" else "UsageDate"
+
+    @staticmethod
+    def parse_date_key(value):
+        """
+        BillingMonth("2023-08-01T00:00:00")とUsageDate(20230801)をdateに変換する
+        """
+        value = str(value)
+        if "-" in value:
+            return date.fromisoformat(value[:10])
+        return datetime.strptime(value[:8], "%Y%m%d").date()
+
+    @staticmethod
+    def split_by_month(start: datetime, end: datetime):
+        """
+        期間を月の境界で分割する
+        """
+        chunks = []
+        chunk_start = start
+        while True:
+            next_month = (chunk_start.replace(day=28) + timedelta(days=4)).replace(
+                day=1, hour=0, minute=0, second=0, microsecond=0
+            )
+            if next_month > end:
+                chunks.append((chunk_start, end))
+                return chunks
+            chunks.append((chunk_start, next_month - timedelta(seconds=1)))
+            chunk_start = next_month
+
+    @staticmethod
+    def get_periods(granularity, start: date, end: date):
+        """
+        期間に含まれる各月の初日(MONTHLY)または各日(DAILY)を返す
+        """
         if granularity == "MONTHLY":
-            start_datetime = start_datetime.replace(day=1)
-        return start_datetime, datetime.now(timezone.utc)
+            month = start.replace(day=1)
+            while month <= end:
+                yield month
+                month = (month + timedelta(days=32)).replace(day=1)
+        else:
+            day = start
+            while day <= end:
+                yield day
+                day += timedelta(days=1)
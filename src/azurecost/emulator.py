@@ -0,0 +1,297 @@
+from collections import OrderedDict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from . import constants
+from .date_util import DateUtil
+from .logger import get_logger
+
+QUERY_PATH = re.compile(r"^(?P<scope>/.*)/providers/Microsoft\.CostManagement/query$")
+
+
+class CostEmulator:
+    """
+    A local stand-in for the Cost Management query API and the
+    subscriptions API, answering with generated rows. Management group and
+    billing scopes answer with rows of every subscription. Point a Session at
+    it with ``endpoint`` to run the concurrency, caching and retry paths
+    without an Azure account.
+
+    Rows are generated from ``seed``, the scope and the period, so the
+    same query always gets the same answer. Every request waits
+    ``latency`` seconds, results are split into pages of ``page_size``
+    rows, and ``throttle_rate`` of the requests are answered with 429 and
+    ``retry_after`` headers, spread evenly over the requests. Filters
+    with "and" and "In" conditions on dimensions and tags are applied.
+    """
+
+    def __init__(
+        self,
+        subscriptions: int = 1,
+        rows_per_period: int = 100,
+        cardinality: int = 50,
+        page_size: int = 5000,
+        latency: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: float = 1.0,
+        currency: str = "USD",
+        seed: int = 0,
+        debug: bool = False,
+        sleep=time.sleep,
+    ):
+        self.subscriptions = [
+            (f"00000000-0000-0000-0000-{i:012d}", f"subscription-{i}")
+            for i in range(subscriptions)
+        ]
+        self.rows_per_period = rows_per_period
+        self.cardinality = cardinality
+        self.page_size = page_size
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.currency = currency
+        self.seed = seed
+        self.logger = get_logger(debug)
+        self._sleep = sleep
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "rows": 0}
+
+    def make_server(self, host: str, port: int) -> ThreadingHTTPServer:
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.emulator = self
+        return server
+
+    def handle(self, method: str, url: str, body: bytes):
+        """
+        Return (status, headers, body) for a request.
+        """
+        if self.latency:
+            self._sleep(self.latency)
+        with self._lock:
+            self.stats["requests"] += 1
+            n = self.stats["requests"]
+            # Exactly throttle_rate of the requests, without randomness.
+            throttled = int(n * self.throttle_rate) > int((n - 1) * self.throttle_rate)
+            if throttled:
+                self.stats["throttled"] += 1
+        if throttled:
+            headers = {
+                "Retry-After": str(self.retry_after),
+                "x-ms-ratelimit-microsoft.costmanagement-qpu-retry-after": str(
+                    self.retry_after
+                ),
+            }
+            return 429, headers, _error("429", "Too many requests. Please retry.")
+
+        parsed = urlparse(url)
+        if method == "GET" and parsed.path == "/subscriptions":
+            return 200, {}, {"value": self._list_subscriptions()}
+        match = QUERY_PATH.match(parsed.path)
+        if method != "POST" or match is None:
+            return 404, {}, _error("NotFound", f"Not found: {parsed.path}")
+        try:
+            query = json.loads(body or b"{}")
+            rows, columns = self._query(match.group("scope"), query)
+        except (KeyError, TypeError, ValueError) as e:
+            return 400, {}, _error("BadRequest", str(e))
+
+        skiptoken = parse_qs(parsed.query).get("$skiptoken", ["0"])[0]
+        offset = int(skiptoken) if skiptoken.isdigit() else 0
+        end = offset + self.page_size
+        page = rows[offset:end]
+        with self._lock:
+            self.stats["rows"] += len(page)
+        next_link = None
+        if end < len(rows):
+            api_version = parse_qs(parsed.query).get("api-version", [""])[0]
+            next_link = f"{parsed.path}?api-version={api_version}&$skiptoken={end}"
+        return (
+            200,
+            {},
+            {
+                "id": f"{match.group('scope')}/providers/Microsoft.CostManagement/query/emulated",
+                "name": "emulated",
+                "type": "Microsoft.CostManagement/query",
+                "properties": {
+                    "nextLink": next_link,
+                    "columns": columns,
+                    "rows": page,
+                },
+            },
+        )
+
+    def _list_subscriptions(self) -> list:
+        return [
+            {
+                "id": f"/subscriptions/{subscription_id}",
+                "subscriptionId": subscription_id,
+                "displayName": name,
+                "state": "Enabled",
+            }
+            for subscription_id, name in self.subscriptions
+        ]
+
+    def _query(self, scope: str, query: dict):
+        dataset = query["dataset"]
+        granularity = dataset["granularity"].upper()
+        if granularity not in constants.AVAILABLE_GRANULARITY:
+            raise ValueError(f"Invalid granularity: {dataset['granularity']}")
+        grouping = dataset.get("grouping") or []
+        conditions = _get_conditions(dataset.get("filter"))
+        # Payloads given as dicts are sent with their keys unchanged.
+        time_period = query.get("timePeriod") or query["time_period"]
+        start = date.fromisoformat(time_period["from"][:10])
+        end = date.fromisoformat(time_period["to"][:10])
+        columns = [{"name": "Cost", "type": "Number"}]
+        columns.append(
+            {"name": DateUtil.get_date_column(granularity), "type": "Datetime"}
+        )
+        for g in grouping:
+            names = ["TagKey", "TagValue"] if g["type"] == "TagKey" else [g["name"]]
+            columns += [{"name": name, "type": "String"} for name in names]
+        columns.append({"name": "Currency", "type": "String"})
+
+        key = json.dumps(
+            [scope.lower(), granularity, grouping, conditions, str(start), str(end)],
+            sort_keys=True,
+        )
+        with self._lock:
+            rows = self._results.get(key)
+        if rows is None:
+            rows = []
+            for period in DateUtil.get_periods(granularity, start, end):
+                rows.extend(
+                    self._get_rows(scope, granularity, grouping, conditions, period)
+                )
+            with self._lock:
+                # Kept for the following pages of the same query.
+                self._results[key] = rows
+                while len(self._results) > 16:
+                    self._results.popitem(last=False)
+        return rows, columns
+
+    def _get_rows(self, scope: str, granularity, grouping, conditions, period):
+        seed = f"{self.seed}:{scope.lower()}:{period}"
+        rng = random.Random(seed)
+        raw_date = (
+            period.strftime("%Y-%m-%dT00:00:00")
+            if granularity == "MONTHLY"
+            else int(period.strftime("%Y%m%d"))
+        )
+        costs = [round(rng.expovariate(0.1), 6) for _ in range(self.rows_per_period)]
+        match = re.match(r"^/subscriptions/([^/]+)", scope, re.IGNORECASE)
+        if match:
+            names = dict(self.subscriptions)
+            subscription = (match.group(1), names.get(match.group(1), match.group(1)))
+            subscriptions = [subscription] * len(costs)
+        else:
+            # Management group and billing scopes cover every subscription.
+            rng = random.Random(f"{seed}:subscription")
+            subscriptions = [rng.choice(self.subscriptions) for _ in costs]
+
+        def get_values(kind: str, name: str) -> list:
+            # Every dimension and tag has its own values, whatever the query.
+            rng = random.Random(f"{seed}:{kind}:{name}")
+            if kind == "TagKey":
+                return [
+                    f"{name.lower()}-{rng.randrange(self.cardinality)}" for _ in costs
+                ]
+            return [
+                _get_value(name, subscription, rng.randrange(self.cardinality))
+                for subscription in subscriptions
+            ]
+
+        keep = [True] * len(costs)
+        for kind, name, values in conditions:
+            allowed = set(values)
+            keep = [k and v in allowed for k, v in zip(keep, get_values(kind, name))]
+        if not grouping:
+            total = sum(cost for cost, k in zip(costs, keep) if k)
+            return [[round(total, 6), raw_date, self.currency]]
+
+        columns = [get_values(g["type"], g["name"]) for g in grouping]
+        rows = []
+        for i, cost in enumerate(costs):
+            if not keep[i]:
+                continue
+            row = [cost, raw_date]
+            for g, values in zip(grouping, columns):
+                row += [g["name"], values[i]] if g["type"] == "TagKey" else [values[i]]
+            rows.append(row + [self.currency])
+        return rows
+
+
+def _get_conditions(expression) -> list:
+    """
+    Return the (grouping type, name, values) of every condition of a filter
+    expression, which are combined with "and".
+    """
+    if not expression:
+        return []
+    if "and" in expression:
+        return [c for e in expression["and"] for c in _get_conditions(e)]
+    for key, kind in [("dimensions", "Dimension"), ("tags", "TagKey")]:
+        condition = expression.get(key)
+        if condition is not None and condition.get("operator") == "In":
+            return [(kind, condition["name"], condition["values"])]
+    raise ValueError(f"Unsupported filter: {expression}")
+
+
+def _get_value(dimension: str, subscription: tuple, i: int) -> str:
+    subscription_id, subscription_name = subscription
+    if dimension == "ResourceId":
+        return (
+            f"/subscriptions/{subscription_id}/resourcegroups/rg-{i % 10}"
+            f"/providers/microsoft.compute/virtualmachines/vm-{i}"
+        )
+    if dimension in ("ResourceGroup", "ResourceGroupName"):
+        return f"rg-{i % 10}"
+    if dimension == "SubscriptionId":
+        return subscription_id
+    if dimension == "SubscriptionName":
+        return subscription_name
+    return f"{dimension.lower()}-{i}"
+
+
+def _error(code: str, message: str) -> dict:
+    return {"error": {"code": code, "message": message}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    POST /{scope}/providers/Microsoft.CostManagement/query
+    GET  /subscriptions
+    """
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method: str):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        status, headers, result = self.server.emulator.handle(method, self.path, body)
+        if result.get("properties", {}).get("nextLink"):
+            # The client follows the link on the host it connected to.
+            link = result["properties"]["nextLink"]
+            result["properties"]["nextLink"] = f"http://{self.headers['Host']}{link}"
+        data = json.dumps(result).encode("utf-8")
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        self.server.emulator.logger.debug(format, *args)
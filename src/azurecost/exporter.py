@@ -0,0 +1,188 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import math
+import re
+import threading
+import time
+from urllib.parse import parse_qs
+
+from . import constants
+from .logger import get_logger
+from .pivot import Pivot
+from .server import make_core, parse_query, Query
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def parse_target(target: str):
+    """
+    Parse a target given as URL query parameters like the /cost API of
+    `azurecost serve`, e.g. "name=daily&dimensions=ServiceName&granularity=DAILY".
+    Return (name, Query), the name defaults to the target itself.
+    """
+    params = parse_qs(target)
+    name = params.pop("name", [target])[-1]
+    return name, parse_query(params)
+
+
+def get_label_name(dimension: str) -> str:
+    # ServiceName -> service_name, tag:cost-center -> tag_cost_center
+    name = re.sub(r"(?<!^)(?<![^a-zA-Z0-9])(?=[A-Z])", "_", dimension).lower()
+    return re.sub(r"[^a-z0-9_]", "_", name)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: dict) -> str:
+    return ",".join(f'{name}="{escape(value)}"' for name, value in labels.items())
+
+
+class CostExporter:
+    """
+    Refreshes the targets in a background thread and keeps the Prometheus
+    text of their pivoted costs as a snapshot. Scrapes only read the
+    snapshot, so they never send requests to Azure.
+
+    ``core_factory(query)`` returns the Core for a target. The default
+    creates one with ``core_options`` (session, scheduler, cache, ...).
+    """
+
+    def __init__(
+        self,
+        targets: list,
+        debug: bool = False,
+        interval: int = constants.DEFAULT_EXPORT_INTERVAL,
+        core_factory=None,
+        clock=time.time,
+        **core_options,
+    ):
+        self.targets = targets
+        self.debug = debug
+        self.interval = interval
+        self.core_factory = core_factory or self._create_core
+        self.core_options = core_options
+        self.logger = get_logger(debug)
+        self._clock = clock
+        self._samples = {}
+        self._status = {}
+        self.snapshot = self._render()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def refresh(self):
+        """
+        Query every target once and replace the snapshot. A target that
+        fails keeps its previous samples.
+        """
+        for name, query in self.targets:
+            start = self._clock()
+            try:
+                self._samples[name] = self._collect(name, query)
+                success = 1
+            except Exception:
+                self.logger.exception("refresh failed: %s", name)
+                success = 0
+            self._status[name] = (success, self._clock(), self._clock() - start)
+            # Assigning the string is atomic, scrapes see the old or new one.
+            self.snapshot = self._render()
+
+    def make_server(self, host: str, port: int) -> ThreadingHTTPServer:
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.exporter = self
+        return server
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+    def _collect(self, name: str, query: Query):
+        core = self.core_factory(query)
+        total_results, results = core.get_usage(query.ago)
+        pivot = core.pivot(total_results, results)
+        currency = pivot.currency or "USD"
+        label_names = [get_label_name(d) for d in core.dimensions]
+
+        costs, totals = [], []
+        for (scope_name, key), values in zip(pivot.keys, pivot.costs):
+            is_total = (scope_name, key) == Pivot.TOTAL
+            labels = {
+                "target": name,
+                # Totals of multiple scopes are summed into one row.
+                "scope": core.get_scope_label(scope_name),
+                "granularity": core.granularity,
+            }
+            if not is_total:
+                labels.update(zip(label_names, key))
+            for period, cost in zip(pivot.periods, values):
+                if math.isnan(cost):
+                    continue
+                sample = (
+                    format_labels(dict(labels, period=period, currency=currency)),
+                    round(cost, 2),
+                )
+                (totals if is_total else costs).append(sample)
+        return costs, totals
+
+    def _render(self) -> str:
+        lines = []
+        families = [
+            ("azurecost_cost", "Cost per dimension values and period.", 0),
+            ("azurecost_total_cost", "Total cost per period.", 1),
+        ]
+        for metric, description, i in families:
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} gauge"]
+            for samples in self._samples.values():
+                lines += [
+                    f"{metric}{{{labels}}} {value}" for labels, value in samples[i]
+                ]
+
+        status = [
+            ("azurecost_refresh_success", "Whether the last refresh succeeded.", 0),
+            (
+                "azurecost_refresh_timestamp_seconds",
+                "Time of the last refresh.",
+                1,
+            ),
+            ("azurecost_refresh_duration_seconds", "Duration of the last refresh.", 2),
+        ]
+        for metric, description, i in status:
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} gauge"]
+            for name, values in self._status.items():
+                labels = format_labels({"target": name})
+                lines.append(f"{metric}{{{labels}}} {values[i]}")
+        return "\n".join(lines) + "\n"
+
+    def _create_core(self, query: Query):
+        return make_core(query, self.debug, **self.core_options)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            return self._send(200, self.server.exporter.snapshot, CONTENT_TYPE)
+        if path == "/healthz":
+            return self._send(200, "ok\n", "text/plain; charset=utf-8")
+        self._send(404, f"Not found: {path}\n", "text/plain; charset=utf-8")
+
+    def _send(self, status: int, body: str, content_type: str):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        self.server.exporter.logger.debug(format, *args)
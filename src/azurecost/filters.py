@@ -0,0 +1,98 @@
+from . import constants
+
+# Dimensions named "tag:KEY" group costs by the values of the tag KEY.
+TAG_PREFIX = "tag:"
+
+
+def parse_assignment(value: str, kind: str = "filter"):
+    """
+    Parse "Name=Value[,Value...]" into (name, [values]).
+    """
+    name, sep, values = value.partition("=")
+    values = [v.strip() for v in values.split(",") if v.strip()]
+    if not sep or not name.strip() or not values:
+        raise ValueError(f"Invalid {kind}: {value}, expected NAME=VALUE[,VALUE...]")
+    return name.strip(), values
+
+
+def parse_filters(values: list) -> dict:
+    """
+    Parse --filter values into {dimension: [values]}. Values given for the
+    same dimension more than once are merged.
+    """
+    filters = {}
+    for value in values:
+        name, dimension_values = parse_assignment(value)
+        if name not in constants.AVAILABLE_DIMENSIONS:
+            raise ValueError(f"Invalid dimension: {name}")
+        filters.setdefault(name, [])
+        filters[name] += [v for v in dimension_values if v not in filters[name]]
+    return filters
+
+
+def parse_tags(values: list) -> dict:
+    """
+    Parse --tag values into {key: [values]}.
+    """
+    tags = {}
+    for value in values:
+        key, tag_values = parse_assignment(value, "tag")
+        tags.setdefault(key, [])
+        tags[key] += [v for v in tag_values if v not in tags[key]]
+    return tags
+
+
+def is_valid_dimension(dimension: str) -> bool:
+    if dimension.startswith(TAG_PREFIX):
+        return len(dimension) > len(TAG_PREFIX)
+    return dimension in constants.AVAILABLE_DIMENSIONS
+
+
+def make_filter(filters: dict = None, tags: dict = None):
+    """
+    Return the filter expression of a query dataset that keeps the rows
+    matching every dimension and tag, or None without conditions.
+    """
+    expressions = [
+        {"dimensions": {"name": name, "operator": "In", "values": list(values)}}
+        for name, values in (filters or {}).items()
+    ] + [
+        {"tags": {"name": key, "operator": "In", "values": list(values)}}
+        for key, values in (tags or {}).items()
+    ]
+    if not expressions:
+        return None
+    # "and" needs at least two expressions.
+    return expressions[0] if len(expressions) == 1 else {"and": expressions}
+
+
+def make_grouping(dimensions: list) -> list:
+    grouping = []
+    for dimension in dimensions:
+        if dimension.startswith(TAG_PREFIX):
+            grouping.append({"type": "TagKey", "name": dimension[len(TAG_PREFIX) :]})
+        else:
+            grouping.append({"type": "Dimension", "name": dimension})
+    return grouping
+
+
+def get_dimension(grouping: dict) -> str:
+    """
+    Return the dimension of a grouping, the inverse of make_grouping.
+    """
+    if grouping["type"] == "TagKey":
+        return TAG_PREFIX + grouping["name"]
+    return grouping["name"]
+
+
+def rename_tag_columns(columns: list, dimensions: list) -> list:
+    """
+    Name the column of the tag a result is grouped by after its dimension.
+    The API returns the tag key and value in TagKey and TagValue columns.
+    """
+    tags = [d for d in dimensions if d.startswith(TAG_PREFIX)]
+    if len(tags) != 1 or tags[0] in columns:
+        return columns
+    key = tags[0][len(TAG_PREFIX) :]
+    name = "TagValue" if "TagValue" in columns else key
+    return [tags[0] if column == name else column for column in columns]
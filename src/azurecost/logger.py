@@ -1,5 +1,9 @@
 import logging
 from logging import getLogger, INFO, DEBUG
+import os
+
+# Longest message written for a single value.
+MAX_LENGTH = 2000
 
 
 def get_logger(debug=False):
@@ -9,3 +13,33 @@ def get_logger(debug=False):
     logger = getLogger(__name__)
     logger.setLevel(DEBUG if debug else INFO)
     return logger
+
+
+class Summary:
+    """
+    Log argument formatted only when the record is emitted. Results are
+    summarized by their row count, with up to AZURECOST_LOG_SAMPLE_ROWS
+    sampled rows, and every value is cut at max_length characters.
+
+        logger.debug("results = %s", Summary(results))
+    """
+
+    __slots__ = ("value", "max_length")
+
+    def __init__(self, value, max_length: int = MAX_LENGTH):
+        self.value = value
+        self.max_length = max_length
+
+    def __str__(self):
+        value = self.value
+        if hasattr(value, "columns") and hasattr(value, "__len__"):
+            text = f"{len(value)} rows, columns={value.columns}"
+            sample = int(os.environ.get("AZURECOST_LOG_SAMPLE_ROWS") or 0)
+            if sample and len(value):
+                rows = [value[i] for i in range(min(sample, len(value)))]
+                text += f", first {len(rows)} rows={rows}"
+        else:
+            text = str(value)
+        if len(text) > self.max_length:
+            text = text[: self.max_length] + f"... ({len(text)} chars)"
+        return text
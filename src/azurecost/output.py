@@ -0,0 +1,92 @@
+import csv
+import json
+
+from .date_util import DateUtil
+
+OUTPUT_FORMATS = ["table", "csv", "jsonl", "columnar"]
+LAYOUTS = ["pivot", "long"]
+
+
+def get_long_columns(core) -> list:
+    scope = ["Scope"] if core.scopes is not None else []
+    return scope + ["Period"] + list(core.dimensions) + ["Cost", "Currency"]
+
+
+def iter_long_rows(core, results):
+    """
+    Yield one list per usage row, in the order of get_long_columns.
+    Dates are formatted like the periods of the table.
+    """
+    date_key = DateUtil.get_date_column(core.granularity)
+    view_format = "%Y-%m" if core.granularity == "MONTHLY" else "%Y-%m-%d"
+    has_scope = core.scopes is not None
+    periods = {}
+    for result in results:
+        raw_date = result[date_key]
+        period = periods.get(raw_date)
+        if period is None:
+            period = periods[raw_date] = DateUtil.parse_date_key(raw_date).strftime(
+                view_format
+            )
+        row = [result.get("Scope", "")] if has_scope else []
+        row.append(period)
+        row.extend(result[d] for d in core.dimensions)
+        row.append(result["Cost"])
+        row.append(result.get("Currency", "USD"))
+        yield row
+
+
+def write_long(core, results, output_format: str, f):
+    """
+    Write every usage row of results to f as it is read, so pages are
+    written while the next ones are fetched.
+    """
+    columns = get_long_columns(core)
+    rows = iter_long_rows(core, results)
+    if output_format == "csv":
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+    else:
+        for row in rows:
+            f.write(json.dumps(dict(zip(columns, row))) + "\n")
+
+
+def write_pivot(
+    core,
+    total_results,
+    results,
+    output_format: str,
+    f,
+    top: int = None,
+    min_cost: float = None,
+):
+    """
+    Write the rows of the table to f one at a time, with the same
+    arguments as convert_tabulate.
+    """
+    pivot = core.pivot(total_results, results)
+    currency = pivot.currency or "USD"
+    periods = sorted(pivot.periods)
+    rows = (
+        []
+        if pivot.is_empty()
+        else pivot.to_rows(core.format_key, top=top, min_cost=min_cost)
+    )
+    with core.profiler.span("render"):
+        if output_format == "csv":
+            scope = ["Scope"] if core.scopes is not None else []
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(scope + ["Key", "Currency"] + periods)
+            for scope_name, key, costs in rows:
+                writer.writerow(
+                    ([scope_name or ""] if scope else [])
+                    + [key, currency]
+                    + [costs.get(period, "") for period in periods]
+                )
+        else:
+            for scope_name, key, costs in rows:
+                row = {"scope": scope_name, "key": key, "currency": currency}
+                row["costs"] = costs
+                f.write(json.dumps(row) + "\n")
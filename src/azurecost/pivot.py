@@ -0,0 +1,180 @@
+from array import array
+from datetime import datetime
+import heapq
+import math
+from operator import itemgetter
+
+from .date_util import DateUtil
+from .result import CostTable
+
+MISSING = float("nan")
+
+
+class Pivot:
+    """
+    Aggregates usage rows into one cost array per (scope, dimensions) key,
+    indexed by period.
+
+    Each distinct date value is parsed once and each distinct key is
+    stored once, so the work per row is a few dict lookups and an add.
+    """
+
+    TOTAL = (None, ("total",))
+
+    def __init__(self, granularity: str, dimensions: list):
+        self.granularity = granularity
+        self.dimensions = list(dimensions)
+        self.date_key = DateUtil.get_date_column(granularity)
+        self.view_format_date = "%Y-%m" if granularity == "MONTHLY" else "%Y-%m-%d"
+        self.format_date = "%Y-%m-%dT%H:%M:%S" if granularity == "MONTHLY" else "%Y%m%d"
+        self.currency = None
+        self.periods = []
+        self._period_index = {}
+        self._raw_dates = {}
+        self.keys = []
+        self.costs = []
+        self._key_index = {}
+        # Keep the total row first.
+        self._get_costs(self.TOTAL)
+
+    def add(self, raw_date, key: tuple, cost: float):
+        period = self._raw_dates.get(raw_date)
+        if period is None:
+            period = self._get_period(raw_date)
+        costs = self._get_costs(key)
+        if len(costs) <= period:
+            costs.extend([MISSING] * (period + 1 - len(costs)))
+        value = costs[period]
+        costs[period] = cost if value != value else value + cost
+
+    def add_totals(self, total_results):
+        date_key = self.date_key
+        for result in total_results:
+            # Totals of multiple scopes are summed into one row.
+            self.add(result[date_key], self.TOTAL, result["Cost"])
+
+    def add_rows(self, results, with_total: bool = False):
+        # Sum by the raw values first, everything else is done per group.
+        get_key = itemgetter(self.date_key, *self.dimensions)
+        sums = {}
+        currency = self.currency
+        for result in results:
+            key = (get_key(result), result.get("Scope"))
+            sums[key] = sums.get(key, 0.0) + result["Cost"]
+            if currency is None:
+                currency = result.get("Currency", "USD")
+        self.currency = currency
+
+        for (values, scope), cost in sums.items():
+            if not self.dimensions:
+                values = (values,)
+            self.add(values[0], (scope, values[1:]), cost)
+            if with_total:
+                self.add(values[0], self.TOTAL, cost)
+
+    def add_table(self, results: CostTable, with_total: bool = False):
+        has_scope = "Scope" in results.index
+        names = [self.date_key] + self.dimensions + (["Scope"] if has_scope else [])
+        end = len(self.dimensions) + 1
+        for key, cost in results.group_sum(names).items():
+            scope = key[end] if has_scope else None
+            self.add(key[0], (scope, key[1:end]), cost)
+            if with_total:
+                self.add(key[0], self.TOTAL, cost)
+        if self.currency is None and "Currency" in results.index and len(results):
+            self.currency = results.values[results.codes("Currency")[0]]
+
+    def is_empty(self) -> bool:
+        return not self.periods or all(
+            all(c != c for c in costs) for costs in self.costs
+        )
+
+    def to_rows(self, format_key=None, top: int = None, min_cost: float = None):
+        """
+        Return (scope, key, {period: cost}) tuples sorted by the cost of the
+        most recent period. format_key(scope, key) is called once per key.
+
+        With top or min_cost, only the total row and the top keys whose
+        latest cost is at least min_cost are returned, and the other keys
+        are summed into an "others" row.
+        """
+        if top is not None or min_cost is not None:
+            return self._to_top_rows(format_key, top, min_cost)
+        order = sorted(range(len(self.periods)), key=lambda i: self.periods[i])
+        last = order[-1]
+        rows = []
+        for (scope, key), costs in zip(self.keys, self.costs):
+            label = format_key(scope, key) if format_key else ", ".join(key)
+            sum_costs = self._get_sum_costs(costs, order)
+            last_cost = costs[last] if last < len(costs) else MISSING
+            last_cost = 0 if math.isnan(last_cost) else round(last_cost, 2)
+            rows.append((last_cost, scope, label, sum_costs))
+        # Sort by most recent period
+        rows.sort(key=lambda x: x[0], reverse=True)
+        return [(scope, label, sum_costs) for _, scope, label, sum_costs in rows]
+
+    def _to_top_rows(self, format_key, top: int, min_cost: float):
+        order = sorted(range(len(self.periods)), key=lambda i: self.periods[i])
+        last = order[-1]
+
+        def get_last_cost(i):
+            costs = self.costs[i]
+            cost = costs[last] if last < len(costs) else MISSING
+            return 0 if math.isnan(cost) else round(cost, 2)
+
+        total = self._key_index[self.TOTAL]
+        candidates = (i for i in range(len(self.keys)) if i != total)
+        if min_cost is not None:
+            candidates = (i for i in candidates if get_last_cost(i) >= min_cost)
+        # A heap of top keys instead of sorting every key. Every key is
+        # aggregated first: its latest cost is known only after all rows.
+        if top is not None:
+            selected = heapq.nlargest(top, candidates, key=get_last_cost)
+        else:
+            selected = sorted(candidates, key=get_last_cost, reverse=True)
+
+        others = array("d", [MISSING] * len(self.periods))
+        kept = set(selected)
+        kept.add(total)
+        for i, costs in enumerate(self.costs):
+            if i in kept:
+                continue
+            for period, cost in enumerate(costs):
+                if cost == cost:
+                    value = others[period]
+                    others[period] = cost if value != value else value + cost
+
+        rows = []
+        for i in [total] + selected:
+            scope, key = self.keys[i]
+            label = format_key(scope, key) if format_key else ", ".join(key)
+            rows.append((scope, label, self._get_sum_costs(self.costs[i], order)))
+        if len(kept) < len(self.keys):
+            rows.append((None, "others", self._get_sum_costs(others, order)))
+        return rows
+
+    def _get_sum_costs(self, costs, order: list) -> dict:
+        return {
+            self.periods[i]: round(costs[i], 2)
+            for i in order
+            if i < len(costs) and not math.isnan(costs[i])
+        }
+
+    def _get_period(self, raw_date) -> int:
+        label = datetime.strptime(str(raw_date), self.format_date).strftime(
+            self.view_format_date
+        )
+        period = self._period_index.get(label)
+        if period is None:
+            period = self._period_index[label] = len(self.periods)
+            self.periods.append(label)
+        self._raw_dates[raw_date] = period
+        return period
+
+    def _get_costs(self, key: tuple):
+        i = self._key_index.get(key)
+        if i is None:
+            i = self._key_index[key] = len(self.keys)
+            self.keys.append(key)
+            self.costs.append(array("d"))
+        return self.costs[i]
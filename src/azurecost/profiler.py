@@ -0,0 +1,99 @@
+import threading
+import time
+
+
+class Profiler:
+    """
+    Collects the time spent in named spans and the values of counters.
+
+    ``callback(kind, name, value)`` is called for every finished span
+    (kind "span", value in seconds) and every counter increment (kind
+    "counter"), e.g. to export them to a metrics system.
+    """
+
+    enabled = True
+
+    def __init__(self, callback=None, clock=time.perf_counter):
+        self.callback = callback
+        self._clock = clock
+        self.started = clock()
+        self.spans = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def span(self, name: str):
+        return _Span(self, name)
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            calls, total = self.spans.get(name, (0, 0.0))
+            self.spans[name] = (calls + 1, total + seconds)
+        if self.callback is not None:
+            self.callback("span", name, seconds)
+
+    def count(self, name: str, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        if self.callback is not None:
+            self.callback("counter", name, value)
+
+    def report(self) -> str:
+        """
+        Return the spans in the order they were first entered, followed by
+        the counters. Spans can be nested, so their times do not add up.
+        """
+        width = max([len(name) for name in [*self.spans, *self.counters]] + [5])
+        lines = [f"{'stage':<{width}} {'calls':>7} {'seconds':>10}"]
+        for name, (calls, total) in self.spans.items():
+            lines.append(f"{name:<{width}} {calls:>7} {total:>10.3f}")
+        lines.append(f"{'wall':<{width}} {'':>7} {self._clock() - self.started:>10.3f}")
+        for name, value in self.counters.items():
+            value = f"{value:.3f}" if isinstance(value, float) else value
+            lines.append(f"{name:<{width}} {value:>18}")
+        return "\n".join(lines)
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: Profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = self.profiler._clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.profiler._clock() - self.start)
+
+
+class NullProfiler:
+    """
+    Used when profiling is disabled, every method does nothing.
+    """
+
+    enabled = False
+
+    def span(self, name: str):
+        return _NULL_SPAN
+
+    def record(self, name: str, seconds: float):
+        pass
+
+    def count(self, name: str, value=1):
+        pass
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+NULL_PROFILER = NullProfiler()
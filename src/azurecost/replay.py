@@ -0,0 +1,187 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from types import SimpleNamespace
+
+from .cache import get_time_period, _to_date
+
+SUBSCRIPTIONS_FILE = "subscriptions.json"
+
+
+def make_keys(scope: str, payload: dict, params: dict = None):
+    """
+    Return the key of a request, its key with only the month the window
+    starts in, and its key without the time period. The last two let a
+    replay on a later day answer the same query: the month one keeps the
+    monthly chunks of a window apart, the other one is used when it
+    matches a single recording.
+    """
+    start, end = get_time_period(payload)
+    request = {
+        "scope": scope.lower(),
+        "payload": {k: v for k, v in payload.items() if k != "time_period"},
+        "params": params or {},
+    }
+    window = {"from": _to_date(start).isoformat(), "to": _to_date(end).isoformat()}
+    month = {"month": _to_date(start).isoformat()[:7]}
+    return _hash(dict(request, **window)), _hash(dict(request, **month)), _hash(request)
+
+
+def _hash(value) -> str:
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _write_json(path: str, value):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(value, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class RecordingCostManagementClient:
+    """
+    Passes query.usage calls to client and writes every response to
+    record_dir, one file per page.
+    """
+
+    def __init__(self, client, record_dir: str):
+        self.client = client
+        self.record_dir = record_dir
+        self.query = self
+
+    def usage(self, scope: str, parameters: dict, params: dict = None, **kwargs):
+        if params is not None:
+            kwargs["params"] = params
+        usage = self.client.query.usage(scope, parameters, **kwargs)
+        key, month_key, loose_key = make_keys(scope, parameters, params)
+        _write_json(
+            os.path.join(self.record_dir, key + ".json"),
+            {
+                "month_key": month_key,
+                "loose_key": loose_key,
+                "scope": scope,
+                "columns": [col.name for col in usage.columns],
+                "rows": usage.rows,
+                "next_link": usage.next_link,
+            },
+        )
+        return usage
+
+
+class RecordingSubscriptionClient:
+    """
+    Passes subscriptions.list calls to client and writes the subscriptions
+    to record_dir.
+    """
+
+    def __init__(self, client, record_dir: str):
+        self.client = client
+        self.record_dir = record_dir
+        self.subscriptions = self
+
+    def list(self, **kwargs):
+        subscriptions = list(self.client.subscriptions.list(**kwargs))
+        _write_json(
+            os.path.join(self.record_dir, SUBSCRIPTIONS_FILE),
+            [
+                {
+                    "subscription_id": s.subscription_id,
+                    "display_name": s.display_name,
+                    "state": getattr(s.state, "value", s.state),
+                }
+                for s in subscriptions
+            ],
+        )
+        return subscriptions
+
+
+class ReplayCostManagementClient:
+    """
+    Answers query.usage with the responses recorded in replay_dir. A
+    request that was recorded for another time period is answered with
+    the recording of the same month, or else with the only recording of
+    the request. A request that was never recorded, or that matches more
+    than one recording, raises KeyError.
+    """
+
+    def __init__(self, replay_dir: str):
+        self.replay_dir = replay_dir
+        self.query = self
+        self.calls = 0
+        self._loose_keys = None
+        self._lock = threading.Lock()
+
+    def usage(self, scope: str, parameters: dict, params: dict = None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        key, month_key, loose_key = make_keys(scope, parameters, params)
+        path = os.path.join(self.replay_dir, key + ".json")
+        if not os.path.exists(path):
+            path = self._find(scope, month_key, loose_key)
+        with open(path, "rb") as f:
+            body = f.read()
+        hook = kwargs.get("raw_response_hook")
+        if hook is not None:
+            hook(SimpleNamespace(http_response=SimpleNamespace(body=lambda: body)))
+        entry = json.loads(body)
+        return SimpleNamespace(
+            columns=[SimpleNamespace(name=name) for name in entry["columns"]],
+            rows=entry["rows"],
+            next_link=entry["next_link"],
+        )
+
+    def _find(self, scope: str, month_key: str, loose_key: str) -> str:
+        loose_keys = self._get_loose_keys()
+        for paths in [loose_keys.get(month_key, []), loose_keys.get(loose_key, [])]:
+            if len(paths) == 1:
+                return paths[0]
+            if len(paths) > 1:
+                # Answering with one of them could mix up chunks or pages.
+                raise KeyError(
+                    f"{len(paths)} recorded responses match {scope} in {self.replay_dir}"
+                )
+        raise KeyError(f"No recorded response for {scope} in {self.replay_dir}")
+
+    def _get_loose_keys(self) -> dict:
+        with self._lock:
+            if self._loose_keys is None:
+                self._loose_keys = {}
+                for path in sorted(glob.glob(os.path.join(self.replay_dir, "*.json"))):
+                    if os.path.basename(path) == SUBSCRIPTIONS_FILE:
+                        continue
+                    with open(path, encoding="utf-8") as f:
+                        entry = json.load(f)
+                    for name in ["month_key", "loose_key"]:
+                        if name in entry:
+                            self._loose_keys.setdefault(entry[name], []).append(path)
+            return self._loose_keys
+
+
+class ReplaySubscriptionClient:
+    """
+    Answers subscriptions.list with the subscriptions recorded in
+    replay_dir.
+    """
+
+    def __init__(self, replay_dir: str):
+        self.replay_dir = replay_dir
+        self.subscriptions = self
+
+    def list(self, **kwargs):
+        path = os.path.join(self.replay_dir, SUBSCRIPTIONS_FILE)
+        try:
+            with open(path, encoding="utf-8") as f:
+                subscriptions = json.load(f)
+        except FileNotFoundError:
+            raise KeyError(f"No recorded subscriptions in {self.replay_dir}")
+        return [SimpleNamespace(**s) for s in subscriptions]
@@ -0,0 +1,209 @@
+from array import array
+from collections.abc import Sequence
+import json
+import struct
+import sys
+
+from .date_util import DateUtil
+
+COST_COLUMNS = {"Cost", "PreTaxCost", "CostUSD"}
+DATE_COLUMNS = {"BillingMonth", "UsageDate"}
+
+COLUMNAR_MAGIC = b"AZCOST1\n"
+
+
+class CostTable(Sequence):
+    """
+    Column oriented usage result.
+
+    Costs are kept in a float array, dates as YYYYMMDD integers and every
+    other value as a code into a table of interned values. Indexing and
+    iteration return dicts, so a CostTable can be used where a list of
+    row dicts was expected.
+    """
+
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.values = []
+        self._codes = {}
+        # Original representation of each date, there are only a few of them.
+        self._dates = {}
+        self._date_keys = {}
+        self.data = [
+            array("d") if name in COST_COLUMNS else array("l") for name in self.columns
+        ]
+
+    @classmethod
+    def from_rows(cls, columns: list, rows):
+        table = cls(columns)
+        table.extend(rows)
+        return table
+
+    @classmethod
+    def concat(cls, tables: list, columns: list = None):
+        table = cls(columns if columns is not None else tables[0].columns)
+        for other in tables:
+            indexes = [other.index[name] for name in table.columns]
+            for i in range(len(other)):
+                row = other.row(i)
+                table.append([row[j] for j in indexes])
+        return table
+
+    def append(self, row):
+        for name, data, value in zip(self.columns, self.data, row):
+            if name in COST_COLUMNS:
+                data.append(value)
+            elif name in DATE_COLUMNS:
+                data.append(self._encode_date(value))
+            else:
+                data.append(self.encode(value))
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def add_column(self, name: str, value):
+        """
+        Add a column that has the same value in every row.
+        """
+        code = self.encode(value)
+        self.columns.append(name)
+        self.index[name] = len(self.columns) - 1
+        self.data.append(array("l", [code]) * len(self))
+
+    def since(self, name: str, start) -> "CostTable":
+        """
+        Return a new table with the rows whose date column is on or after
+        the start date.
+        """
+        start_key = int(start.strftime("%Y%m%d"))
+        rows = [i for i, key in enumerate(self.codes(name)) if key >= start_key]
+        table = CostTable(self.columns)
+        table.values = list(self.values)
+        table._codes = dict(self._codes)
+        table._dates = dict(self._dates)
+        table._date_keys = dict(self._date_keys)
+        table.data = [
+            array(data.typecode, [data[i] for i in rows]) for data in self.data
+        ]
+        return table
+
+    def write_columnar(self, f):
+        """
+        Write the table to the binary file f in a columnar format: a magic
+        line, the length of a JSON header (little-endian uint32) and the
+        header, followed by one little-endian array per column. Costs are
+        float64, dates YYYYMMDD and other values int32 codes into the
+        header's "values".
+        """
+        header = {
+            "columns": self.columns,
+            "rows": len(self),
+            "values": self.values,
+            "dates": sorted(self._dates.items()),
+        }
+        data = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        f.write(COLUMNAR_MAGIC + struct.pack("<I", len(data)) + data)
+        for column in self.data:
+            column = column if column.typecode == "d" else array("i", column)
+            if sys.byteorder == "big":
+                column = array(column.typecode, column)
+                column.byteswap()
+            f.write(column.tobytes())
+
+    @classmethod
+    def read_columnar(cls, f) -> "CostTable":
+        """
+        Read a table written by write_columnar from the binary file f.
+        """
+        if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError("Not a columnar cost table.")
+        (length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length).decode("utf-8"))
+        table = cls(header["columns"])
+        table.values = header["values"]
+        table._codes = {value: i for i, value in enumerate(table.values)}
+        table._dates = {key: value for key, value in header["dates"]}
+        table._date_keys = {value: key for key, value in header["dates"]}
+        rows = header["rows"]
+        for i, column in enumerate(table.data):
+            typecode = "d" if column.typecode == "d" else "i"
+            data = array(typecode)
+            data.frombytes(f.read(rows * data.itemsize))
+            if sys.byteorder == "big":
+                data.byteswap()
+            table.data[i] = data if typecode == "d" else array("l", data)
+        return table
+
+    def encode(self, value) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def codes(self, name: str):
+        return self.data[self.index[name]]
+
+    def column(self, name: str) -> list:
+        i = self.index[name]
+        return [self._decode(i, v) for v in self.data[i]]
+
+    def row(self, i: int) -> list:
+        return [self._decode(j, data[i]) for j, data in enumerate(self.data)]
+
+    def date_value(self, key: int):
+        return self._dates[key]
+
+    def group_sum(self, names: list, value: str = "Cost") -> dict:
+        """
+        Sum the value column by the given columns. Rows are grouped by their
+        codes and each distinct group is decoded once.
+        """
+        values = self.data[self.index[value]]
+        indexes = [self.index[name] for name in names]
+        sums = {}
+        keys = zip(*[self.data[i] for i in indexes]) if indexes else ((),) * len(self)
+        for key, v in zip(keys, values):
+            sums[key] = sums.get(key, 0.0) + v
+        return {
+            tuple(self._decode(i, code) for i, code in zip(indexes, key)): v
+            for key, v in sums.items()
+        }
+
+    def _encode_date(self, value) -> int:
+        key = self._date_keys.get(value)
+        if key is None:
+            key = int(DateUtil.parse_date_key(value).strftime("%Y%m%d"))
+            self._date_keys[value] = key
+            self._dates.setdefault(key, value)
+        return key
+
+    def _decode(self, i: int, value):
+        name = self.columns[i]
+        if name in COST_COLUMNS:
+            return value
+        if name in DATE_COLUMNS:
+            return self._dates[value]
+        return self.values[value]
+
+    def __len__(self):
+        return len(self.data[0]) if self.data else 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("CostTable index out of range")
+        return dict(zip(self.columns, self.row(i)))
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"CostTable(columns={self.columns}, rows={len(self)})"
@@ -0,0 +1,286 @@
+from collections import OrderedDict
+from datetime import date
+import glob
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from . import constants
+from .cache import get_time_period, _to_date
+from .date_util import DateUtil
+from .filters import get_dimension
+from .result import CostTable
+
+# Granularities that can be computed from each granularity.
+COARSER_GRANULARITY = {"DAILY": {"DAILY", "MONTHLY"}, "MONTHLY": {"MONTHLY"}}
+
+RESOURCE_GROUP_PATTERN = re.compile(r"/resourcegroups/([^/]+)", re.IGNORECASE)
+
+
+def _get_resource_group(resource_id):
+    """
+    Return the resource group of a resource ID as it is written there, or
+    None for charges without a resource in a resource group.
+    """
+    match = RESOURCE_GROUP_PATTERN.search(resource_id or "")
+    return match.group(1) if match else None
+
+
+# Dimensions that can be computed from another dimension. A derive function
+# returns None when the value can not be derived faithfully, and the query
+# is then sent to the API.
+DERIVED_DIMENSIONS = {
+    "ResourceGroup": ("ResourceId", _get_resource_group),
+    "ResourceGroupName": ("ResourceId", _get_resource_group),
+}
+
+
+def can_rollup(
+    source_granularity: str, source_dimensions, granularity: str, dimensions
+) -> bool:
+    """
+    Whether a result grouped by source_dimensions at source_granularity
+    has enough detail to compute one grouped by dimensions at granularity.
+    """
+    if granularity not in COARSER_GRANULARITY[source_granularity]:
+        return False
+    return all(
+        d in source_dimensions
+        or (d in DERIVED_DIMENSIONS and DERIVED_DIMENSIONS[d][0] in source_dimensions)
+        for d in dimensions
+    )
+
+
+def rollup(
+    table: CostTable,
+    source_granularity: str,
+    granularity: str,
+    dimensions: list,
+    start: date = None,
+    end: date = None,
+) -> CostTable:
+    """
+    Sum the costs of table by dimensions and granularity, keeping the rows
+    between start and end. Raises ValueError when a derived dimension can
+    not be computed for one of the rows.
+    """
+    source_date = DateUtil.get_date_column(source_granularity)
+    date_column = DateUtil.get_date_column(granularity)
+    to_month = source_granularity == "DAILY" and granularity == "MONTHLY"
+    start_key = int(start.strftime("%Y%m%d")) if start else 0
+    end_key = int(end.strftime("%Y%m%d")) if end else 99999999
+    if to_month:
+        # Months are keyed by their first day.
+        start_key = start_key // 100 * 100 + 1
+
+    names = list(dimensions) + (["Currency"] if "Currency" in table.index else [])
+    decoders = []
+    code_columns = []
+    for name in names:
+        if name in table.index:
+            code_columns.append(table.codes(name))
+            decoders.append(table.values.__getitem__)
+        else:
+            source, derive = DERIVED_DIMENSIONS[name]
+            code_columns.append(table.codes(source))
+            decoders.append(
+                lambda code, name=name, derive=derive: _derive(
+                    name, derive, table.values[code]
+                )
+            )
+
+    sums = {}
+    costs = table.codes("Cost")
+    for cost, date_key, *codes in zip(costs, table.codes(source_date), *code_columns):
+        if to_month:
+            date_key = date_key // 100 * 100 + 1
+        if not start_key <= date_key <= end_key:
+            continue
+        key = (date_key, *codes)
+        sums[key] = sums.get(key, 0.0) + cost
+
+    result = CostTable(["Cost", date_column] + names)
+    decoded = [{} for _ in names]
+    for key in sorted(sums, key=lambda k: k[0]):
+        date_key = key[0]
+        if to_month:
+            raw_date = (
+                f"{date_key // 10000:04d}-{date_key // 100 % 100:02d}-01T00:00:00"
+            )
+        else:
+            raw_date = table.date_value(date_key)
+        values = []
+        for cache, decode, code in zip(decoded, decoders, key[1:]):
+            if code not in cache:
+                cache[code] = decode(code)
+            values.append(cache[code])
+        result.append([sums[key], raw_date] + values)
+    return result
+
+
+def _derive(name: str, derive, value):
+    derived = derive(value)
+    if derived is None:
+        raise ValueError(f"{name} can not be derived from {value!r}")
+    return derived
+
+
+def _get_base(payload: dict) -> str:
+    # Everything but the window, the granularity and the grouping has to match.
+    dataset = {
+        k: v
+        for k, v in payload["dataset"].items()
+        if k not in ("granularity", "grouping")
+    }
+    base = {k: v for k, v in payload.items() if k not in ("time_period", "dataset")}
+    return json.dumps(
+        dict(base, dataset=dataset), sort_keys=True, separators=(",", ":"), default=str
+    )
+
+
+def _get_dimensions(payload: dict) -> list:
+    return [get_dimension(g) for g in payload["dataset"].get("grouping", [])]
+
+
+def _is_expired(meta: dict) -> bool:
+    return meta["expires_at"] is not None and meta["expires_at"] <= time.time()
+
+
+class RollupIndex:
+    """
+    Keeps fetched results, and answers queries for a subset of their
+    dimensions, a coarser granularity or a narrower window from them.
+
+    Entries that include the open period expire after ``ttl`` seconds.
+    With ``index_dir``, entries are also kept on disk for later runs.
+    """
+
+    def __init__(
+        self,
+        index_dir: str = None,
+        ttl: int = constants.DEFAULT_CACHE_TTL,
+        max_entries: int = 32,
+    ):
+        self.index_dir = index_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, scope: str, payload: dict, table: CostTable):
+        start, end = get_time_period(payload)
+        meta = {
+            "scope": scope.lower(),
+            "base": _get_base(payload),
+            "granularity": payload["dataset"]["granularity"],
+            "dimensions": _get_dimensions(payload),
+            "from": _to_date(start).isoformat(),
+            "to": _to_date(end).isoformat(),
+        }
+        # The same query replaces its entry, whenever it expires.
+        key = hashlib.sha256(
+            json.dumps(meta, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        meta["expires_at"] = (
+            None if DateUtil.is_settled(_to_date(end)) else time.time() + self.ttl
+        )
+        with self._lock:
+            self._entries[key] = (meta, table)
+            self._entries.move_to_end(key)
+            for expired in [k for k, v in self._entries.items() if _is_expired(v[0])]:
+                del self._entries[expired]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if self.index_dir:
+            self._save(key, meta, table)
+
+    def find(self, scope: str, payload: dict):
+        """
+        Return the result of the payload computed from a stored result, or
+        None when no stored result has enough detail.
+        """
+        start, end = get_time_period(payload)
+        start, end = _to_date(start), _to_date(end)
+        granularity = payload["dataset"]["granularity"]
+        dimensions = _get_dimensions(payload)
+        base = _get_base(payload)
+
+        def matches(meta):
+            return (
+                meta["scope"] == scope.lower()
+                and meta["base"] == base
+                and date.fromisoformat(meta["from"]) <= start
+                and date.fromisoformat(meta["to"]) >= end
+                and not _is_expired(meta)
+                and can_rollup(
+                    meta["granularity"], meta["dimensions"], granularity, dimensions
+                )
+            )
+
+        with self._lock:
+            found = next(
+                (entry for entry in self._entries.values() if matches(entry[0])), None
+            )
+        if found is None and self.index_dir:
+            found = self._load(matches)
+            if found is not None:
+                with self._lock:
+                    self._entries[found[2]] = found[:2]
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        if found is None:
+            return None
+        meta, table = found[:2]
+        try:
+            return rollup(
+                table, meta["granularity"], granularity, dimensions, start, end
+            )
+        except ValueError:
+            return None
+
+    def _save(self, key: str, meta: dict, table: CostTable):
+        os.makedirs(self.index_dir, exist_ok=True)
+        entry = {
+            "columns": table.columns,
+            "rows": [table.row(i) for i in range(len(table))],
+        }
+        # Rows first, so that a meta file always has its rows.
+        for suffix, value in [(".json", entry), (".meta.json", meta)]:
+            fd, tmp_path = tempfile.mkstemp(dir=self.index_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(value, f, separators=(",", ":"))
+                os.replace(tmp_path, os.path.join(self.index_dir, key + suffix))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def _load(self, matches):
+        for path in glob.glob(os.path.join(self.index_dir, "*.meta.json")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                if _is_expired(meta):
+                    self._delete(path)
+                    continue
+                if not matches(meta):
+                    continue
+                with open(path[: -len(".meta.json")] + ".json", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError, KeyError):
+                continue
+            key = os.path.basename(path)[: -len(".meta.json")]
+            return meta, CostTable.from_rows(entry["columns"], entry["rows"]), key
+        return None
+
+    def _delete(self, meta_path: str):
+        # The meta file first, so that rows are never found without it.
+        for path in [meta_path, meta_path[: -len(".meta.json")] + ".json"]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
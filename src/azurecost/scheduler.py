@@ -0,0 +1,157 @@
+from datetime import datetime, timezone
+import random
+import threading
+import time
+
+from . import constants
+from .profiler import NULL_PROFILER
+
+# Cost Management reports the wait for each throttling policy in its own header.
+RETRY_AFTER_HEADERS = [
+    "x-ms-ratelimit-microsoft.costmanagement-qpu-retry-after",
+    "x-ms-ratelimit-microsoft.costmanagement-entity-retry-after",
+    "x-ms-ratelimit-microsoft.costmanagement-tenant-retry-after",
+    "x-ms-ratelimit-microsoft.costmanagement-clienttype-retry-after",
+    "Retry-After",
+]
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int, now: float):
+        # rate is requests per minute
+        self.rate = rate / 60.0
+        self.tokens = float(burst)
+        self.capacity = float(burst)
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def reserve(self, now: float) -> float:
+        """
+        Take one token and return how long the caller has to wait for it.
+        Callers that arrive while the bucket is empty get consecutive slots.
+        """
+        start = max(now, self.blocked_until)
+        if start > self.updated:
+            self.tokens = min(
+                self.capacity, self.tokens + (start - self.updated) * self.rate
+            )
+            self.updated = start
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return start - now
+        return self.updated + (-self.tokens) / self.rate - now
+
+    def block(self, now: float, seconds: float):
+        # Nothing is refilled while blocked, so waiting callers are released
+        # one slot at a time instead of all at once.
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.updated = max(self.updated, self.blocked_until)
+        self.tokens = min(self.tokens, 1.0)
+
+
+class RequestScheduler:
+    """
+    Throttles calls per scope with token buckets and retries throttled or
+    failed calls, honoring the Retry-After headers of the response.
+    """
+
+    def __init__(
+        self,
+        rate: float = constants.DEFAULT_RATE_LIMIT,
+        burst: int = constants.DEFAULT_RATE_BURST,
+        max_retries: int = constants.DEFAULT_MAX_RETRIES,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        sleep=time.sleep,
+        clock=time.monotonic,
+        profiler=None,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._sleep = sleep
+        self._clock = clock
+        self.profiler = profiler or NULL_PROFILER
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "retried": 0, "waited": 0.0}
+
+    def call(self, scope: str, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            self._wait(scope)
+            with self._lock:
+                self.stats["requests"] += 1
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                # azure.core.exceptions.HttpResponseError, matched by its
+                # attributes to keep the SDK out of the import path.
+                if getattr(e, "status_code", None) not in RETRYABLE_STATUS_CODES:
+                    raise
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = get_retry_after(getattr(e, "response", None))
+                delay = self._backoff(attempt, retry_after)
+                with self._lock:
+                    if e.status_code == 429:
+                        self.stats["throttled"] += 1
+                        # Every caller on this scope waits, not only this one.
+                        self._get_bucket(scope).block(self._clock(), delay)
+                    self.stats["retried"] += 1
+                self.profiler.count("retries")
+                if e.status_code != 429:
+                    self._sleep_for(delay)
+                attempt += 1
+
+    def _wait(self, scope: str):
+        with self._lock:
+            wait = self._get_bucket(scope).reserve(self._clock())
+        self._sleep_for(wait)
+
+    def _sleep_for(self, seconds: float):
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.stats["waited"] += seconds
+        # Waits for the rate limit and for retries alike.
+        self.profiler.count("wait_seconds", seconds)
+        self._sleep(seconds)
+
+    def _backoff(self, attempt: int, retry_after: float = None) -> float:
+        # Jitter keeps concurrent callers from retrying in lockstep.
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def _get_bucket(self, scope: str) -> TokenBucket:
+        key = scope.lower()
+        if key not in self._buckets:
+            self._buckets[key] = TokenBucket(self.rate, self.burst, self._clock())
+        return self._buckets[key]
+
+
+def get_retry_after(response):
+    if response is None:
+        return None
+    values = []
+    for header in RETRY_AFTER_HEADERS:
+        value = response.headers.get(header)
+        if not value:
+            continue
+        try:
+            values.append(float(value))
+        except ValueError:
+            from email.utils import parsedate_to_datetime
+
+            try:
+                retry_at = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                continue
+            values.append(
+                max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+            )
+    return max(values) if values else None
@@ -0,0 +1,240 @@
+from collections import namedtuple, OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from . import constants
+from .core import Core
+from .filters import is_valid_dimension, parse_filters, parse_tags
+from .logger import get_logger
+
+Query = namedtuple(
+    "Query",
+    [
+        "subscription",
+        "resource_group",
+        "scopes",
+        "all_subscriptions",
+        "granularity",
+        "dimensions",
+        "ago",
+        "filters",
+        "tags",
+    ],
+    # ((name, (value, ...)), ...) so that queries can be dict keys.
+    defaults=((), ()),
+)
+
+TRUE_VALUES = {"1", "true", "yes"}
+
+
+def parse_query(params: dict) -> Query:
+    """
+    Build a Query from URL query parameters, named like the CLI options.
+    Raise ValueError for invalid values.
+    """
+
+    def get(name, default=None):
+        values = params.get(name)
+        return values[-1] if values else default
+
+    granularity = get("granularity", constants.DEFAULT_GRANULARITY).upper()
+    if granularity not in constants.AVAILABLE_GRANULARITY:
+        raise ValueError(f"Invalid granularity: {granularity}")
+    try:
+        ago = int(get("ago", constants.DEFAULT_AGO))
+    except ValueError:
+        raise ValueError(f"Invalid ago: {get('ago')}")
+    if ago < 0:
+        raise ValueError(f"Invalid ago: {ago}")
+    dimensions = tuple(params.get("dimensions", constants.DEFAULT_DIMENSIONS))
+    for dimension in dimensions:
+        if not is_valid_dimension(dimension):
+            raise ValueError(f"Invalid dimension: {dimension}")
+    filters = parse_filters(params.get("filter", []))
+    tags = parse_tags(params.get("tag", []))
+    return Query(
+        subscription=get("subscription"),
+        resource_group=get("resource_group"),
+        scopes=tuple(params.get("scope", [])),
+        all_subscriptions=get("all_subscriptions", "").lower() in TRUE_VALUES,
+        granularity=granularity,
+        dimensions=dimensions,
+        ago=ago,
+        filters=tuple((name, tuple(values)) for name, values in filters.items()),
+        tags=tuple((key, tuple(values)) for key, values in tags.items()),
+    )
+
+
+def make_core(query: Query, debug: bool = False, **core_options) -> Core:
+    return Core(
+        debug,
+        query.granularity,
+        list(query.dimensions),
+        query.subscription,
+        query.resource_group,
+        scopes=list(query.scopes),
+        all_subscriptions=query.all_subscriptions,
+        filters={name: list(values) for name, values in query.filters},
+        tags={key: list(values) for key, values in query.tags},
+        **core_options,
+    )
+
+
+def convert_json(core: Core, total_results, results) -> dict:
+    """
+    Return the pivoted result as a JSON-serializable dict.
+    """
+    pivot = core.pivot(total_results, results)
+    return {
+        "currency": pivot.currency or "USD",
+        "periods": sorted(pivot.periods),
+        "rows": [
+            {"scope": scope, "key": key, "costs": costs}
+            for scope, key, costs in (
+                [] if pivot.is_empty() else pivot.to_rows(core.format_key)
+            )
+        ],
+    }
+
+
+class CostServer:
+    """
+    Answers cost queries from warm clients. Results are kept in a bounded
+    LRU for ``ttl`` seconds, and identical queries that arrive while one is
+    running wait for its result instead of querying again.
+
+    ``core_factory(query)`` returns the Core for a query. The default
+    creates one with ``core_options`` (session, scheduler, cache, ...).
+    """
+
+    def __init__(
+        self,
+        debug: bool = False,
+        core_factory=None,
+        max_results: int = constants.DEFAULT_SERVER_MAX_RESULTS,
+        ttl: int = constants.DEFAULT_SERVER_TTL,
+        clock=time.monotonic,
+        **core_options,
+    ):
+        self.debug = debug
+        self.core_factory = core_factory or self._create_core
+        self.max_results = max_results
+        self.ttl = ttl
+        self.core_options = core_options
+        self.logger = get_logger(debug)
+        self._clock = clock
+        self._results = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    def get_usage(self, query: Query):
+        """
+        Return (core, total_results, results) for the query.
+        """
+        with self._lock:
+            entry = self._results.get(query)
+            if entry is not None and entry[0] > self._clock():
+                self._results.move_to_end(query)
+                self.stats["hits"] += 1
+                return entry[1]
+            future = self._in_flight.get(query)
+            owner = future is None
+            if owner:
+                future = self._in_flight[query] = Future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            core = self.core_factory(query)
+            value = (core,) + tuple(core.get_usage(query.ago))
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[query]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._in_flight[query]
+            self._results[query] = (self._clock() + self.ttl, value)
+            self._results.move_to_end(query)
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def query(self, query: Query, output_format: str = "json"):
+        """
+        Return the pivoted result as a JSON-serializable dict, or as the
+        text of the CLI when format is "table".
+        """
+        core, total_results, results = self.get_usage(query)
+        if output_format == "table":
+            return core.convert_tabulate(total_results, results)
+        return convert_json(core, total_results, results)
+
+    def make_server(self, host: str, port: int) -> ThreadingHTTPServer:
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.cost_server = self
+        return server
+
+    def _create_core(self, query: Query) -> Core:
+        return make_core(query, self.debug, **self.core_options)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    GET /cost    query parameters named like the CLI options, e.g.
+                 ?subscription=x&dimensions=ServiceName&granularity=DAILY&ago=7
+                 &filter=ServiceName=Storage,Bandwidth&tag=env=prod
+                 &format=table for the text of the CLI
+    GET /stats   result cache and scheduler counters
+    GET /healthz
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        cost_server = self.server.cost_server
+        if url.path == "/healthz":
+            return self._send(200, {"status": "ok"})
+        if url.path == "/stats":
+            stats = dict(cost_server.stats)
+            scheduler = cost_server.core_options.get("scheduler")
+            if scheduler is not None:
+                stats["scheduler"] = scheduler.stats
+            return self._send(200, stats)
+        if url.path != "/cost":
+            return self._send(404, {"error": f"Not found: {url.path}"})
+
+        params = parse_qs(url.query)
+        output_format = params.get("format", ["json"])[-1]
+        try:
+            result = cost_server.query(parse_query(params), output_format)
+        except ValueError as e:
+            return self._send(400, {"error": str(e)})
+        except Exception as e:
+            cost_server.logger.exception("query failed")
+            return self._send(502, {"error": str(e)})
+        self._send(200, result)
+
+    def _send(self, status: int, body):
+        if isinstance(body, str):
+            data = body.encode("utf-8")
+            content_type = "text/plain; charset=utf-8"
+        else:
+            data = json.dumps(body).encode("utf-8")
+            content_type = "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        self.server.cost_server.logger.debug(format, *args)
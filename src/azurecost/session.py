@@ -0,0 +1,253 @@
+import threading
+import time
+import uuid
+
+from . import constants
+from .profiler import NULL_PROFILER
+from .subscriptions import SubscriptionIndex
+
+CREDENTIAL_TYPES = ["default", "cli", "environment", "managed_identity", "none"]
+
+
+class CachingCredential:
+    """
+    Wraps a credential and reuses its access tokens until they are about
+    to expire. AzureCliCredential, for example, starts an `az` process for
+    every get_token call.
+    """
+
+    def __init__(self, credential, refresh_margin: int = 300, profiler=None):
+        self.credential = credential
+        self.refresh_margin = refresh_margin
+        self.profiler = profiler or NULL_PROFILER
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get_token(self, *scopes, claims=None, tenant_id=None, **kwargs):
+        if claims:
+            # A claims challenge always needs a new token.
+            return self.credential.get_token(
+                *scopes, claims=claims, tenant_id=tenant_id, **kwargs
+            )
+        key = (scopes, tenant_id)
+        with self._lock:
+            token = self._tokens.get(key)
+            if token is None or token.expires_on - self.refresh_margin < time.time():
+                with self.profiler.span("credential"):
+                    token = self.credential.get_token(
+                        *scopes, tenant_id=tenant_id, **kwargs
+                    )
+                self._tokens[key] = token
+            return token
+
+    def close(self):
+        if hasattr(self.credential, "close"):
+            self.credential.close()
+
+
+class StaticCredential:
+    """
+    Returns a placeholder token, for endpoints that do not check it such
+    as the emulator.
+    """
+
+    def get_token(self, *scopes, **kwargs):
+        from azure.core.credentials import AccessToken
+
+        return AccessToken("offline", int(time.time()) + 3600)
+
+
+class Session:
+    """
+    Owns the credential, one pooled HTTP transport and the API clients, so
+    that Core instances created one after another (e.g. one per request in
+    a service) do not pay for credential probing and TLS handshakes again.
+
+    ``endpoint`` replaces the Azure Resource Manager URL, e.g. with the
+    one of `azurecost emulate`. With ``record_dir``, every response is
+    also written to that directory, and with ``replay_dir`` the clients
+    answer from a recording without sending any request.
+    """
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(
+        self,
+        credential=None,
+        credential_type: str = "default",
+        persistent_token_cache: bool = False,
+        pool_size: int = constants.DEFAULT_MAX_WORKERS,
+        debug: bool = False,
+        subscription_cache_path: str = None,
+        subscription_ttl: int = constants.DEFAULT_SUBSCRIPTION_TTL,
+        profiler=None,
+        rollup_index=None,
+        endpoint: str = None,
+        record_dir: str = None,
+        replay_dir: str = None,
+    ):
+        self._credential = credential
+        self.credential_type = credential_type
+        self.persistent_token_cache = persistent_token_cache
+        self.pool_size = pool_size
+        self.debug = debug
+        self.profiler = profiler or NULL_PROFILER
+        # Results that later queries can be computed from, see rollup.py.
+        self.rollup_index = rollup_index
+        self.endpoint = endpoint
+        self.record_dir = record_dir
+        self.replay_dir = replay_dir
+        self._transport = None
+        self._cost_management_client = None
+        self._subscription_client = None
+        self.subscription_index = SubscriptionIndex(
+            self.get_subscription_client,
+            ttl=subscription_ttl,
+            path=subscription_cache_path,
+        )
+        self._lock = threading.RLock()
+
+    @classmethod
+    def default(cls):
+        """
+        Return the session shared by Core instances that are not given one.
+        """
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    @property
+    def credential(self):
+        with self._lock:
+            if self._credential is None:
+                self._credential = CachingCredential(
+                    self._create_credential(), profiler=self.profiler
+                )
+            return self._credential
+
+    @property
+    def transport(self):
+        with self._lock:
+            if self._transport is None:
+                from azure.core.pipeline.transport import RequestsTransport
+                import requests
+
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=self.pool_size, pool_maxsize=self.pool_size
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._transport = RequestsTransport(
+                    session=session, session_owner=False
+                )
+            return self._transport
+
+    def get_cost_management_client(self):
+        with self._lock:
+            if self._cost_management_client is None and self.replay_dir:
+                from .replay import ReplayCostManagementClient
+
+                self._cost_management_client = ReplayCostManagementClient(
+                    self.replay_dir
+                )
+            if self._cost_management_client is None:
+                from azure.mgmt.costmanagement import CostManagementClient
+
+                self._cost_management_client = CostManagementClient(
+                    self.credential,
+                    # ClientType header with unique UUID is required to prevent "429 Too Many Requests" errors.
+                    # Azure Cost Management API tracks clients by this header. Without a unique identifier,
+                    # multiple requests from the same client instance are treated as a single client,
+                    # causing rate limiting to be applied more aggressively and leading to 429 errors.
+                    # By using a unique UUID per client instance, each instance is tracked separately,
+                    # allowing rate limits to be distributed across instances rather than concentrated on one.
+                    headers={"ClientType": str(uuid.uuid4())},
+                    logging_enable=self.debug,  # Enable request/response logging for debugging
+                    transport=self.transport,
+                    # Throttled and failed responses are retried by the
+                    # RequestScheduler, per scope and within --max-retries.
+                    # Connection errors are still retried by the SDK.
+                    retry_status=0,
+                    **self._get_endpoint_options(),
+                )
+                if self.record_dir:
+                    from .replay import RecordingCostManagementClient
+
+                    self._cost_management_client = RecordingCostManagementClient(
+                        self._cost_management_client, self.record_dir
+                    )
+            return self._cost_management_client
+
+    def get_subscription_client(self):
+        with self._lock:
+            if self._subscription_client is None and self.replay_dir:
+                from .replay import ReplaySubscriptionClient
+
+                self._subscription_client = ReplaySubscriptionClient(self.replay_dir)
+            if self._subscription_client is None:
+                from azure.mgmt.resource import SubscriptionClient
+
+                # Subscription listings do not go through the RequestScheduler,
+                # so the SDK keeps retrying their throttled responses.
+                self._subscription_client = SubscriptionClient(
+                    credential=self.credential,
+                    transport=self.transport,
+                    **self._get_endpoint_options(),
+                )
+                if self.record_dir:
+                    from .replay import RecordingSubscriptionClient
+
+                    self._subscription_client = RecordingSubscriptionClient(
+                        self._subscription_client, self.record_dir
+                    )
+            return self._subscription_client
+
+    def _get_endpoint_options(self) -> dict:
+        if not self.endpoint:
+            return {}
+        options = {"base_url": self.endpoint.rstrip("/")}
+        if self.endpoint.lower().startswith("http://"):
+            options["authentication_policy"] = _get_http_authentication_policy(
+                self.credential
+            )
+        return options
+
+    def _create_credential(self):
+        import azure.identity
+
+        kwargs = {}
+        if self.persistent_token_cache:
+            kwargs["cache_persistence_options"] = (
+                azure.identity.TokenCachePersistenceOptions(name="azurecost")
+            )
+
+        # Creating a specific credential skips the probing of DefaultAzureCredential.
+        if self.credential_type == "cli":
+            # The Azure CLI keeps its own token cache.
+            return azure.identity.AzureCliCredential()
+        elif self.credential_type == "environment":
+            return azure.identity.EnvironmentCredential(**kwargs)
+        elif self.credential_type == "managed_identity":
+            return azure.identity.ManagedIdentityCredential()
+        elif self.credential_type == "default":
+            return azure.identity.DefaultAzureCredential(**kwargs)
+        elif self.credential_type == "none":
+            return StaticCredential()
+        raise ValueError(f"Unknown credential type '{self.credential_type}'.")
+
+
+def _get_http_authentication_policy(credential):
+    from azure.core.pipeline.policies import BearerTokenCredentialPolicy
+
+    class HttpBearerTokenCredentialPolicy(BearerTokenCredentialPolicy):
+        def on_request(self, request):
+            # Bearer tokens are only sent over https unless this is unset.
+            request.context.options["enforce_https"] = False
+            super().on_request(request)
+
+    return HttpBearerTokenCredentialPolicy(
+        credential, "https://management.azure.com/.default"
+    )
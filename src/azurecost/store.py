@@ -0,0 +1,97 @@
+from datetime import date, timedelta
+import hashlib
+import json
+import os
+import tempfile
+
+from . import constants
+from .cache import default_cache_dir
+from .date_util import DateUtil
+
+
+class CostStore:
+    """
+    Local store of usage rows that is kept up to date incrementally.
+
+    Each entry remembers the last date whose costs have settled, so a sync
+    only has to refetch the periods after it.
+    """
+
+    def __init__(self, store_dir: str = None, settle_days: int = constants.SETTLE_DAYS):
+        self.store_dir = store_dir or os.path.join(default_cache_dir(), "store")
+        self.settle_days = settle_days
+
+    def make_key(self, scope: str, payload: dict) -> str:
+        canonical = json.dumps(
+            {
+                "scope": scope.lower(),
+                "payload": {k: v for k, v in payload.items() if k != "time_period"},
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def load(self, key: str):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key: str, entry: dict):
+        os.makedirs(self.store_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, separators=(",", ":"))
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def plan(self, entry: dict, granularity: str, start: date, end: date):
+        """
+        Return the first date that has to be fetched, or None when the
+        stored rows already cover the whole window.
+        """
+        if entry is None or date.fromisoformat(entry["synced_from"]) > start:
+            return start
+        settled_until = date.fromisoformat(entry["settled_until"])
+        if settled_until >= end:
+            return None
+        return settled_until + timedelta(days=1)
+
+    def merge(
+        self,
+        entry: dict,
+        granularity: str,
+        start: date,
+        end: date,
+        fetch_from: date,
+        columns: list,
+        rows: list,
+    ) -> dict:
+        date_index = columns.index(DateUtil.get_date_column(granularity))
+        kept = []
+        synced_from = start
+        if entry is not None and date.fromisoformat(entry["synced_from"]) <= start:
+            synced_from = date.fromisoformat(entry["synced_from"])
+            kept = [
+                row
+                for row in entry["rows"]
+                if DateUtil.parse_date_key(row[date_index]) < fetch_from
+            ]
+        return {
+            "synced_from": synced_from.isoformat(),
+            "settled_until": min(end, self.get_settled_until(granularity)).isoformat(),
+            "columns": columns,
+            "rows": kept + list(rows),
+        }
+
+    def get_settled_until(self, granularity: str) -> date:
+        return DateUtil.get_settled_until(granularity, self.settle_days)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.store_dir, key + ".json")
@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from . import constants
+
+
+class SubscriptionIndex:
+    """
+    Index from subscription display name to subscription ID.
+
+    The index is built from one subscriptions.list() pass and refreshed
+    when it is older than ``ttl`` seconds or when a name is not found. When
+    ``path`` is given, the index is also kept on disk for other processes.
+    """
+
+    def __init__(
+        self,
+        get_client,
+        ttl: int = constants.DEFAULT_SUBSCRIPTION_TTL,
+        path: str = None,
+        min_refresh_interval: int = 60,
+    ):
+        self._get_client = get_client
+        self.ttl = ttl
+        self.path = path
+        self.min_refresh_interval = min_refresh_interval
+        self._subscriptions = None
+        self._updated_at = 0.0
+        self._lock = threading.Lock()
+
+    def resolve(self, names: list) -> dict:
+        """
+        Return a dict from each name to its subscription ID, or None when
+        the name is not found. At most one listing is sent for all names.
+        """
+        with self._lock:
+            by_name = self._get_by_name()
+            if any(name not in by_name for name in names) and (
+                time.time() - self._updated_at >= self.min_refresh_interval
+            ):
+                self._refresh()
+                by_name = self._get_by_name()
+            return {name: by_name.get(name, {}).get("id") for name in names}
+
+    def get(self, name: str):
+        return self.resolve([name])[name]
+
+    def list(self) -> list:
+        with self._lock:
+            self._get_by_name()
+            return list(self._subscriptions)
+
+    def _get_by_name(self) -> dict:
+        if (self._subscriptions is None or self._is_expired()) and self.path:
+            self._load()
+        if self._subscriptions is None or self._is_expired():
+            self._refresh()
+        by_name = {}
+        for subscription in self._subscriptions:
+            # Keep the first one when display names are not unique.
+            by_name.setdefault(subscription["name"], subscription)
+        return by_name
+
+    def _is_expired(self) -> bool:
+        return self._updated_at + self.ttl < time.time()
+
+    def _refresh(self):
+        self._subscriptions = [
+            {
+                "name": subscription.display_name,
+                "id": subscription.subscription_id,
+                # SubscriptionState is a str enum, keep only its value.
+                "state": getattr(subscription.state, "value", subscription.state),
+            }
+            for subscription in self._get_client().subscriptions.list()
+        ]
+        self._updated_at = time.time()
+        if self.path:
+            self._save()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._subscriptions = entry["subscriptions"]
+        self._updated_at = entry["updated_at"]
+
+    def _save(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "updated_at": self._updated_at,
+                        "subscriptions": self._subscriptions,
+                    },
+                    f,
+                )
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,168 @@
+from datetime import timedelta
+import json
+import os
+import pytest
+from unittest.mock import Mock, patch
+from azurecost.batch import BatchRunner, load_specs, make_query
+from azurecost.core import Core
+from azurecost.result import CostTable
+
+
+class FakeUsage:
+    """
+    Answers query.usage with one row per month of the requested window, for
+    every dimension value.
+    """
+
+    def __init__(self):
+        self.payloads = []
+
+    def __call__(self, scope, payload, **kwargs):
+        self.payloads.append(payload)
+        names = [g["name"] for g in payload["dataset"].get("grouping", [])]
+        start = payload["time_period"].from_property.date().replace(day=1)
+        end = payload["time_period"].to.date()
+        rows = []
+        month = start
+        while month <= end:
+            rows.append(
+                [10.0, month.strftime("%Y-%m-%dT00:00:00")] + ["x"] * len(names)
+            )
+            month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        usage = Mock()
+        usage.columns = []
+        for name in ["Cost", "BillingMonth"] + names:
+            col = Mock()
+            col.name = name
+            usage.columns.append(col)
+        usage.rows = rows
+        usage.next_link = None
+        return usage
+
+
+class TestLoadSpecs:
+    def test_json(self, tmp_path):
+        path = tmp_path / "specs.json"
+        path.write_text(json.dumps([{"ago": 3}]))
+        assert load_specs(str(path)) == [{"ago": 3}]
+
+    def test_yaml(self, tmp_path):
+        pytest.importorskip("yaml")
+        path = tmp_path / "specs.yaml"
+        path.write_text("- dimensions: [ServiceName]\n  ago: 3\n")
+        assert load_specs(str(path)) == [{"dimensions": ["ServiceName"], "ago": 3}]
+
+    def test_not_a_list(self, tmp_path):
+        path = tmp_path / "specs.json"
+        path.write_text(json.dumps({"ago": 3}))
+        with pytest.raises(ValueError):
+            load_specs(str(path))
+
+
+class TestMakeQuery:
+    def test_defaults_are_overridden(self):
+        query = make_query(
+            {"dimensions": ["ResourceGroup"], "ago": 3, "all_subscriptions": True},
+            {"subscription": "sub", "dimensions": ("ServiceName",), "ago": 1},
+        )
+        assert query.subscription == "sub"
+        assert query.dimensions == ("ResourceGroup",)
+        assert query.ago == 3
+        assert query.all_subscriptions
+
+    def test_filters(self):
+        query = make_query(
+            {"tag": ["env=prod"]},
+            {"filters": (("ServiceName", ("Storage", "Bandwidth")),), "tags": ()},
+        )
+        assert query.filters == (("ServiceName", ("Storage", "Bandwidth")),)
+        assert query.tags == (("env", ("prod",)),)
+
+    def test_scopes(self):
+        assert make_query({"scopes": ["a", "b/rg"]}).scopes == ("a", "b/rg")
+
+    def test_unknown_key(self):
+        with pytest.raises(ValueError, match="Unknown keys: dimension"):
+            make_query({"dimension": ["ServiceName"]})
+
+
+class TestBatchRunner:
+    def _make_runner(self, **kwargs):
+        self.usage = FakeUsage()
+        mock_client = Mock()
+        mock_client.query.usage.side_effect = self.usage
+
+        def core_factory(query):
+            with patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"}):
+                return Core(
+                    False,
+                    query.granularity,
+                    list(query.dimensions),
+                    cost_management_client=mock_client,
+                )
+
+        return BatchRunner(core_factory=core_factory, **kwargs)
+
+    def test_identical_queries_are_sent_once(self):
+        runner = self._make_runner()
+        query = make_query({"ago": 2})
+        outputs = runner.run([query, query])
+
+        assert len(self.usage.payloads) == 1
+        assert outputs[0][2] is outputs[1][2]
+
+    def test_narrower_windows_are_answered_from_wider(self):
+        runner = self._make_runner()
+        narrow, wide = make_query({"ago": 1}), make_query({"ago": 6})
+        (_, narrow_total, narrow_results), (_, wide_total, wide_results) = runner.run(
+            [narrow, wide]
+        )
+
+        assert len(self.usage.payloads) == 1
+        assert len(narrow_results) < len(wide_results)
+        assert isinstance(narrow_results, CostTable)
+        assert len(narrow_total) == len(narrow_results)
+        # The narrow window has the same rows as a query of its own.
+        runner = self._make_runner()
+        assert runner.run([narrow])[0][2] == narrow_results
+
+    def test_total_query_is_shared(self):
+        runner = self._make_runner(derive_total=False)
+        outputs = runner.run(
+            [
+                make_query({"dimensions": ["ServiceName"], "ago": 3}),
+                make_query({"dimensions": ["ResourceGroup"], "ago": 1}),
+            ]
+        )
+
+        grouped = [p for p in self.usage.payloads if "grouping" in p["dataset"]]
+        totals = [p for p in self.usage.payloads if "grouping" not in p["dataset"]]
+        assert len(grouped) == 2
+        assert len(totals) == 1
+        assert outputs[1][1].columns == ["Cost", "BillingMonth"]
+        assert len(outputs[1][1]) < len(outputs[0][1])
+
+    def test_write(self, tmp_path):
+        runner = self._make_runner()
+        echoed = []
+        runner.write(
+            [
+                {"ago": 2, "output": str(tmp_path / "out" / "a.txt")},
+                {"ago": 2, "format": "json", "output": str(tmp_path / "b.json")},
+                {"ago": 1},
+            ],
+            echo=echoed.append,
+        )
+
+        assert len(self.usage.payloads) == 1
+        assert "total" in (tmp_path / "out" / "a.txt").read_text()
+        assert (
+            json.loads((tmp_path / "b.json").read_text())["rows"][0]["key"] == "total"
+        )
+        assert len(echoed) == 1
+
+    def test_invalid_format(self):
+        runner = self._make_runner()
+        with pytest.raises(ValueError, match="Invalid format"):
+            runner.write([{"format": "xml"}])
+        assert self.usage.payloads == []
@@ -0,0 +1,165 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+from azure.mgmt.costmanagement.models import QueryTimePeriod
+from azurecost.cache import QueryCache
+from azurecost.core import Core
+from azurecost.date_util import DateUtil
+
+
+def make_payload(start, end, grouping=None):
+    payload = {
+        "type": "ActualCost",
+        "timeframe": "Custom",
+        "time_period": QueryTimePeriod(from_property=start, to=end),
+        "dataset": {
+            "granularity": "MONTHLY",
+            "aggregation": {"totalCost": {"name": "Cost", "function": "Sum"}},
+        },
+    }
+    if grouping:
+        payload["dataset"]["grouping"] = grouping
+    return payload
+
+
+class TestQueryCache:
+    def test_make_key_ignores_time_of_day(self, tmp_path):
+        cache = QueryCache(str(tmp_path))
+        start = datetime(2023, 8, 1, 3, 4, 5, tzinfo=timezone.utc)
+        end = datetime(2023, 9, 15, 6, 7, 8, tzinfo=timezone.utc)
+        key1 = cache.make_key("/subscriptions/x", make_payload(start, end))
+        key2 = cache.make_key(
+            "/subscriptions/x",
+            make_payload(start.replace(hour=9), end.replace(minute=59)),
+        )
+        assert key1 == key2
+
+    def test_make_key_depends_on_scope_and_payload(self, tmp_path):
+        cache = QueryCache(str(tmp_path))
+        start = datetime(2023, 8, 1, tzinfo=timezone.utc)
+        end = datetime(2023, 9, 15, tzinfo=timezone.utc)
+        payload = make_payload(start, end)
+        grouped = make_payload(
+            start, end, [{"type": "Dimension", "name": "ServiceName"}]
+        )
+        assert cache.make_key("/subscriptions/x", payload) != cache.make_key(
+            "/subscriptions/y", payload
+        )
+        assert cache.make_key("/subscriptions/x", payload) != cache.make_key(
+            "/subscriptions/x", grouped
+        )
+
+    def test_get_miss(self, tmp_path):
+        cache = QueryCache(str(tmp_path))
+        assert cache.get("missing") is None
+
+    def test_closed_entry_never_expires(self, tmp_path):
+        cache = QueryCache(str(tmp_path), ttl=0)
+        cache.set("key", ["Cost"], [[1.0]], closed=True)
+        with patch("azurecost.cache.time.time", return_value=time.time() + 10**9):
+            assert cache.get("key")["rows"] == [[1.0]]
+
+    def test_open_entry_expires(self, tmp_path):
+        cache = QueryCache(str(tmp_path), ttl=60)
+        cache.set("key", ["Cost"], [[1.0]])
+        assert cache.get("key") is not None
+        with patch("azurecost.cache.time.time", return_value=time.time() + 61):
+            assert cache.get("key") is None
+
+    def test_expired_entries_are_deleted(self, tmp_path):
+        cache = QueryCache(str(tmp_path), ttl=60)
+        cache.set("old", ["Cost"], [[1.0]])
+        cache.set("other", ["Cost"], [[1.0]])
+        cache.set("closed", ["Cost"], [[1.0]], closed=True)
+        later = time.time() + 61
+        with patch("azurecost.cache.time.time", return_value=later):
+            assert cache.get("old") is None
+            assert sorted(os.listdir(tmp_path)) == ["closed.json", "other.open.json"]
+            # Entries of other keys are deleted when an open entry is stored.
+            cache.set("new", ["Cost"], [[1.0]])
+        assert sorted(os.listdir(tmp_path)) == ["closed.json", "new.open.json"]
+
+    def test_split_at_settled_periods(self, tmp_path):
+        cache = QueryCache(str(tmp_path))
+        now = datetime.now(timezone.utc)
+        settled_until = DateUtil.get_settled_until("MONTHLY")
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        (closed_start, closed_end, closed), (open_start, open_end, is_closed) = (
+            cache.split(make_payload(start, now))
+        )
+        assert (closed_start, closed) == (start, True)
+        assert closed_end == datetime.combine(
+            settled_until, datetime.max.time(), tzinfo=timezone.utc
+        ).replace(microsecond=0)
+        assert open_start.date() == settled_until + timedelta(days=1)
+        assert open_start.day == 1
+        assert (open_end, is_closed) == (now, False)
+
+    def test_split_whole_window(self, tmp_path):
+        cache = QueryCache(str(tmp_path))
+        now = datetime.now(timezone.utc)
+        old = make_payload(now - timedelta(days=400), now - timedelta(days=300))
+        assert [part[2] for part in cache.split(old)] == [True]
+        recent = make_payload(now - timedelta(days=1), now)
+        assert [part[2] for part in cache.split(recent)] == [False]
+
+    def test_default_cache_dir_from_env(self, tmp_path):
+        with patch.dict(os.environ, {"AZURECOST_CACHE_DIR": str(tmp_path)}):
+            assert QueryCache().cache_dir == str(tmp_path)
+
+
+def _make_monthly_client():
+    def usage(scope, payload):
+        col1 = Mock()
+        col1.name = "BillingMonth"
+        col2 = Mock()
+        col2.name = "Cost"
+        result = Mock()
+        result.columns = [col1, col2]
+        start = payload["time_period"].from_property
+        result.rows = [[start.strftime("%Y-%m-01T00:00:00"), 492.77]]
+        result.next_link = None
+        return result
+
+    mock_client = Mock()
+    mock_client.query.usage.side_effect = usage
+    return mock_client
+
+
+@patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+def test_core_serves_second_run_from_cache(tmp_path):
+    mock_client = _make_monthly_client()
+    for _ in range(2):
+        core = Core(
+            False,
+            dimensions=["ServiceName"],
+            cost_management_client=mock_client,
+            cache=QueryCache(str(tmp_path)),
+        )
+        total_results, results = core.get_usage(ago=1)
+        assert [r["Cost"] for r in total_results] == [492.77, 492.77]
+
+    # The settled month and the open one are cached apart.
+    assert mock_client.query.usage.call_count == 2
+
+
+@patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+def test_core_only_refreshes_open_periods(tmp_path):
+    mock_client = _make_monthly_client()
+    core = Core(
+        False,
+        dimensions=["ServiceName"],
+        cost_management_client=mock_client,
+        cache=QueryCache(str(tmp_path), ttl=60),
+    )
+    first, _ = core.get_usage(ago=3)
+    assert mock_client.query.usage.call_count == 2
+
+    with patch("azurecost.cache.time.time", return_value=time.time() + 61):
+        total_results, _ = core.get_usage(ago=3)
+    assert mock_client.query.usage.call_count == 3
+    assert list(total_results) == list(first)
+    last = mock_client.query.usage.call_args[0][1]["time_period"]
+    assert last.from_property.day == 1
+    assert last.from_property.date() > DateUtil.get_settled_until("MONTHLY")
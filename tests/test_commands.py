@@ -1,4 +1,5 @@
 import pytest
+from datetime import date
 from unittest.mock import Mock, patch
 from azurecost import commands
 from azurecost import constants
@@ -19,8 +20,7 @@ def test_show_version(runner):
 @patch("azurecost.commands.Core")
 def test_cli_basic_usage(mock_core_class, runner):
     mock_core = Mock()
-    mock_core.get_usage.return_value = (
-        [{"BillingMonth": "2023-08-01T00:00:00", "Cost": 492.77}],
+    mock_core.iter_usage.return_value = iter(
         [
             {
                 "BillingMonth": "2023-08-01T00:00:00",
@@ -28,7 +28,7 @@ def test_cli_basic_usage(mock_core_class, runner):
                 "ServiceName": "Cognitive Services",
                 "Currency": "USD",
             }
-        ],
+        ]
     )
     mock_core.convert_tabulate.return_value = "test output"
     mock_core_class.return_value = mock_core
@@ -36,13 +36,13 @@ def test_cli_basic_usage(mock_core_class, runner):
     result = runner.invoke(commands.cli, ["-s", "test-subscription"])
     assert result.exit_code == 0
     assert "test output" in result.output
-    mock_core.get_usage.assert_called_once_with(1)
+    mock_core.iter_usage.assert_called_once_with(1)
 
 
 @patch("azurecost.commands.Core")
 def test_cli_with_debug(mock_core_class, runner):
     mock_core = Mock()
-    mock_core.get_usage.return_value = ([], [])
+    mock_core.iter_usage.return_value = iter([])
     mock_core.convert_tabulate.return_value = "test output"
     mock_core_class.return_value = mock_core
 
@@ -57,7 +57,7 @@ def test_cli_with_debug(mock_core_class, runner):
 @patch("azurecost.commands.Core")
 def test_cli_with_resource_group(mock_core_class, runner):
     mock_core = Mock()
-    mock_core.get_usage.return_value = ([], [])
+    mock_core.iter_usage.return_value = iter([])
     mock_core.convert_tabulate.return_value = "test output"
     mock_core_class.return_value = mock_core
 
@@ -71,7 +71,7 @@ def test_cli_with_resource_group(mock_core_class, runner):
 @patch("azurecost.commands.Core")
 def test_cli_with_dimensions(mock_core_class, runner):
     mock_core = Mock()
-    mock_core.get_usage.return_value = ([], [])
+    mock_core.iter_usage.return_value = iter([])
     mock_core.convert_tabulate.return_value = "test output"
     mock_core_class.return_value = mock_core
 
@@ -90,7 +90,7 @@ def test_cli_with_dimensions(mock_core_class, runner):
 @patch("azurecost.commands.Core")
 def test_cli_with_granularity(mock_core_class, runner):
     mock_core = Mock()
-    mock_core.get_usage.return_value = ([], [])
+    mock_core.iter_usage.return_value = iter([])
     mock_core.convert_tabulate.return_value = "test output"
     mock_core_class.return_value = mock_core
 
@@ -104,13 +104,13 @@ def test_cli_with_granularity(mock_core_class, runner):
 @patch("azurecost.commands.Core")
 def test_cli_with_ago(mock_core_class, runner):
     mock_core = Mock()
-    mock_core.get_usage.return_value = ([], [])
+    mock_core.iter_usage.return_value = iter([])
     mock_core.convert_tabulate.return_value = "test output"
     mock_core_class.return_value = mock_core
 
     result = runner.invoke(commands.cli, ["-s", "test-subscription", "-a", "3"])
     assert result.exit_code == 0
-    mock_core.get_usage.assert_called_once_with(3)
+    mock_core.iter_usage.assert_called_once_with(3)
 
 
 @patch("azurecost.commands.Core")
@@ -119,3 +119,328 @@ def test_cli_without_subscription_raises_error(mock_core_class, runner):
     mock_core_class.side_effect = ValueError("Subscription name is required.")
     result = runner.invoke(commands.cli, [])
     assert result.exit_code != 0
+
+
+@patch("azurecost.commands.Core")
+def test_cli_without_derive_total(mock_core_class, runner):
+    mock_core = Mock()
+    mock_core.get_usage.return_value = ([], [])
+    mock_core.convert_tabulate.return_value = "test output"
+    mock_core_class.return_value = mock_core
+
+    result = runner.invoke(
+        commands.cli, ["-s", "test-subscription", "--no-derive-total"]
+    )
+    assert result.exit_code == 0
+    mock_core.get_usage.assert_called_once_with(1)
+    mock_core.convert_tabulate.assert_called_once_with([], [], top=None, min_cost=None)
+
+
+@patch("azurecost.commands.Core")
+def test_cli_with_profile(mock_core_class, runner):
+    mock_core = Mock()
+    mock_core.iter_usage.return_value = iter([])
+    mock_core.convert_tabulate.return_value = "test output"
+    mock_core_class.return_value = mock_core
+
+    result = runner.invoke(commands.cli, ["-s", "test-subscription", "--profile"])
+    assert result.exit_code == 0
+    assert "test output" in result.stdout
+    assert "wall" in result.stderr
+    assert mock_core_class.call_args[1]["profiler"] is not None
+
+
+@patch("azurecost.server.CostServer")
+@patch("azurecost.commands.Core")
+def test_serve(mock_core_class, mock_server_class, runner):
+    mock_server = mock_server_class.return_value.make_server.return_value
+    mock_server.server_address = ("127.0.0.1", 8080)
+    mock_server.serve_forever.side_effect = KeyboardInterrupt
+
+    result = runner.invoke(
+        commands.cli, ["--rate-limit", "10", "serve", "--port", "8080"]
+    )
+    assert result.exit_code == 0
+    mock_core_class.assert_not_called()
+    mock_server_class.return_value.make_server.assert_called_once_with(
+        "127.0.0.1", 8080
+    )
+    kwargs = mock_server_class.call_args[1]
+    assert kwargs["scheduler"].rate == 10
+    assert kwargs["max_results"] == 128
+    mock_server.server_close.assert_called_once()
+
+
+@patch("azurecost.exporter.CostExporter")
+def test_export_defaults_to_group_query(mock_exporter_class, runner):
+    mock_server = mock_exporter_class.return_value.make_server.return_value
+    mock_server.server_address = ("127.0.0.1", 9464)
+    mock_server.serve_forever.side_effect = KeyboardInterrupt
+
+    result = runner.invoke(
+        commands.cli, ["-s", "test-subscription", "-g", "DAILY", "export"]
+    )
+    assert result.exit_code == 0
+    [(name, query)] = mock_exporter_class.call_args[0][0]
+    assert name == "default"
+    assert query.subscription == "test-subscription"
+    assert query.granularity == "DAILY"
+    mock_exporter_class.return_value.start.assert_called_once()
+
+
+def test_export_rejects_invalid_target(runner):
+    result = runner.invoke(commands.cli, ["export", "--target", "ago=x"])
+    assert result.exit_code == 2
+    assert "Invalid ago" in result.output
+
+
+@patch("azurecost.batch.BatchRunner")
+def test_batch(mock_runner_class, runner, tmp_path):
+    path = tmp_path / "specs.json"
+    path.write_text('[{"ago": 3}]')
+
+    result = runner.invoke(
+        commands.cli, ["-s", "test-subscription", "batch", str(path)]
+    )
+    assert result.exit_code == 0
+    specs, defaults = mock_runner_class.return_value.write.call_args[0]
+    assert specs == [{"ago": 3}]
+    assert defaults["subscription"] == "test-subscription"
+
+
+def test_batch_reports_invalid_specs(runner, tmp_path):
+    path = tmp_path / "specs.json"
+    path.write_text('{"ago": 3}')
+
+    result = runner.invoke(commands.cli, ["batch", str(path)])
+    assert result.exit_code == 1
+    assert "expected a list of query specs" in result.output
+
+
+@patch("azurecost.commands.Core")
+def test_cli_with_top_and_min_cost(mock_core_class, runner):
+    mock_core = Mock()
+    mock_core.iter_usage.return_value = iter([])
+    mock_core.convert_tabulate.return_value = "test output"
+    mock_core_class.return_value = mock_core
+
+    result = runner.invoke(
+        commands.cli, ["-s", "test-subscription", "--top", "50", "--min-cost", "1.5"]
+    )
+    assert result.exit_code == 0
+    kwargs = mock_core.convert_tabulate.call_args[1]
+    assert kwargs == {"top": 50, "min_cost": 1.5}
+
+
+@patch("azurecost.commands.Core")
+def test_cli_with_csv_output(mock_core_class, runner):
+    mock_core = Mock()
+    mock_core.iter_usage.return_value = iter([])
+    mock_core.derive_total = True
+    mock_core_class.return_value = mock_core
+
+    with patch("azurecost.output.write_pivot") as mock_write_pivot:
+        result = runner.invoke(
+            commands.cli, ["-s", "test-subscription", "--output", "csv"]
+        )
+    assert result.exit_code == 0
+    mock_core.convert_tabulate.assert_not_called()
+    args = mock_write_pivot.call_args[0]
+    assert args[1] is None
+    assert args[3] == "csv"
+
+
+@patch("azurecost.commands.Core")
+def test_cli_with_long_jsonl_output_file(mock_core_class, runner, tmp_path):
+    mock_core = Mock()
+    mock_core.iter_usage.return_value = iter([])
+    mock_core_class.return_value = mock_core
+    path = tmp_path / "costs.jsonl"
+
+    with patch("azurecost.output.write_long") as mock_write_long:
+        mock_write_long.side_effect = lambda core, results, fmt, f: f.write("{}\n")
+        result = runner.invoke(
+            commands.cli,
+            [
+                "-s",
+                "test-subscription",
+                "--output",
+                "jsonl",
+                "--layout",
+                "long",
+                "--output-file",
+                str(path),
+            ],
+        )
+    assert result.exit_code == 0
+    assert result.output == ""
+    assert path.read_text() == "{}\n"
+
+
+@patch("azurecost.commands.Core")
+def test_cli_with_columnar_output(mock_core_class, runner):
+    from azurecost.result import CostTable
+
+    table = CostTable.from_rows(
+        ["Cost", "BillingMonth", "ServiceName", "Currency"],
+        [[1.0, "2023-08-01T00:00:00", "Storage", "USD"]],
+    )
+    mock_core = Mock()
+    mock_core.get_usage.return_value = (CostTable([]), table)
+    mock_core_class.return_value = mock_core
+
+    result = runner.invoke(
+        commands.cli, ["-s", "test-subscription", "--output", "columnar"]
+    )
+    assert result.exit_code == 0
+    assert result.stdout_bytes.startswith(b"AZCOST1\n")
+
+
+@patch("azurecost.emulator.CostEmulator")
+def test_emulate(mock_emulator_class, runner):
+    mock_emulator_class.return_value.stats = {"requests": 0}
+    mock_server = mock_emulator_class.return_value.make_server.return_value
+    mock_server.server_address = ("127.0.0.1", 8100)
+    mock_server.serve_forever.side_effect = KeyboardInterrupt
+
+    result = runner.invoke(
+        commands.cli, ["emulate", "--page-size", "100", "--throttle-rate", "0.1"]
+    )
+    assert result.exit_code == 0
+    kwargs = mock_emulator_class.call_args[1]
+    assert kwargs["page_size"] == 100
+    assert kwargs["throttle_rate"] == 0.1
+    mock_server.server_close.assert_called_once()
+
+
+@patch("azurecost.commands.Core")
+def test_cli_with_endpoint_and_replay(mock_core_class, runner, tmp_path):
+    mock_core = Mock()
+    mock_core.iter_usage.return_value = iter([])
+    mock_core.convert_tabulate.return_value = "test output"
+    mock_core_class.return_value = mock_core
+
+    result = runner.invoke(
+        commands.cli,
+        ["--endpoint", "http://127.0.0.1:8100", "--replay", str(tmp_path)],
+    )
+    assert result.exit_code == 0
+    session = mock_core_class.call_args[1]["session"]
+    assert session.endpoint == "http://127.0.0.1:8100"
+    assert session.replay_dir == str(tmp_path)
+
+
+@patch("azurecost.commands.Core")
+def test_cli_with_filters_and_tags(mock_core_class, runner):
+    mock_core = Mock()
+    mock_core.iter_usage.return_value = iter([])
+    mock_core.convert_tabulate.return_value = "test output"
+    mock_core_class.return_value = mock_core
+
+    result = runner.invoke(
+        commands.cli,
+        [
+            "-s",
+            "test-subscription",
+            "--filter",
+            "ServiceName=Storage,Bandwidth",
+            "--tag",
+            "env=prod",
+            "--group-by-tag",
+            "team",
+        ],
+    )
+    assert result.exit_code == 0
+    args, kwargs = mock_core_class.call_args
+    assert args[2] == ("ServiceName", "tag:team")
+    assert kwargs["filters"] == {"ServiceName": ["Storage", "Bandwidth"]}
+    assert kwargs["tags"] == {"env": ["prod"]}
+
+
+def test_cli_with_invalid_filter(runner):
+    result = runner.invoke(commands.cli, ["--filter", "Nope=x"])
+    assert result.exit_code == 2
+    assert "Invalid dimension: Nope" in result.output
+
+
+@patch("azurecost.commands.Core")
+def test_cli_with_management_group(mock_core_class, runner):
+    mock_core = Mock()
+    mock_core.iter_usage.return_value = iter([])
+    mock_core.convert_tabulate.return_value = "test output"
+    mock_core_class.return_value = mock_core
+
+    result = runner.invoke(
+        commands.cli, ["--management-group", "mg", "-d", "SubscriptionName"]
+    )
+    assert result.exit_code == 0
+    kwargs = mock_core_class.call_args[1]
+    assert kwargs["management_group"] == "mg"
+    assert kwargs["billing_account"] is None
+
+
+def test_cli_with_billing_profile_without_account(runner):
+    result = runner.invoke(commands.cli, ["--billing-profile", "bp"])
+    assert result.exit_code == 2
+    assert "billing account" in result.output
+
+
+@patch("azurecost.commands.Core")
+def test_cli_with_from_and_to(mock_core_class, runner):
+    mock_core = Mock()
+    mock_core.iter_usage.return_value = iter([])
+    mock_core.convert_tabulate.return_value = "test output"
+    mock_core_class.return_value = mock_core
+
+    result = runner.invoke(
+        commands.cli,
+        [
+            "-s",
+            "test-subscription",
+            "--from",
+            "2023-07-15",
+            "--to",
+            "2023-09-10",
+            "--billing-timezone",
+            "+09:00",
+        ],
+    )
+    assert result.exit_code == 0
+    kwargs = mock_core_class.call_args[1]
+    assert kwargs["start_date"] == date(2023, 7, 15)
+    assert kwargs["end_date"] == date(2023, 9, 10)
+    assert kwargs["time_zone"] == "+09:00"
+
+
+def test_cli_with_from_after_to(runner):
+    result = runner.invoke(commands.cli, ["--from", "2023-09-10", "--to", "2023-07-15"])
+    assert result.exit_code == 2
+    assert "The window starts after it ends" in result.output
+
+
+def test_cli_with_from_after_today(runner):
+    result = runner.invoke(commands.cli, ["--from", "2099-01-01"])
+    assert result.exit_code == 2
+    assert "The window starts after it ends" in result.output
+
+
+def test_cli_with_negative_ago(runner):
+    result = runner.invoke(commands.cli, ["--ago", "-1"])
+    assert result.exit_code == 2
+    assert "--ago" in result.output
+
+
+def test_cli_with_invalid_billing_timezone(runner):
+    result = runner.invoke(commands.cli, ["--billing-timezone", "Nowhere/Nothing"])
+    assert result.exit_code == 2
+    assert "Unknown time zone" in result.output
+
+
+@pytest.mark.parametrize(
+    "args",
+    [["--scope", "sub"], ["--all-subscriptions"], ["--scope", "a", "--scope", "b"]],
+)
+def test_cli_with_management_group_and_scopes(runner, args):
+    result = runner.invoke(commands.cli, ["--management-group", "mg"] + args)
+    assert result.exit_code == 2
+    assert "can not be combined" in result.output
@@ -1,7 +1,8 @@
 import pytest
 import os
+from datetime import date, datetime, timedelta, timezone
 from unittest.mock import Mock, patch
-from azurecost.core import Core
+from azurecost.core import Core, make_scope_path
 
 
 class TestCoreConvertTabulate:
@@ -152,6 +153,28 @@ class TestCoreConvertTabulate:
         assert "Storage" in output
         assert "100" in output  # tabulate may format as integer
 
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_convert_tabulate_derives_total_from_iterator(self):
+        core = Core(
+            False,
+            granularity="DAILY",
+            dimensions=["ServiceName"],
+            cost_management_client=Mock(),
+        )
+
+        results = iter(
+            [
+                {"UsageDate": 20230902, "Cost": 2.0, "ServiceName": "Storage"},
+                {"UsageDate": 20230901, "Cost": 1.0, "ServiceName": "Storage"},
+                {"UsageDate": 20230902, "Cost": 3.0, "ServiceName": "Bandwidth"},
+            ]
+        )
+
+        lines = core.convert_tabulate(None, results).splitlines()
+        assert lines[0].split() == ["(USD)", "2023-09-01", "2023-09-02"]
+        assert lines[2].split() == ["total", "1", "5"]
+        assert lines[3].split() == ["Bandwidth", "3"]
+
     @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
     def test_convert_tabulate_rounds_to_two_decimals(self):
         core = Core(
@@ -234,17 +257,6 @@ class TestCoreGetSubscriptionId:
 class TestCoreGetUsage:
     @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
     def test_get_usage_monthly(self):
-        mock_col1 = Mock()
-        mock_col1.name = "BillingMonth"
-        mock_col2 = Mock()
-        mock_col2.name = "Cost"
-        mock_usage_total = Mock()
-        mock_usage_total.columns = [mock_col1, mock_col2]
-        mock_usage_total.rows = [
-            ["2023-08-01T00:00:00", 492.77],
-            ["2023-09-01T00:00:00", 80.28],
-        ]
-
         mock_col3 = Mock()
         mock_col3.name = "BillingMonth"
         mock_col4 = Mock()
@@ -258,8 +270,10 @@ class TestCoreGetUsage:
             ["2023-09-01T00:00:00", 80.28, "Cognitive Services"],
         ]
 
+        mock_usage_dimensions.next_link = None
+
         mock_client = Mock()
-        mock_client.query.usage.side_effect = [mock_usage_total, mock_usage_dimensions]
+        mock_client.query.usage.side_effect = [mock_usage_dimensions]
 
         core = Core(
             False,
@@ -276,21 +290,11 @@ class TestCoreGetUsage:
         assert len(results) == 2
         assert results[0]["ServiceName"] == "Cognitive Services"
 
-        # Verify API was called correctly
-        assert mock_client.query.usage.call_count == 2
+        # The total is derived from the grouped result.
+        assert mock_client.query.usage.call_count == 1
 
     @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
     def test_get_usage_daily(self):
-        mock_col1 = Mock()
-        mock_col1.name = "UsageDate"
-        mock_col2 = Mock()
-        mock_col2.name = "Cost"
-        mock_usage_total = Mock()
-        mock_usage_total.columns = [mock_col1, mock_col2]
-        mock_usage_total.rows = [
-            ["20230901", 10.5],
-        ]
-
         mock_col3 = Mock()
         mock_col3.name = "UsageDate"
         mock_col4 = Mock()
@@ -303,8 +307,10 @@ class TestCoreGetUsage:
             ["20230901", 10.5, "Storage"],
         ]
 
+        mock_usage_dimensions.next_link = None
+
         mock_client = Mock()
-        mock_client.query.usage.side_effect = [mock_usage_total, mock_usage_dimensions]
+        mock_client.query.usage.side_effect = [mock_usage_dimensions]
 
         core = Core(
             False,
@@ -322,16 +328,6 @@ class TestCoreGetUsage:
 
     @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
     def test_get_usage_with_resource_group(self):
-        mock_col1 = Mock()
-        mock_col1.name = "BillingMonth"
-        mock_col2 = Mock()
-        mock_col2.name = "Cost"
-        mock_usage_total = Mock()
-        mock_usage_total.columns = [mock_col1, mock_col2]
-        mock_usage_total.rows = [
-            ["2023-08-01T00:00:00", 100.0],
-        ]
-
         mock_col3 = Mock()
         mock_col3.name = "BillingMonth"
         mock_col4 = Mock()
@@ -344,8 +340,10 @@ class TestCoreGetUsage:
             ["2023-08-01T00:00:00", 100.0, "Storage"],
         ]
 
+        mock_usage_dimensions.next_link = None
+
         mock_client = Mock()
-        mock_client.query.usage.side_effect = [mock_usage_total, mock_usage_dimensions]
+        mock_client.query.usage.side_effect = [mock_usage_dimensions]
 
         core = Core(
             False,
@@ -362,17 +360,164 @@ class TestCoreGetUsage:
         assert "/resourceGroups/test-rg" in str(calls[0])
 
     @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
-    def test_get_usage_multiple_dimensions(self):
+    def test_get_usage_follows_next_link(self):
+        mock_col1 = Mock()
+        mock_col1.name = "BillingMonth"
+        mock_col2 = Mock()
+        mock_col2.name = "Cost"
+        mock_col3 = Mock()
+        mock_col3.name = "ServiceName"
+        mock_first_page = Mock()
+        mock_first_page.columns = [mock_col1, mock_col2, mock_col3]
+        mock_first_page.rows = [
+            ["2023-08-01T00:00:00", 100.0, "Storage"],
+        ]
+        mock_first_page.next_link = (
+            "https://management.azure.com/subscriptions/test-sub-id/providers/"
+            "Microsoft.CostManagement/query?api-version=2023-03-01&$skiptoken=abc"
+        )
+        mock_second_page = Mock()
+        mock_second_page.columns = [mock_col1, mock_col2, mock_col3]
+        mock_second_page.rows = [
+            ["2023-08-01T00:00:00", 150.0, "Bandwidth"],
+        ]
+        mock_second_page.next_link = None
+
+        mock_client = Mock()
+        mock_client.query.usage.side_effect = [mock_first_page, mock_second_page]
+
+        core = Core(
+            False,
+            granularity="MONTHLY",
+            dimensions=["ServiceName"],
+            cost_management_client=mock_client,
+        )
+
+        total_results, results = core.get_usage(ago=1)
+
+        assert [r["ServiceName"] for r in results] == ["Storage", "Bandwidth"]
+        assert total_results == [{"Cost": 250.0, "BillingMonth": "2023-08-01T00:00:00"}]
+        calls = mock_client.query.usage.call_args_list
+        assert calls[1][1] == {"params": {"$skiptoken": "abc"}}
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_get_usage_without_derive_total(self):
         mock_col1 = Mock()
         mock_col1.name = "BillingMonth"
         mock_col2 = Mock()
         mock_col2.name = "Cost"
+        mock_col3 = Mock()
+        mock_col3.name = "ServiceName"
+        mock_usage_dimensions = Mock()
+        mock_usage_dimensions.columns = [mock_col1, mock_col2, mock_col3]
+        mock_usage_dimensions.rows = [
+            ["2023-08-01T00:00:00", 100.0, "Storage"],
+        ]
+        mock_usage_dimensions.next_link = None
+
         mock_usage_total = Mock()
         mock_usage_total.columns = [mock_col1, mock_col2]
         mock_usage_total.rows = [
-            ["2023-08-01T00:00:00", 492.77],
+            ["2023-08-01T00:00:00", 250.0],
         ]
+        mock_usage_total.next_link = None
 
+        mock_client = Mock()
+        mock_client.query.usage.side_effect = [mock_usage_dimensions, mock_usage_total]
+
+        core = Core(
+            False,
+            granularity="MONTHLY",
+            dimensions=["ServiceName"],
+            cost_management_client=mock_client,
+            derive_total=False,
+        )
+
+        total_results, results = core.get_usage(ago=1)
+
+        assert mock_client.query.usage.call_count == 2
+        assert "grouping" not in mock_client.query.usage.call_args[0][1]["dataset"]
+        assert total_results == [{"BillingMonth": "2023-08-01T00:00:00", "Cost": 250.0}]
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_iter_usage_is_lazy(self):
+        mock_col1 = Mock()
+        mock_col1.name = "BillingMonth"
+        mock_col2 = Mock()
+        mock_col2.name = "Cost"
+        mock_col3 = Mock()
+        mock_col3.name = "ServiceName"
+        mock_first_page = Mock()
+        mock_first_page.columns = [mock_col1, mock_col2, mock_col3]
+        mock_first_page.rows = [
+            ["2023-08-01T00:00:00", 100.0, "Storage"],
+        ]
+        mock_first_page.next_link = "https://management.azure.com/query?$skiptoken=abc"
+        mock_second_page = Mock()
+        mock_second_page.columns = mock_first_page.columns
+        mock_second_page.rows = [
+            ["2023-08-01T00:00:00", 150.0, "Bandwidth"],
+        ]
+        mock_second_page.next_link = None
+
+        mock_client = Mock()
+        mock_client.query.usage.side_effect = [mock_first_page, mock_second_page]
+
+        core = Core(
+            False,
+            granularity="MONTHLY",
+            dimensions=["ServiceName"],
+            cost_management_client=mock_client,
+        )
+
+        rows = core.iter_usage(ago=1)
+        assert next(rows)["ServiceName"] == "Storage"
+        assert mock_client.query.usage.call_count == 1
+
+        output = core.convert_tabulate(None, rows)
+        assert mock_client.query.usage.call_count == 2
+        assert "Bandwidth" in output
+        # The first row was consumed before convert_tabulate.
+        assert "Storage" not in output
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_get_usage_derives_total_per_period(self):
+        mock_col1 = Mock()
+        mock_col1.name = "UsageDate"
+        mock_col2 = Mock()
+        mock_col2.name = "Cost"
+        mock_col3 = Mock()
+        mock_col3.name = "ServiceName"
+        mock_col4 = Mock()
+        mock_col4.name = "Currency"
+        mock_usage_dimensions = Mock()
+        mock_usage_dimensions.columns = [mock_col1, mock_col2, mock_col3, mock_col4]
+        mock_usage_dimensions.rows = [
+            [20230902, 1.5, "Storage", "USD"],
+            [20230901, 1.0, "Storage", "USD"],
+            [20230901, 2.0, "Bandwidth", "USD"],
+        ]
+        mock_usage_dimensions.next_link = None
+
+        mock_client = Mock()
+        mock_client.query.usage.side_effect = [mock_usage_dimensions]
+
+        core = Core(
+            False,
+            granularity="DAILY",
+            dimensions=["ServiceName"],
+            cost_management_client=mock_client,
+        )
+
+        total_results, _ = core.get_usage(ago=2)
+
+        assert total_results == [
+            {"Cost": 3.0, "UsageDate": 20230901, "Currency": "USD"},
+            {"Cost": 1.5, "UsageDate": 20230902, "Currency": "USD"},
+        ]
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_get_usage_multiple_dimensions(self):
         mock_col3 = Mock()
         mock_col3.name = "BillingMonth"
         mock_col4 = Mock()
@@ -388,8 +533,10 @@ class TestCoreGetUsage:
             ["2023-08-01T00:00:00", 211.77, "RG-2", "Cognitive Services"],
         ]
 
+        mock_usage_dimensions.next_link = None
+
         mock_client = Mock()
-        mock_client.query.usage.side_effect = [mock_usage_total, mock_usage_dimensions]
+        mock_client.query.usage.side_effect = [mock_usage_dimensions]
 
         core = Core(
             False,
@@ -403,3 +550,459 @@ class TestCoreGetUsage:
         assert len(results) == 2
         assert results[0]["ResourceGroup"] == "RG-1"
         assert results[0]["ServiceName"] == "Cognitive Services"
+
+
+class TestCoreChunking:
+    def _make_usage(self, rows):
+        usage = Mock()
+        usage.columns = []
+        for name in ["Cost", "UsageDate", "ServiceName"]:
+            col = Mock()
+            col.name = name
+            usage.columns.append(col)
+        usage.rows = rows
+        usage.next_link = None
+        return usage
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_get_usage_splits_daily_window_by_month(self):
+        def usage(scope, payload):
+            start = payload["time_period"].from_property
+            return self._make_usage([[1.0, int(start.strftime("%Y%m%d")), "Storage"]])
+
+        mock_client = Mock()
+        mock_client.query.usage.side_effect = usage
+
+        core = Core(
+            False,
+            granularity="DAILY",
+            dimensions=["ServiceName"],
+            cost_management_client=mock_client,
+        )
+        total_results, results = core.get_usage(ago=90)
+
+        starts = sorted(
+            call[0][1]["time_period"].from_property
+            for call in mock_client.query.usage.call_args_list
+        )
+        assert len(starts) >= 3
+        assert all(start.day == 1 for start in starts[1:])
+        # Rows are merged in the order of the chunks.
+        assert [r["UsageDate"] for r in results] == [
+            int(start.strftime("%Y%m%d")) for start in starts
+        ]
+        assert len(total_results) == len(starts)
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_chunks_in_flight_are_bounded(self):
+        def usage(scope, payload):
+            start = payload["time_period"].from_property
+            return self._make_usage([[1.0, int(start.strftime("%Y%m%d")), "Storage"]])
+
+        mock_client = Mock()
+        mock_client.query.usage.side_effect = usage
+
+        core = Core(
+            False,
+            granularity="DAILY",
+            dimensions=["ServiceName"],
+            cost_management_client=mock_client,
+            max_workers=2,
+            start_date=date(2023, 1, 1),
+            end_date=date(2023, 6, 30),
+        )
+        rows = core.iter_usage()
+        first = next(rows)
+        # Two chunks in flight, and one more once the first has been read.
+        assert mock_client.query.usage.call_count <= 3
+        assert [first["UsageDate"]] + [r["UsageDate"] for r in rows] == [
+            20230101,
+            20230201,
+            20230301,
+            20230401,
+            20230501,
+            20230601,
+        ]
+        assert mock_client.query.usage.call_count == 6
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_get_usage_monthly_is_not_split(self):
+        mock_client = Mock()
+        mock_client.query.usage.return_value = self._make_usage([])
+
+        core = Core(
+            False,
+            granularity="MONTHLY",
+            dimensions=["ServiceName"],
+            cost_management_client=mock_client,
+        )
+        core.get_usage(ago=6)
+
+        assert mock_client.query.usage.call_count == 1
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_get_usage_without_chunking(self):
+        mock_client = Mock()
+        mock_client.query.usage.return_value = self._make_usage([])
+
+        core = Core(
+            False,
+            granularity="DAILY",
+            dimensions=["ServiceName"],
+            cost_management_client=mock_client,
+            chunk_by_month=False,
+        )
+        core.get_usage(ago=90)
+
+        assert mock_client.query.usage.call_count == 1
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_split_windows_are_calendar_months(self):
+        mock_client = Mock()
+        mock_client.query.usage.return_value = self._make_usage([])
+
+        core = Core(
+            False,
+            granularity="DAILY",
+            dimensions=["ServiceName"],
+            cost_management_client=mock_client,
+            start_date=date(2023, 7, 15),
+            end_date=date(2023, 9, 10),
+        )
+        core.get_usage()
+
+        windows = sorted(
+            (
+                call[0][1]["time_period"].from_property.isoformat(),
+                call[0][1]["time_period"].to.isoformat(),
+            )
+            for call in mock_client.query.usage.call_args_list
+        )
+        # Chunks of later windows are the same months, and so cache keys.
+        assert windows == [
+            ("2023-07-15T00:00:00+00:00", "2023-07-31T23:59:59+00:00"),
+            ("2023-08-01T00:00:00+00:00", "2023-08-31T23:59:59+00:00"),
+            ("2023-09-01T00:00:00+00:00", "2023-09-10T23:59:59+00:00"),
+        ]
+
+
+class TestCoreWindow:
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_get_window_with_dates(self):
+        core = Core(
+            False,
+            granularity="MONTHLY",
+            cost_management_client=Mock(),
+            start_date=date(2023, 7, 15),
+            end_date=date(2023, 8, 20),
+        )
+        start, end = core.get_window(ago=6)
+        assert start == datetime(2023, 7, 1, tzinfo=timezone.utc)
+        assert end == datetime(2023, 8, 31, 23, 59, 59, tzinfo=timezone.utc)
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_get_window_in_time_zone(self):
+        core = Core(False, cost_management_client=Mock(), time_zone="+14:00")
+        _, end = core.get_window()
+        assert end.date() == datetime.now(timezone(timedelta(hours=14))).date()
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_invalid_time_zone(self):
+        with pytest.raises(ValueError):
+            Core(False, cost_management_client=Mock(), time_zone="Nowhere/Nothing")
+
+
+class TestCoreMultiScope:
+    def _make_usage(self, columns, rows):
+        usage = Mock()
+        usage.columns = []
+        for name in columns:
+            col = Mock()
+            col.name = name
+            usage.columns.append(col)
+        usage.rows = rows
+        usage.next_link = None
+        return usage
+
+    def _make_subscription(self, name, subscription_id, state="Enabled"):
+        subscription = Mock()
+        subscription.display_name = name
+        subscription.subscription_id = subscription_id
+        subscription.state = state
+        return subscription
+
+    def test_get_scopes_resolves_names_in_one_listing(self):
+        mock_subscription_client = Mock()
+        mock_subscription_client.subscriptions.list.return_value = [
+            self._make_subscription("sub-a", "id-a"),
+            self._make_subscription("sub-b", "id-b"),
+        ]
+        subscription_id = "00000000-0000-0000-0000-000000000000"
+
+        core = Core(
+            False,
+            cost_management_client=Mock(),
+            subscription_client=mock_subscription_client,
+            scopes=["sub-a", "sub-b/rg-1", subscription_id],
+        )
+
+        assert [scope.path for scope in core.scopes] == [
+            "/subscriptions/id-a",
+            "/subscriptions/id-b/resourceGroups/rg-1",
+            "/subscriptions/" + subscription_id,
+        ]
+        assert mock_subscription_client.subscriptions.list.call_count == 1
+
+    def test_get_scopes_all_subscriptions_skips_disabled(self):
+        mock_subscription_client = Mock()
+        mock_subscription_client.subscriptions.list.return_value = [
+            self._make_subscription("sub-a", "id-a"),
+            self._make_subscription("sub-b", "id-b", state="Disabled"),
+        ]
+
+        core = Core(
+            False,
+            cost_management_client=Mock(),
+            subscription_client=mock_subscription_client,
+            all_subscriptions=True,
+        )
+
+        assert [scope.name for scope in core.scopes] == ["sub-a"]
+
+    def test_get_scopes_not_found(self):
+        mock_subscription_client = Mock()
+        mock_subscription_client.subscriptions.list.return_value = []
+
+        with pytest.raises(ValueError, match="Subscription 'sub-x' not found"):
+            Core(
+                False,
+                cost_management_client=Mock(),
+                subscription_client=mock_subscription_client,
+                scopes=["sub-x"],
+            )
+
+    def test_get_usage_merges_scopes(self):
+        mock_subscription_client = Mock()
+        mock_subscription_client.subscriptions.list.return_value = [
+            self._make_subscription("sub-a", "id-a"),
+            self._make_subscription("sub-b", "id-b"),
+        ]
+
+        def usage(scope, payload):
+            cost = 1.0 if scope == "/subscriptions/id-a" else 2.0
+            if "grouping" in payload["dataset"]:
+                return self._make_usage(
+                    ["Cost", "BillingMonth", "ServiceName", "Currency"],
+                    [[cost, "2023-08-01T00:00:00", "Storage", "USD"]],
+                )
+            return self._make_usage(
+                ["Cost", "BillingMonth"], [[cost, "2023-08-01T00:00:00"]]
+            )
+
+        mock_client = Mock()
+        mock_client.query.usage.side_effect = usage
+
+        core = Core(
+            False,
+            dimensions=["ServiceName"],
+            cost_management_client=mock_client,
+            subscription_client=mock_subscription_client,
+            scopes=["sub-a", "sub-b"],
+            max_workers=2,
+        )
+        total_results, results = core.get_usage(ago=1)
+
+        assert [r["Scope"] for r in results] == ["sub-a", "sub-b"]
+        assert [r["Cost"] for r in results] == [1.0, 2.0]
+        output = core.convert_tabulate(total_results, results)
+        assert "Scope" in output
+        assert "sub-a" in output
+        assert "sub-b" in output
+        # Totals of all scopes are summed.
+        assert "3" in output.splitlines()[2]
+
+
+class TestCoreFilters:
+    def _make_usage(self, names, rows):
+        usage = Mock()
+        usage.columns = []
+        for name in names:
+            col = Mock()
+            col.name = name
+            usage.columns.append(col)
+        usage.rows = rows
+        usage.next_link = None
+        return usage
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_filter_is_sent_with_both_queries(self):
+        mock_client = Mock()
+        mock_client.query.usage.side_effect = [
+            self._make_usage(["Cost", "BillingMonth", "ServiceName"], []),
+            self._make_usage(["Cost", "BillingMonth"], []),
+        ]
+        core = Core(
+            False,
+            cost_management_client=mock_client,
+            derive_total=False,
+            filters={"ServiceName": ["Storage"]},
+            tags={"env": ["prod"]},
+        )
+        core.get_usage(ago=1)
+
+        expected = {
+            "and": [
+                {
+                    "dimensions": {
+                        "name": "ServiceName",
+                        "operator": "In",
+                        "values": ["Storage"],
+                    }
+                },
+                {"tags": {"name": "env", "operator": "In", "values": ["prod"]}},
+            ]
+        }
+        for call in mock_client.query.usage.call_args_list:
+            assert call[0][1]["dataset"]["filter"] == expected
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_group_by_tag(self):
+        mock_client = Mock()
+        mock_client.query.usage.return_value = self._make_usage(
+            ["Cost", "BillingMonth", "ServiceName", "TagKey", "TagValue", "Currency"],
+            [
+                [1.0, "2023-08-01T00:00:00", "Storage", "env", "prod", "USD"],
+                [2.0, "2023-08-01T00:00:00", "Storage", "env", "", "USD"],
+            ],
+        )
+        core = Core(
+            False,
+            dimensions=["ServiceName", "tag:env"],
+            cost_management_client=mock_client,
+        )
+        total_results, results = core.get_usage(ago=1)
+
+        grouping = mock_client.query.usage.call_args[0][1]["dataset"]["grouping"]
+        assert grouping[1] == {"type": "TagKey", "name": "env"}
+        assert results.column("tag:env") == ["prod", ""]
+        output = core.convert_tabulate(total_results, results)
+        assert "Storage, prod" in output
+
+    def test_only_one_tag_can_be_grouped(self):
+        with pytest.raises(ValueError, match="only one tag"):
+            Core(
+                False,
+                dimensions=["tag:env", "tag:team"],
+                cost_management_client=Mock(),
+            )
+
+
+class TestCoreBillingScopes:
+    @pytest.mark.parametrize(
+        "kwargs, path",
+        [
+            (
+                {"management_group": "mg"},
+                "/providers/Microsoft.Management/managementGroups/mg",
+            ),
+            (
+                {"billing_account": "ba"},
+                "/providers/Microsoft.Billing/billingAccounts/ba",
+            ),
+            (
+                {"billing_account": "ba", "billing_profile": "bp"},
+                "/providers/Microsoft.Billing/billingAccounts/ba/billingProfiles/bp",
+            ),
+            ({}, None),
+        ],
+    )
+    def test_make_scope_path(self, kwargs, path):
+        assert make_scope_path(**kwargs) == path
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {"billing_profile": "bp"},
+            {"management_group": "mg", "billing_account": "ba"},
+        ],
+    )
+    def test_make_scope_path_invalid(self, kwargs):
+        with pytest.raises(ValueError):
+            make_scope_path(**kwargs)
+
+    def test_management_group_is_one_query(self):
+        usage = Mock()
+        usage.columns = []
+        for name in ["Cost", "BillingMonth", "SubscriptionName", "Currency"]:
+            col = Mock()
+            col.name = name
+            usage.columns.append(col)
+        usage.rows = [
+            [1.0, "2023-08-01T00:00:00", "sub-a", "USD"],
+            [2.0, "2023-08-01T00:00:00", "sub-b", "USD"],
+        ]
+        usage.next_link = None
+        mock_client = Mock()
+        mock_client.query.usage.return_value = usage
+        subscription_client = Mock()
+
+        core = Core(
+            False,
+            dimensions=["SubscriptionName"],
+            cost_management_client=mock_client,
+            subscription_client=subscription_client,
+            management_group="mg",
+        )
+        total_results, results = core.get_usage(ago=1)
+
+        subscription_client.subscriptions.list.assert_not_called()
+        assert mock_client.query.usage.call_count == 1
+        assert (
+            mock_client.query.usage.call_args[0][0]
+            == "/providers/Microsoft.Management/managementGroups/mg"
+        )
+        assert results.column("SubscriptionName") == ["sub-a", "sub-b"]
+        assert total_results[0]["Cost"] == 3.0
+
+    def test_keys_keep_subscriptions_above_subscription_scope(self):
+        core = Core(False, cost_management_client=Mock(), billing_account="ba")
+        key = ("/subscriptions/sub-a/resourcegroups/rg/providers/x/y",)
+        assert core.format_key(None, key) == key[0]
+
+    def test_scope_paths(self):
+        subscription_client = Mock()
+        core = Core(
+            False,
+            cost_management_client=Mock(),
+            subscription_client=subscription_client,
+            scopes=[
+                "/providers/Microsoft.Management/managementGroups/mg",
+                "/subscriptions/sub-a/resourceGroups/rg",
+            ],
+        )
+        subscription_client.subscriptions.list.assert_not_called()
+        assert [(s.path, s.subscription_id, s.resource_group) for s in core.scopes] == [
+            ("/providers/Microsoft.Management/managementGroups/mg", None, None),
+            ("/subscriptions/sub-a/resourceGroups/rg", "sub-a", "rg"),
+        ]
+        key = ("/subscriptions/sub-a/resourcegroups/rg/providers/x/y",)
+        assert core.format_key(core.scopes[1].name, key) == "/providers/x/y"
+        assert core.get_scope_label(core.scopes[1].name) == core.scopes[1].name
+        # The total row of multiple scopes has no scope.
+        assert core.get_scope_label(None) == ""
+
+    def test_scope_label_without_scopes(self):
+        core = Core(False, cost_management_client=Mock(), management_group="mg")
+        assert (
+            core.get_scope_label(None)
+            == "/providers/Microsoft.Management/managementGroups/mg"
+        )
+
+    def test_billing_scope_with_scopes(self):
+        with pytest.raises(ValueError, match="can not be combined"):
+            Core(
+                False,
+                cost_management_client=Mock(),
+                scopes=["sub"],
+                management_group="mg",
+            )
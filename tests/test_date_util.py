@@ -1,4 +1,6 @@
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
+import pytest
+
 from azurecost.date_util import DateUtil
 
 
@@ -17,10 +19,10 @@ class TestDateUtil:
         assert isinstance(start, datetime)
         assert isinstance(end, datetime)
         assert start.day == 1
-        # Should be approximately 3 months ago (actual days vary by month lengths)
-        # Range accounts for different month lengths (28-31 days per month)
-        diff = end - start
-        assert 85 <= diff.days <= 110
+        # Three whole calendar months before the current one, until today.
+        today = datetime.now(timezone.utc).date()
+        assert (today.year * 12 + today.month) - (start.year * 12 + start.month) == 3
+        assert end.date() == today
 
     def test_get_start_and_end_daily(self):
         start, end = DateUtil.get_start_and_end("DAILY", 1)
@@ -39,3 +41,104 @@ class TestDateUtil:
         # Should be approximately 7 days ago
         diff = end - start
         assert 6 <= diff.days <= 8
+
+    def test_parse_date_key(self):
+        assert DateUtil.parse_date_key("2023-08-01T00:00:00") == date(2023, 8, 1)
+        assert DateUtil.parse_date_key(20230901) == date(2023, 9, 1)
+
+    def test_is_settled(self):
+        today = datetime.now(timezone.utc).date()
+        assert DateUtil.is_settled(today - timedelta(days=30))
+        assert not DateUtil.is_settled(today)
+
+    def test_split_by_month(self):
+        start = datetime(2023, 7, 15, 12, 0, tzinfo=timezone.utc)
+        end = datetime(2023, 9, 10, 8, 0, tzinfo=timezone.utc)
+        chunks = DateUtil.split_by_month(start, end)
+        assert chunks == [
+            (start, datetime(2023, 7, 31, 23, 59, 59, tzinfo=timezone.utc)),
+            (
+                datetime(2023, 8, 1, tzinfo=timezone.utc),
+                datetime(2023, 8, 31, 23, 59, 59, tzinfo=timezone.utc),
+            ),
+            (datetime(2023, 9, 1, tzinfo=timezone.utc), end),
+        ]
+
+    def test_split_by_month_single_month(self):
+        start = datetime(2023, 12, 1, tzinfo=timezone.utc)
+        end = datetime(2023, 12, 31, tzinfo=timezone.utc)
+        assert DateUtil.split_by_month(start, end) == [(start, end)]
+
+    def test_get_start_and_end_is_aligned_to_days(self):
+        start, end = DateUtil.get_start_and_end("DAILY", 7)
+        assert (start.hour, start.minute, start.second, start.microsecond) == (
+            0,
+            0,
+            0,
+            0,
+        )
+        assert (end.hour, end.minute, end.second) == (23, 59, 59)
+        # The same query gets the same window.
+        assert DateUtil.get_start_and_end("DAILY", 7) == (start, end)
+
+    def test_get_start_and_end_crosses_years(self):
+        start, end = DateUtil.get_start_and_end(
+            "MONTHLY", 3, end_date=date(2024, 2, 10)
+        )
+        assert start == datetime(2023, 11, 1, tzinfo=timezone.utc)
+        assert end == datetime(2024, 2, 29, 23, 59, 59, tzinfo=timezone.utc)
+
+    def test_get_start_and_end_with_dates(self):
+        start, end = DateUtil.get_start_and_end(
+            "DAILY", 1, start_date=date(2023, 7, 15), end_date=date(2023, 9, 10)
+        )
+        assert start == datetime(2023, 7, 15, tzinfo=timezone.utc)
+        assert end == datetime(2023, 9, 10, 23, 59, 59, tzinfo=timezone.utc)
+
+        start, end = DateUtil.get_start_and_end(
+            "MONTHLY", 1, start_date=date(2023, 7, 15), end_date=date(2023, 9, 10)
+        )
+        assert start == datetime(2023, 7, 1, tzinfo=timezone.utc)
+        assert end == datetime(2023, 9, 30, 23, 59, 59, tzinfo=timezone.utc)
+
+    def test_get_start_and_end_monthly_does_not_end_after_today(self):
+        today = datetime.now(timezone.utc).date()
+        _, end = DateUtil.get_start_and_end("MONTHLY", 1, end_date=today)
+        assert end.date() == today
+
+    def test_get_start_and_end_invalid_window(self):
+        with pytest.raises(ValueError):
+            DateUtil.get_start_and_end(
+                "DAILY", 1, start_date=date(2023, 9, 2), end_date=date(2023, 9, 1)
+            )
+
+    def test_get_start_and_end_uses_the_dates_of_the_time_zone(self):
+        tz = timezone(timedelta(hours=14))
+        _, end = DateUtil.get_start_and_end("DAILY", 1, tz)
+        assert end.date() == datetime.now(tz).date()
+        # The dates are sent to the API as they are.
+        assert end.tzinfo == timezone.utc
+
+    @pytest.mark.parametrize(
+        "name, offset",
+        [
+            (None, timedelta(0)),
+            ("UTC", timedelta(0)),
+            ("+09:00", timedelta(hours=9)),
+            ("-0530", timedelta(hours=-5, minutes=-30)),
+        ],
+    )
+    def test_get_timezone(self, name, offset):
+        assert DateUtil.get_timezone(name).utcoffset(None) == offset
+
+    def test_get_timezone_invalid(self):
+        with pytest.raises(ValueError):
+            DateUtil.get_timezone("Nowhere/Nothing")
+
+    def test_get_periods(self):
+        assert list(
+            DateUtil.get_periods("MONTHLY", date(2023, 11, 15), date(2024, 1, 2))
+        ) == [date(2023, 11, 1), date(2023, 12, 1), date(2024, 1, 1)]
+        assert list(
+            DateUtil.get_periods("DAILY", date(2023, 12, 31), date(2024, 1, 1))
+        ) == [date(2023, 12, 31), date(2024, 1, 1)]
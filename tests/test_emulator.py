@@ -0,0 +1,203 @@
+import json
+import os
+import threading
+import pytest
+from unittest.mock import patch
+from azure.core.exceptions import HttpResponseError
+from azurecost.core import Core
+from azurecost.emulator import CostEmulator
+from azurecost.scheduler import RequestScheduler
+from azurecost.session import Session
+
+SUBSCRIPTION_ID = "00000000-0000-0000-0000-000000000000"
+QUERY_URL = (
+    f"/subscriptions/{SUBSCRIPTION_ID}/providers/Microsoft.CostManagement/query"
+    "?api-version=2025-03-01"
+)
+
+
+def _make_body(grouping=True, granularity="DAILY"):
+    body = {
+        "type": "ActualCost",
+        "timeframe": "Custom",
+        "timePeriod": {
+            "from": "2023-09-01T00:00:00Z",
+            "to": "2023-09-03T00:00:00Z",
+        },
+        "dataset": {"granularity": granularity},
+    }
+    if grouping:
+        body["dataset"]["grouping"] = [{"type": "Dimension", "name": "ServiceName"}]
+    return json.dumps(body).encode("utf-8")
+
+
+@pytest.fixture
+def emulator_url():
+    emulator = CostEmulator(rows_per_period=30, page_size=40, subscriptions=2)
+    server = emulator.make_server("127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield emulator, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestCostEmulator:
+    def test_pages(self):
+        emulator = CostEmulator(rows_per_period=30, page_size=40)
+        status, _, first = emulator.handle("POST", QUERY_URL, _make_body())
+        assert status == 200
+        properties = first["properties"]
+        assert [c["name"] for c in properties["columns"]] == [
+            "Cost",
+            "UsageDate",
+            "ServiceName",
+            "Currency",
+        ]
+        assert len(properties["rows"]) == 40
+        assert "$skiptoken=40" in properties["nextLink"]
+
+        _, _, second = emulator.handle("POST", properties["nextLink"], _make_body())
+        _, _, third = emulator.handle(
+            "POST", second["properties"]["nextLink"], _make_body()
+        )
+        assert len(third["properties"]["rows"]) == 10
+        assert third["properties"]["nextLink"] is None
+
+    def test_rows_are_deterministic_and_match_totals(self):
+        emulator = CostEmulator(rows_per_period=10, page_size=1000)
+        grouped = emulator.handle("POST", QUERY_URL, _make_body())[2]
+        again = CostEmulator(rows_per_period=10, page_size=1000).handle(
+            "POST", QUERY_URL, _make_body()
+        )[2]
+        total = emulator.handle("POST", QUERY_URL, _make_body(grouping=False))[2]
+        rows = grouped["properties"]["rows"]
+        assert rows == again["properties"]["rows"]
+        assert total["properties"]["rows"][0][0] == pytest.approx(
+            sum(row[0] for row in rows if row[1] == 20230901)
+        )
+
+    def test_throttle_rate(self):
+        emulator = CostEmulator(throttle_rate=0.25, retry_after=3)
+        statuses = [
+            emulator.handle("POST", QUERY_URL, _make_body())[0] for _ in range(8)
+        ]
+        assert statuses.count(429) == 2
+        assert emulator.stats["throttled"] == 2
+        throttled = CostEmulator(throttle_rate=1, retry_after=3)
+        status, headers, _ = throttled.handle("POST", QUERY_URL, _make_body())
+        assert status == 429
+        assert headers["Retry-After"] == "3"
+
+    def test_latency(self):
+        sleeps = []
+        emulator = CostEmulator(latency=0.5, sleep=sleeps.append)
+        emulator.handle("GET", "/subscriptions", b"")
+        assert sleeps == [0.5]
+
+    def test_invalid_requests(self):
+        emulator = CostEmulator()
+        assert emulator.handle("GET", "/unknown", b"")[0] == 404
+        assert emulator.handle("POST", QUERY_URL, b"{}")[0] == 400
+        assert emulator.handle("POST", QUERY_URL, _make_body(granularity="X"))[0] == 400
+
+
+class TestSessionWithEmulator:
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": SUBSCRIPTION_ID})
+    def test_core_follows_pages(self, emulator_url):
+        emulator, url = emulator_url
+        session = Session(credential_type="none", endpoint=url)
+        core = Core(False, "DAILY", ["ServiceName"], session=session)
+        _, results = core.get_usage(2)
+        assert len(results) == 90
+        assert emulator.stats["rows"] == 90
+
+    def test_all_subscriptions(self, emulator_url):
+        emulator, url = emulator_url
+        session = Session(credential_type="none", endpoint=url)
+        core = Core(
+            False, "MONTHLY", ["ServiceName"], session=session, all_subscriptions=True
+        )
+        assert [scope.name for scope in core.scopes] == [
+            "subscription-0",
+            "subscription-1",
+        ]
+        _, results = core.get_usage(1)
+        assert set(results.column("Scope")) == {"subscription-0", "subscription-1"}
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": SUBSCRIPTION_ID})
+    def test_throttled_requests_raise_after_retries(self, emulator_url):
+        emulator, url = emulator_url
+        emulator.throttle_rate = 1
+        emulator.retry_after = 0.01
+        session = Session(credential_type="none", endpoint=url)
+        core = Core(
+            False,
+            "DAILY",
+            ["ServiceName"],
+            session=session,
+            scheduler=RequestScheduler(max_retries=1, sleep=lambda seconds: None),
+        )
+        with pytest.raises(HttpResponseError):
+            core.get_usage(2)
+        # Every throttled response reaches the scheduler.
+        assert emulator.stats["requests"] == core.scheduler.stats["requests"] == 2
+        # The last one is raised instead of retried.
+        assert core.scheduler.stats["retried"] == 1
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": SUBSCRIPTION_ID})
+    def test_throttled_requests_are_retried_by_the_scheduler(self, emulator_url):
+        emulator, url = emulator_url
+        emulator.throttle_rate = 0.5
+        emulator.retry_after = 0.01
+        session = Session(credential_type="none", endpoint=url)
+        core = Core(
+            False,
+            "DAILY",
+            ["ServiceName"],
+            session=session,
+            scheduler=RequestScheduler(max_retries=5, sleep=lambda seconds: None),
+        )
+        _, results = core.get_usage(2)
+        assert len(results) == 90
+        assert emulator.stats["requests"] == core.scheduler.stats["requests"]
+        assert core.scheduler.stats["throttled"] == emulator.stats["throttled"] >= 1
+        assert core.scheduler.stats["retried"] == emulator.stats["throttled"]
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": SUBSCRIPTION_ID})
+    def test_filter_and_tag_grouping(self, emulator_url):
+        emulator, url = emulator_url
+        session = Session(credential_type="none", endpoint=url)
+        core = Core(
+            False,
+            "DAILY",
+            ["ServiceName", "tag:env"],
+            session=session,
+            filters={"ServiceName": ["servicename-1", "servicename-2"]},
+            derive_total=False,
+        )
+        total_results, results = core.get_usage(2)
+        assert set(results.column("ServiceName")) <= {"servicename-1", "servicename-2"}
+        assert all(value.startswith("env-") for value in results.column("tag:env"))
+        # The total query is filtered the same way.
+        assert sum(total_results.column("Cost")) == pytest.approx(
+            sum(results.column("Cost"))
+        )
+
+    def test_management_group_covers_every_subscription(self, emulator_url):
+        emulator, url = emulator_url
+        session = Session(credential_type="none", endpoint=url)
+        core = Core(
+            False,
+            "MONTHLY",
+            ["SubscriptionName"],
+            session=session,
+            management_group="mg",
+        )
+        _, results = core.get_usage(1)
+        assert set(results.column("SubscriptionName")) == {
+            "subscription-0",
+            "subscription-1",
+        }
+        # One query in two pages, without listing subscriptions.
+        assert emulator.stats["requests"] == 2
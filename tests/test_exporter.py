@@ -0,0 +1,119 @@
+import os
+import threading
+import pytest
+from unittest.mock import Mock, patch
+from urllib.request import urlopen
+from azurecost.core import Core
+from azurecost.exporter import CostExporter, get_label_name, parse_target
+
+
+def _make_usage():
+    usage = Mock()
+    usage.columns = []
+    for name in ["Cost", "BillingMonth", "ServiceName", "Currency"]:
+        col = Mock()
+        col.name = name
+        usage.columns.append(col)
+    usage.rows = [
+        [100.0, "2023-08-01T00:00:00", "Storage", "USD"],
+        [50.0, "2023-08-01T00:00:00", 'Band"width', "USD"],
+    ]
+    usage.next_link = None
+    return usage
+
+
+class TestParseTarget:
+    def test_named_target(self):
+        name, query = parse_target(
+            "name=daily&dimensions=ServiceName&granularity=DAILY"
+        )
+        assert name == "daily"
+        assert query.granularity == "DAILY"
+        assert query.dimensions == ("ServiceName",)
+
+    def test_name_defaults_to_target(self):
+        assert parse_target("ago=3")[0] == "ago=3"
+
+    def test_invalid_target(self):
+        with pytest.raises(ValueError):
+            parse_target("granularity=HOURLY")
+
+    def test_label_name(self):
+        assert get_label_name("ServiceName") == "service_name"
+        assert get_label_name("ResourceId") == "resource_id"
+        assert get_label_name("tag:cost-center") == "tag_cost_center"
+
+
+class TestCostExporter:
+    def _make_exporter(self, **kwargs):
+        self.mock_client = Mock()
+        self.mock_client.query.usage.side_effect = lambda *a, **k: _make_usage()
+
+        def core_factory(query):
+            with patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"}):
+                return Core(
+                    False,
+                    query.granularity,
+                    list(query.dimensions),
+                    cost_management_client=self.mock_client,
+                )
+
+        return CostExporter(
+            [parse_target("name=monthly")],
+            core_factory=core_factory,
+            clock=lambda: 1000.0,
+            **kwargs,
+        )
+
+    def test_snapshot_before_refresh_has_no_samples(self):
+        exporter = self._make_exporter()
+        assert "# TYPE azurecost_cost gauge" in exporter.snapshot
+        assert "azurecost_cost{" not in exporter.snapshot
+        self.mock_client.query.usage.assert_not_called()
+
+    def test_refresh_publishes_gauges(self):
+        exporter = self._make_exporter()
+        exporter.refresh()
+
+        lines = exporter.snapshot.splitlines()
+        assert (
+            'azurecost_cost{target="monthly",scope="/subscriptions/test-sub-id",'
+            'granularity="MONTHLY",service_name="Storage",period="2023-08",'
+            'currency="USD"} 100.0'
+        ) in lines
+        assert any('service_name="Band\\"width"' in line for line in lines)
+        assert (
+            'azurecost_total_cost{target="monthly",scope="/subscriptions/test-sub-id",'
+            'granularity="MONTHLY",period="2023-08",currency="USD"} 150.0'
+        ) in lines
+        assert 'azurecost_refresh_success{target="monthly"} 1' in lines
+
+    def test_failed_refresh_keeps_samples(self):
+        exporter = self._make_exporter()
+        exporter.refresh()
+        self.mock_client.query.usage.side_effect = RuntimeError("boom")
+        exporter.refresh()
+
+        lines = exporter.snapshot.splitlines()
+        assert 'azurecost_refresh_success{target="monthly"} 0' in lines
+        assert any(line.startswith("azurecost_total_cost{") for line in lines)
+
+    def test_scrapes_do_not_query(self):
+        exporter = self._make_exporter(interval=3600)
+        exporter.start()
+        server = exporter.make_server("127.0.0.1", 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            while "azurecost_cost{" not in exporter.snapshot:
+                pass
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            for _ in range(3):
+                with urlopen(url) as res:
+                    assert res.headers["Content-Type"].startswith("text/plain")
+                    assert b"azurecost_total_cost{" in res.read()
+        finally:
+            server.shutdown()
+            server.server_close()
+            exporter.stop()
+        assert self.mock_client.query.usage.call_count == 1
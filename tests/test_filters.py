@@ -0,0 +1,82 @@
+import pytest
+from azurecost.filters import (
+    get_dimension,
+    make_filter,
+    make_grouping,
+    parse_filters,
+    parse_tags,
+    rename_tag_columns,
+)
+
+
+class TestParse:
+    def test_filters_are_merged(self):
+        assert parse_filters(
+            ["ServiceName=Storage,Bandwidth", "ServiceName=Storage", "ResourceGroup=rg"]
+        ) == {"ServiceName": ["Storage", "Bandwidth"], "ResourceGroup": ["rg"]}
+
+    def test_tags(self):
+        assert parse_tags(["env=prod, stg", "team=a"]) == {
+            "env": ["prod", "stg"],
+            "team": ["a"],
+        }
+
+    @pytest.mark.parametrize("value", ["ServiceName", "ServiceName=", "=Storage"])
+    def test_invalid_assignment(self, value):
+        with pytest.raises(ValueError, match="expected NAME=VALUE"):
+            parse_filters([value])
+
+    def test_invalid_dimension(self):
+        with pytest.raises(ValueError, match="Invalid dimension: Nope"):
+            parse_filters(["Nope=x"])
+
+
+class TestMakeFilter:
+    def test_without_conditions(self):
+        assert make_filter() is None
+        assert make_filter({}, {}) is None
+
+    def test_single_condition(self):
+        assert make_filter({"ServiceName": ["Storage"]}) == {
+            "dimensions": {
+                "name": "ServiceName",
+                "operator": "In",
+                "values": ["Storage"],
+            }
+        }
+
+    def test_conditions_are_combined_with_and(self):
+        assert make_filter({"ServiceName": ["Storage"]}, {"env": ["prod"]}) == {
+            "and": [
+                {
+                    "dimensions": {
+                        "name": "ServiceName",
+                        "operator": "In",
+                        "values": ["Storage"],
+                    }
+                },
+                {"tags": {"name": "env", "operator": "In", "values": ["prod"]}},
+            ]
+        }
+
+
+class TestGrouping:
+    def test_tag_grouping(self):
+        grouping = make_grouping(["ServiceName", "tag:env"])
+        assert grouping == [
+            {"type": "Dimension", "name": "ServiceName"},
+            {"type": "TagKey", "name": "env"},
+        ]
+        assert [get_dimension(g) for g in grouping] == ["ServiceName", "tag:env"]
+
+    def test_rename_tag_columns(self):
+        columns = ["Cost", "UsageDate", "TagKey", "TagValue", "Currency"]
+        assert rename_tag_columns(columns, ["tag:env"]) == [
+            "Cost",
+            "UsageDate",
+            "TagKey",
+            "tag:env",
+            "Currency",
+        ]
+        assert rename_tag_columns(["Cost", "env"], ["tag:env"]) == ["Cost", "tag:env"]
+        assert rename_tag_columns(columns, ["ServiceName"]) == columns
@@ -0,0 +1,44 @@
+import logging
+import os
+from unittest.mock import patch
+from azurecost.logger import get_logger, Summary
+from azurecost.result import CostTable
+
+
+class Unformattable:
+    def __str__(self):
+        raise AssertionError("formatted while debug logging is off")
+
+
+class TestSummary:
+    def _make_table(self, n):
+        return CostTable.from_rows(
+            ["Cost", "ServiceName"], [[float(i), f"service-{i}"] for i in range(n)]
+        )
+
+    def test_not_formatted_when_debug_is_off(self):
+        logger = get_logger(False)
+        logger.debug("results = %s", Summary(Unformattable()))
+
+    def test_table_is_summarized(self):
+        assert str(Summary(self._make_table(1000))) == (
+            "1000 rows, columns=['Cost', 'ServiceName']"
+        )
+
+    @patch.dict(os.environ, {"AZURECOST_LOG_SAMPLE_ROWS": "2"})
+    def test_rows_are_sampled(self):
+        text = str(Summary(self._make_table(1000)))
+        assert "first 2 rows=" in text
+        assert "service-1'" in text
+        assert "service-2'" not in text
+
+    def test_long_values_are_cut(self):
+        text = str(Summary({"filter": "x" * 5000}, max_length=100))
+        assert len(text) < 150
+        assert text.endswith("chars)")
+
+    def test_formatted_when_debug_is_on(self, caplog):
+        logger = get_logger(True)
+        with caplog.at_level(logging.DEBUG, logger=logger.name):
+            logger.debug("results = %s", Summary(self._make_table(3)))
+        assert "results = 3 rows" in caplog.text
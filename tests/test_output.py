@@ -0,0 +1,111 @@
+import io
+import json
+import os
+import pytest
+from unittest.mock import Mock, patch
+from azurecost.core import Core
+from azurecost.output import get_long_columns, write_long, write_pivot
+
+RESULTS = [
+    {
+        "UsageDate": 20230901,
+        "Cost": 1.5,
+        "ServiceName": "Storage",
+        "Currency": "JPY",
+    },
+    {
+        "UsageDate": 20230902,
+        "Cost": 2.0,
+        "ServiceName": "Storage",
+        "Currency": "JPY",
+    },
+    {
+        "UsageDate": 20230902,
+        "Cost": 3.0,
+        "ServiceName": "Bandwidth",
+        "Currency": "JPY",
+    },
+]
+
+
+@pytest.fixture
+def core():
+    with patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"}):
+        return Core(
+            False,
+            granularity="DAILY",
+            dimensions=["ServiceName"],
+            cost_management_client=Mock(),
+        )
+
+
+class TestWriteLong:
+    def test_csv(self, core):
+        f = io.StringIO()
+        write_long(core, iter(RESULTS), "csv", f)
+        assert f.getvalue().splitlines() == [
+            "Period,ServiceName,Cost,Currency",
+            "2023-09-01,Storage,1.5,JPY",
+            "2023-09-02,Storage,2.0,JPY",
+            "2023-09-02,Bandwidth,3.0,JPY",
+        ]
+
+    def test_jsonl(self, core):
+        f = io.StringIO()
+        write_long(core, iter(RESULTS), "jsonl", f)
+        lines = [json.loads(line) for line in f.getvalue().splitlines()]
+        assert lines[0] == {
+            "Period": "2023-09-01",
+            "ServiceName": "Storage",
+            "Cost": 1.5,
+            "Currency": "JPY",
+        }
+        assert len(lines) == 3
+
+    def test_rows_are_written_as_they_are_read(self, core):
+        f = io.StringIO()
+
+        def results():
+            yield RESULTS[0]
+            # The header and the first row are written before the next page.
+            assert f.getvalue().count("\n") == 2
+            yield RESULTS[1]
+
+        write_long(core, results(), "csv", f)
+        assert f.getvalue().count("\n") == 3
+
+    def test_scope_column(self, core):
+        core.scopes = []
+        assert get_long_columns(core)[0] == "Scope"
+        f = io.StringIO()
+        write_long(core, [dict(RESULTS[0], Scope="sub-a")], "csv", f)
+        assert f.getvalue().splitlines()[1] == "sub-a,2023-09-01,Storage,1.5,JPY"
+
+
+class TestWritePivot:
+    def test_csv(self, core):
+        f = io.StringIO()
+        write_pivot(core, None, iter(RESULTS), "csv", f)
+        assert f.getvalue().splitlines() == [
+            "Key,Currency,2023-09-01,2023-09-02",
+            "total,JPY,1.5,5.0",
+            "Bandwidth,JPY,,3.0",
+            "Storage,JPY,1.5,2.0",
+        ]
+
+    def test_jsonl_with_top(self, core):
+        f = io.StringIO()
+        write_pivot(core, None, iter(RESULTS), "jsonl", f, top=1)
+        lines = [json.loads(line) for line in f.getvalue().splitlines()]
+        assert [line["key"] for line in lines] == ["total", "Bandwidth", "others"]
+        assert lines[1] == {
+            "scope": None,
+            "key": "Bandwidth",
+            "currency": "JPY",
+            "costs": {"2023-09-02": 3.0},
+        }
+
+    def test_empty(self, core):
+        f = io.StringIO()
+        write_pivot(core, None, iter([]), "csv", f)
+        assert f.getvalue() == "Key,Currency\n"
@@ -0,0 +1,88 @@
+from azurecost.pivot import Pivot
+from azurecost.result import CostTable
+
+COLUMNS = ["UsageDate", "Cost", "ServiceName", "Currency"]
+ROWS = [
+    {"UsageDate": 20230902, "Cost": 2.0, "ServiceName": "Storage", "Currency": "JPY"},
+    {"UsageDate": 20230901, "Cost": 1.0, "ServiceName": "Storage", "Currency": "JPY"},
+    {"UsageDate": 20230901, "Cost": 0.5, "ServiceName": "Storage", "Currency": "JPY"},
+    {"UsageDate": 20230902, "Cost": 3.0, "ServiceName": "Bandwidth", "Currency": "JPY"},
+]
+
+
+class TestPivot:
+    def test_add_rows_with_total(self):
+        pivot = Pivot("DAILY", ["ServiceName"])
+        pivot.add_rows(iter(ROWS), with_total=True)
+
+        assert pivot.currency == "JPY"
+        assert pivot.to_rows() == [
+            (None, "total", {"2023-09-01": 1.5, "2023-09-02": 5.0}),
+            (None, "Bandwidth", {"2023-09-02": 3.0}),
+            (None, "Storage", {"2023-09-01": 1.5, "2023-09-02": 2.0}),
+        ]
+
+    def test_add_table_matches_add_rows(self):
+        table = CostTable.from_rows(COLUMNS, [[r[c] for c in COLUMNS] for r in ROWS])
+        from_rows = Pivot("DAILY", ["ServiceName"])
+        from_rows.add_rows(ROWS, with_total=True)
+        from_table = Pivot("DAILY", ["ServiceName"])
+        from_table.add_table(table, with_total=True)
+
+        assert from_table.to_rows() == from_rows.to_rows()
+        assert from_table.currency == "JPY"
+
+    def test_add_totals(self):
+        pivot = Pivot("MONTHLY", ["ServiceName"])
+        pivot.add_totals(
+            [
+                {"BillingMonth": "2023-08-01T00:00:00", "Cost": 1.0},
+                {"BillingMonth": "2023-08-01T00:00:00", "Cost": 2.0},
+            ]
+        )
+        assert pivot.to_rows() == [(None, "total", {"2023-08": 3.0})]
+
+    def test_dates_are_parsed_once(self):
+        pivot = Pivot("DAILY", ["ServiceName"])
+        pivot.add_rows(ROWS * 100)
+        assert pivot.periods == ["2023-09-02", "2023-09-01"]
+        assert len(pivot.keys) == 3
+
+    def test_format_key_is_called_once_per_key(self):
+        calls = []
+
+        def format_key(scope, key):
+            calls.append(key)
+            return ", ".join(key).lower()
+
+        pivot = Pivot("DAILY", ["ServiceName"])
+        pivot.add_rows(ROWS * 10, with_total=True)
+        rows = pivot.to_rows(format_key)
+        assert sorted(calls) == [("Bandwidth",), ("Storage",), ("total",)]
+        assert [label for _, label, _ in rows] == ["total", "bandwidth", "storage"]
+
+    def test_is_empty(self):
+        pivot = Pivot("DAILY", ["ServiceName"])
+        assert pivot.is_empty()
+        pivot.add_rows(ROWS)
+        assert not pivot.is_empty()
+
+    def test_top_adds_others(self):
+        pivot = Pivot("DAILY", ["ServiceName"])
+        pivot.add_rows(iter(ROWS), with_total=True)
+        assert pivot.to_rows(top=1) == [
+            (None, "total", {"2023-09-01": 1.5, "2023-09-02": 5.0}),
+            (None, "Bandwidth", {"2023-09-02": 3.0}),
+            (None, "others", {"2023-09-01": 1.5, "2023-09-02": 2.0}),
+        ]
+
+    def test_min_cost(self):
+        pivot = Pivot("DAILY", ["ServiceName"])
+        pivot.add_rows(iter(ROWS), with_total=True)
+        rows = pivot.to_rows(min_cost=2.5)
+        assert [label for _, label, _ in rows] == ["total", "Bandwidth", "others"]
+
+    def test_top_without_dropped_keys(self):
+        pivot = Pivot("DAILY", ["ServiceName"])
+        pivot.add_rows(iter(ROWS), with_total=True)
+        assert pivot.to_rows(top=5) == pivot.to_rows()
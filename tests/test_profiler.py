@@ -0,0 +1,134 @@
+import os
+from unittest.mock import Mock, patch
+from azurecost.core import Core
+from azurecost.profiler import NULL_PROFILER, Profiler
+from azurecost.scheduler import RequestScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProfiler:
+    def test_span_records_calls_and_time(self):
+        clock = FakeClock()
+        profiler = Profiler(clock=clock)
+        for _ in range(2):
+            with profiler.span("query.usage"):
+                clock.now += 1.5
+
+        assert profiler.spans == {"query.usage": (2, 3.0)}
+
+    def test_span_is_recorded_on_error(self):
+        profiler = Profiler()
+        try:
+            with profiler.span("render"):
+                raise ValueError()
+        except ValueError:
+            pass
+
+        assert profiler.spans["render"][0] == 1
+
+    def test_counters_and_callback(self):
+        events = []
+        profiler = Profiler(callback=lambda *event: events.append(event))
+        profiler.count("rows", 10)
+        profiler.count("rows", 5)
+        with profiler.span("pivot"):
+            pass
+
+        assert profiler.counters == {"rows": 15}
+        assert events[:2] == [("counter", "rows", 10), ("counter", "rows", 5)]
+        assert events[2][:2] == ("span", "pivot")
+
+    def test_report(self):
+        profiler = Profiler()
+        with profiler.span("query.usage"):
+            pass
+        profiler.count("bytes", 2048)
+        profiler.count("wait_seconds", 1.25)
+
+        report = profiler.report()
+        assert "query.usage" in report
+        assert "2048" in report
+        assert "1.250" in report
+        assert "wall" in report
+
+    def test_null_profiler_does_nothing(self):
+        with NULL_PROFILER.span("query.usage") as span:
+            assert span is NULL_PROFILER.span("pivot")
+        NULL_PROFILER.count("rows", 10)
+        assert not NULL_PROFILER.enabled
+
+
+class TestProfiledCore:
+    def _make_usage(self):
+        usage = Mock()
+        usage.columns = []
+        for name in ["Cost", "BillingMonth", "ServiceName"]:
+            col = Mock()
+            col.name = name
+            usage.columns.append(col)
+        usage.rows = [[100.0, "2023-08-01T00:00:00", "Storage"]] * 3
+        usage.next_link = None
+        return usage
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_stages_are_profiled(self):
+        def usage(scope, payload, raw_response_hook=None):
+            response = Mock()
+            response.http_response.body.return_value = b"x" * 100
+            raw_response_hook(response)
+            return self._make_usage()
+
+        mock_client = Mock()
+        mock_client.query.usage.side_effect = usage
+        profiler = Profiler()
+        core = Core(
+            False,
+            dimensions=["ServiceName"],
+            cost_management_client=mock_client,
+            profiler=profiler,
+        )
+
+        core.convert_tabulate(*core.get_usage(1))
+
+        assert set(profiler.spans) >= {
+            "subscriptions",
+            "query.usage",
+            "materialize",
+            "pivot",
+            "render",
+        }
+        assert profiler.counters["rows"] == 3
+        assert profiler.counters["bytes"] == 100
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_hook_is_not_passed_when_disabled(self):
+        mock_client = Mock()
+        mock_client.query.usage.return_value = self._make_usage()
+        core = Core(False, cost_management_client=mock_client)
+
+        core.get_usage(1)
+
+        assert "raw_response_hook" not in mock_client.query.usage.call_args[1]
+
+    def test_scheduler_counts_waits_and_retries(self):
+        error = Exception()
+        error.status_code = 503
+        error.response = None
+        func = Mock(side_effect=[error, "ok"])
+        profiler = Profiler()
+        scheduler = RequestScheduler(
+            max_retries=1, sleep=lambda seconds: None, profiler=profiler
+        )
+
+        with patch("azurecost.scheduler.random.uniform", return_value=0.5):
+            assert scheduler.call("scope", func) == "ok"
+
+        assert profiler.counters["retries"] == 1
+        assert profiler.counters["wait_seconds"] == 0.5
@@ -0,0 +1,190 @@
+import os
+import threading
+import pytest
+from collections import Counter
+from datetime import date, datetime
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+from azurecost.core import Core, make_time_period
+from azurecost.emulator import CostEmulator
+from azurecost.replay import (
+    RecordingCostManagementClient,
+    RecordingSubscriptionClient,
+    ReplayCostManagementClient,
+    ReplaySubscriptionClient,
+)
+from azurecost.session import Session
+
+SCOPE = "/subscriptions/test-sub-id"
+SUBSCRIPTION_ID = "00000000-0000-0000-0000-000000000000"
+
+
+def _make_usage(rows, next_link=None):
+    return SimpleNamespace(
+        columns=[
+            SimpleNamespace(name=name)
+            for name in ["Cost", "BillingMonth", "ServiceName", "Currency"]
+        ],
+        rows=rows,
+        next_link=next_link,
+    )
+
+
+def _make_payload(start=datetime(2023, 8, 1), end=datetime(2023, 9, 30)):
+    return {
+        "type": "ActualCost",
+        "timeframe": "Custom",
+        "time_period": make_time_period(start, end),
+        "dataset": {"granularity": "MONTHLY"},
+    }
+
+
+PAGES = [
+    _make_usage(
+        [[100.0, "2023-08-01T00:00:00", "Storage", "USD"]],
+        f"https://management.azure.com{SCOPE}/providers/Microsoft.CostManagement/query?$skiptoken=abc",
+    ),
+    _make_usage([[50.0, "2023-09-01T00:00:00", "Bandwidth", "USD"]]),
+]
+
+
+class TestRecordAndReplay:
+    def test_pages_are_replayed(self, tmp_path):
+        client = Mock()
+        client.query.usage.side_effect = PAGES
+        recording = RecordingCostManagementClient(client, str(tmp_path))
+        recording.query.usage(SCOPE, _make_payload())
+        recording.query.usage(SCOPE, _make_payload(), params={"$skiptoken": "abc"})
+
+        replay = ReplayCostManagementClient(str(tmp_path))
+        first = replay.query.usage(SCOPE, _make_payload())
+        assert [c.name for c in first.columns] == [c.name for c in PAGES[0].columns]
+        assert first.rows == PAGES[0].rows
+        assert first.next_link == PAGES[0].next_link
+        second = replay.query.usage(
+            SCOPE, _make_payload(), params={"$skiptoken": "abc"}
+        )
+        assert second.rows == PAGES[1].rows
+        assert replay.calls == 2
+
+    def test_other_time_period_uses_recording(self, tmp_path):
+        client = Mock()
+        client.query.usage.return_value = PAGES[1]
+        RecordingCostManagementClient(client, str(tmp_path)).query.usage(
+            SCOPE, _make_payload()
+        )
+        replay = ReplayCostManagementClient(str(tmp_path))
+        later = _make_payload(datetime(2024, 1, 1), datetime(2024, 2, 29))
+        assert replay.query.usage(SCOPE, later).rows == PAGES[1].rows
+
+    def test_ambiguous_recordings_raise(self, tmp_path):
+        client = Mock()
+        client.query.usage.return_value = PAGES[1]
+        recording = RecordingCostManagementClient(client, str(tmp_path))
+        recording.query.usage(SCOPE, _make_payload())
+        recording.query.usage(
+            SCOPE, _make_payload(datetime(2023, 9, 1), datetime(2023, 9, 30))
+        )
+        replay = ReplayCostManagementClient(str(tmp_path))
+        # The recording of the same month is used.
+        august = _make_payload(datetime(2023, 8, 2), datetime(2023, 8, 31))
+        assert replay.query.usage(SCOPE, august).rows == PAGES[1].rows
+        # Both recordings are of other months.
+        later = _make_payload(datetime(2024, 1, 1), datetime(2024, 2, 29))
+        with pytest.raises(KeyError, match="2 recorded responses"):
+            replay.query.usage(SCOPE, later)
+
+    def test_missing_recording(self, tmp_path):
+        replay = ReplayCostManagementClient(str(tmp_path))
+        with pytest.raises(KeyError):
+            replay.query.usage(SCOPE, _make_payload())
+        with pytest.raises(KeyError):
+            ReplaySubscriptionClient(str(tmp_path)).subscriptions.list()
+
+    def test_raw_response_hook_gets_the_body_size(self, tmp_path):
+        client = Mock()
+        client.query.usage.return_value = PAGES[1]
+        RecordingCostManagementClient(client, str(tmp_path)).query.usage(
+            SCOPE, _make_payload()
+        )
+        sizes = []
+        ReplayCostManagementClient(str(tmp_path)).query.usage(
+            SCOPE,
+            _make_payload(),
+            raw_response_hook=lambda r: sizes.append(len(r.http_response.body())),
+        )
+        assert sizes[0] > 0
+
+    def test_subscriptions(self, tmp_path):
+        client = Mock()
+        state = Mock(value="Enabled")
+        client.subscriptions.list.return_value = iter(
+            [SimpleNamespace(subscription_id="id-1", display_name="sub-1", state=state)]
+        )
+        recording = RecordingSubscriptionClient(client, str(tmp_path))
+        assert len(recording.subscriptions.list()) == 1
+
+        subscriptions = ReplaySubscriptionClient(str(tmp_path)).subscriptions.list()
+        assert [
+            (s.subscription_id, s.display_name, s.state) for s in subscriptions
+        ] == [("id-1", "sub-1", "Enabled")]
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_core_with_replay_session(self, tmp_path):
+        client = Mock()
+        client.query.usage.side_effect = PAGES
+        recorded = Core(
+            False,
+            cost_management_client=RecordingCostManagementClient(client, str(tmp_path)),
+        )
+        expected = recorded.convert_tabulate(None, recorded.iter_usage(1))
+
+        session = Session(replay_dir=str(tmp_path))
+        core = Core(False, session=session)
+        assert core.convert_tabulate(None, core.iter_usage(1)) == expected
+        assert session.get_cost_management_client().calls == 2
+
+
+@patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": SUBSCRIPTION_ID})
+def test_longer_window_replays_chunks_and_pages(tmp_path):
+    # Two pages per monthly chunk, within the burst of the rate limit.
+    emulator = CostEmulator(rows_per_period=20, page_size=400)
+    server = emulator.make_server("127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+
+        def get_counts(session, start, end):
+            core = Core(
+                False,
+                "DAILY",
+                ["ResourceGroup"],
+                session=session,
+                start_date=start,
+                end_date=end,
+            )
+            return Counter(r["UsageDate"] for r in core.get_usage()[1])
+
+        get_counts(
+            Session(credential_type="none", endpoint=url, record_dir=str(tmp_path)),
+            date(2023, 7, 10),
+            date(2023, 9, 20),
+        )
+        live = get_counts(
+            Session(credential_type="none", endpoint=url),
+            date(2023, 7, 9),
+            date(2023, 9, 21),
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    session = Session(replay_dir=str(tmp_path))
+    # The first and the last monthly chunks were recorded for other windows.
+    replayed = get_counts(session, date(2023, 7, 9), date(2023, 9, 21))
+    # Every chunk and page is answered by the recording of its month, so
+    # only the days that were not recorded are missing.
+    assert set(live) - set(replayed) == {20230709, 20230921}
+    assert all(replayed[day] == live[day] for day in replayed)
+    assert session.get_cost_management_client().calls > 2
@@ -0,0 +1,95 @@
+import io
+import pytest
+from azurecost.result import CostTable
+
+
+def make_table():
+    return CostTable.from_rows(
+        ["Cost", "BillingMonth", "ServiceName", "Currency"],
+        [
+            [1.5, "2023-08-01T00:00:00", "Storage", "USD"],
+            [2.0, "2023-09-01T00:00:00", "Storage", "USD"],
+            [3.0, "2023-09-01T00:00:00", "Bandwidth", "USD"],
+        ],
+    )
+
+
+class TestCostTable:
+    def test_rows_are_dict_views(self):
+        table = make_table()
+        assert len(table) == 3
+        assert table[0] == {
+            "Cost": 1.5,
+            "BillingMonth": "2023-08-01T00:00:00",
+            "ServiceName": "Storage",
+            "Currency": "USD",
+        }
+        assert table[-1]["ServiceName"] == "Bandwidth"
+        assert [r["Cost"] for r in table] == [1.5, 2.0, 3.0]
+        with pytest.raises(IndexError):
+            table[3]
+
+    def test_values_are_interned(self):
+        table = make_table()
+        assert table.values == ["Storage", "USD", "Bandwidth"]
+        assert list(table.codes("ServiceName")) == [0, 0, 2]
+        assert list(table.codes("BillingMonth")) == [20230801, 20230901, 20230901]
+
+    def test_daily_dates_keep_their_type(self):
+        table = CostTable.from_rows(["Cost", "UsageDate"], [[1.0, 20230901]])
+        assert table[0]["UsageDate"] == 20230901
+
+    def test_column(self):
+        assert make_table().column("ServiceName") == [
+            "Storage",
+            "Storage",
+            "Bandwidth",
+        ]
+
+    def test_group_sum(self):
+        table = make_table()
+        assert table.group_sum(["BillingMonth"]) == {
+            ("2023-08-01T00:00:00",): 1.5,
+            ("2023-09-01T00:00:00",): 5.0,
+        }
+        assert table.group_sum([]) == {(): 6.5}
+
+    def test_add_column_and_concat(self):
+        a = make_table()
+        a.add_column("Scope", "sub-a")
+        b = make_table()
+        b.add_column("Scope", "sub-b")
+        table = CostTable.concat([a, b])
+        assert len(table) == 6
+        assert table.column("Scope") == ["sub-a"] * 3 + ["sub-b"] * 3
+        assert table[4]["ServiceName"] == "Storage"
+
+    def test_equals_list_of_dicts(self):
+        table = CostTable.from_rows(["Cost", "UsageDate"], [[1.0, 20230901]])
+        assert table == [{"Cost": 1.0, "UsageDate": 20230901}]
+        assert table != [{"Cost": 2.0, "UsageDate": 20230901}]
+
+
+class TestColumnar:
+    def test_round_trip(self):
+        table = make_table()
+        f = io.BytesIO()
+        table.write_columnar(f)
+        f.seek(0)
+        loaded = CostTable.read_columnar(f)
+        assert loaded == table
+        assert loaded.columns == table.columns
+        assert loaded.group_sum(["ServiceName"]) == table.group_sum(["ServiceName"])
+
+    def test_codes_are_int32(self):
+        table = make_table()
+        f = io.BytesIO()
+        table.write_columnar(f)
+        data = f.getvalue()
+        header_length = int.from_bytes(data[8:12], "little")
+        # float64 costs, then int32 dates and codes.
+        assert len(data) == 12 + header_length + 3 * (8 + 4 + 4 + 4)
+
+    def test_invalid_file(self):
+        with pytest.raises(ValueError):
+            CostTable.read_columnar(io.BytesIO(b"not a table"))
@@ -0,0 +1,345 @@
+from datetime import date, datetime, timedelta, timezone
+import os
+import pytest
+from unittest.mock import Mock, patch
+from azurecost.core import Core, make_time_period
+from azurecost.filters import make_filter, make_grouping
+from azurecost.result import CostTable
+from azurecost.rollup import can_rollup, rollup, RollupIndex
+from azurecost.session import Session
+
+RESOURCE_A = "/subscriptions/sub/resourcegroups/rg-a/providers/microsoft.web/sites/a"
+RESOURCE_B = "/subscriptions/sub/resourcegroups/rg-b/providers/microsoft.web/sites/b"
+
+
+def _make_daily_table():
+    return CostTable.from_rows(
+        ["Cost", "UsageDate", "ResourceId", "ServiceName", "Currency"],
+        [
+            [1.0, 20240130, RESOURCE_A, "App Service", "USD"],
+            [2.0, 20240131, RESOURCE_B, "App Service", "USD"],
+            [3.0, 20240201, RESOURCE_A, "App Service", "USD"],
+            [4.0, 20240202, RESOURCE_A, "Storage", "USD"],
+        ],
+    )
+
+
+def _make_payload(granularity, dimensions, start, end, cost_type="ActualCost"):
+    payload = {
+        "type": cost_type,
+        "timeframe": "Custom",
+        "time_period": make_time_period(
+            datetime.combine(start, datetime.min.time(), tzinfo=timezone.utc),
+            datetime.combine(end, datetime.min.time(), tzinfo=timezone.utc),
+        ),
+        "dataset": {
+            "granularity": granularity,
+            "aggregation": {"totalCost": {"name": "Cost", "function": "Sum"}},
+        },
+    }
+    if dimensions:
+        payload["dataset"]["grouping"] = make_grouping(dimensions)
+    return payload
+
+
+class TestCanRollup:
+    def test_subset_and_coarser(self):
+        assert can_rollup("DAILY", ["ResourceId", "ServiceName"], "MONTHLY", [])
+        assert can_rollup("DAILY", ["ServiceName"], "DAILY", ["ServiceName"])
+        assert can_rollup("DAILY", ["ResourceId"], "MONTHLY", ["ResourceGroup"])
+
+    def test_finer_or_missing(self):
+        assert not can_rollup("MONTHLY", ["ServiceName"], "DAILY", ["ServiceName"])
+        assert not can_rollup("DAILY", ["ServiceName"], "DAILY", ["ResourceGroup"])
+        # Charges without a resource still have a subscription.
+        assert not can_rollup("DAILY", ["ResourceId"], "DAILY", ["SubscriptionId"])
+
+
+class TestRollup:
+    def test_daily_to_monthly_by_resource_group(self):
+        result = rollup(_make_daily_table(), "DAILY", "MONTHLY", ["ResourceGroup"])
+
+        assert result.columns == ["Cost", "BillingMonth", "ResourceGroup", "Currency"]
+        assert list(result) == [
+            {
+                "Cost": 1.0,
+                "BillingMonth": "2024-01-01T00:00:00",
+                "ResourceGroup": "rg-a",
+                "Currency": "USD",
+            },
+            {
+                "Cost": 2.0,
+                "BillingMonth": "2024-01-01T00:00:00",
+                "ResourceGroup": "rg-b",
+                "Currency": "USD",
+            },
+            {
+                "Cost": 7.0,
+                "BillingMonth": "2024-02-01T00:00:00",
+                "ResourceGroup": "rg-a",
+                "Currency": "USD",
+            },
+        ]
+
+    def test_subset_of_dimensions_within_window(self):
+        result = rollup(
+            _make_daily_table(),
+            "DAILY",
+            "DAILY",
+            ["ServiceName"],
+            start=date(2024, 1, 31),
+            end=date(2024, 2, 1),
+        )
+
+        assert [(r["UsageDate"], r["ServiceName"], r["Cost"]) for r in result] == [
+            (20240131, "App Service", 2.0),
+            (20240201, "App Service", 3.0),
+        ]
+
+    def test_resource_group_keeps_its_case(self):
+        table = CostTable.from_rows(
+            ["Cost", "UsageDate", "ResourceId"],
+            [[1.0, 20240201, RESOURCE_A.replace("rg-a", "RG-A")]],
+        )
+        result = rollup(table, "DAILY", "DAILY", ["ResourceGroup"])
+        assert [r["ResourceGroup"] for r in result] == ["RG-A"]
+
+    def test_resource_group_of_charges_without_resource(self):
+        table = CostTable.from_rows(
+            ["Cost", "UsageDate", "ResourceId"],
+            [[1.0, 20240201, RESOURCE_A], [2.0, 20240201, ""]],
+        )
+        with pytest.raises(ValueError):
+            rollup(table, "DAILY", "DAILY", ["ResourceGroup"])
+
+    def test_monthly_window_includes_whole_months(self):
+        result = rollup(
+            _make_daily_table(), "DAILY", "MONTHLY", [], start=date(2024, 2, 1)
+        )
+        assert [r["Cost"] for r in result] == [7.0]
+
+
+class TestRollupIndex:
+    def test_find_subset(self):
+        index = RollupIndex()
+        index.add(
+            "/subscriptions/SUB",
+            _make_payload(
+                "DAILY",
+                ["ResourceId", "ServiceName"],
+                date(2024, 1, 1),
+                date(2024, 2, 29),
+            ),
+            _make_daily_table(),
+        )
+
+        result = index.find(
+            "/subscriptions/sub",
+            _make_payload(
+                "MONTHLY", ["ServiceName"], date(2024, 2, 1), date(2024, 2, 29)
+            ),
+        )
+        assert [(r["ServiceName"], r["Cost"]) for r in result] == [
+            ("App Service", 3.0),
+            ("Storage", 4.0),
+        ]
+
+    def test_no_match(self):
+        index = RollupIndex()
+        index.add(
+            "/subscriptions/sub",
+            _make_payload(
+                "DAILY", ["ServiceName"], date(2024, 1, 15), date(2024, 2, 29)
+            ),
+            _make_daily_table(),
+        )
+
+        def find(*args, **kwargs):
+            return index.find("/subscriptions/sub", _make_payload(*args, **kwargs))
+
+        # wider window, other dimension, other cost type
+        assert find("DAILY", [], date(2024, 1, 1), date(2024, 2, 29)) is None
+        assert (
+            find("DAILY", ["ResourceId"], date(2024, 2, 1), date(2024, 2, 29)) is None
+        )
+        assert (
+            find(
+                "DAILY",
+                [],
+                date(2024, 2, 1),
+                date(2024, 2, 29),
+                cost_type="AmortizedCost",
+            )
+            is None
+        )
+        assert (
+            index.find(
+                "/subscriptions/other",
+                _make_payload("DAILY", [], date(2024, 2, 1), date(2024, 2, 29)),
+            )
+            is None
+        )
+
+    def test_tags_and_filters(self):
+        table = CostTable.from_rows(
+            ["Cost", "UsageDate", "ServiceName", "tag:env", "Currency"],
+            [
+                [1.0, 20240201, "Storage", "prod", "USD"],
+                [2.0, 20240202, "Storage", "stg", "USD"],
+            ],
+        )
+        payload = _make_payload(
+            "DAILY", ["ServiceName", "tag:env"], date(2024, 2, 1), date(2024, 2, 29)
+        )
+        payload["dataset"]["filter"] = make_filter({"ServiceName": ["Storage"]})
+        index = RollupIndex()
+        index.add("/subscriptions/sub", payload, table)
+
+        narrower = _make_payload(
+            "MONTHLY", ["tag:env"], date(2024, 2, 1), date(2024, 2, 29)
+        )
+        # Results of other filters can not be used.
+        assert index.find("/subscriptions/sub", narrower) is None
+        narrower["dataset"]["filter"] = payload["dataset"]["filter"]
+        result = index.find("/subscriptions/sub", narrower)
+        assert [(r["tag:env"], r["Cost"]) for r in result] == [
+            ("prod", 1.0),
+            ("stg", 2.0),
+        ]
+
+    def test_open_entries_expire(self):
+        index = RollupIndex(ttl=60)
+        today = datetime.now(timezone.utc).date()
+        payload = _make_payload("DAILY", ["ResourceId"], today, today)
+        index.add("/subscriptions/sub", payload, _make_daily_table())
+
+        assert index.find("/subscriptions/sub", payload) is not None
+        with patch("azurecost.rollup.time.time", return_value=4e9):
+            assert index.find("/subscriptions/sub", payload) is None
+
+    def test_charges_without_resource_are_queried(self):
+        table = CostTable.from_rows(
+            ["Cost", "UsageDate", "ResourceId"], [[1.0, 20240201, ""]]
+        )
+        index = RollupIndex()
+        index.add(
+            "/subscriptions/sub",
+            _make_payload("DAILY", ["ResourceId"], date(2024, 2, 1), date(2024, 2, 29)),
+            table,
+        )
+        payload = _make_payload(
+            "DAILY", ["ResourceGroup"], date(2024, 2, 1), date(2024, 2, 29)
+        )
+        assert index.find("/subscriptions/sub", payload) is None
+
+    def test_open_entries_are_replaced(self, tmp_path):
+        today = datetime.now(timezone.utc).date()
+        payload = _make_payload("DAILY", ["ResourceId"], today, today)
+        index = RollupIndex(str(tmp_path), ttl=60)
+        for _ in range(5):
+            index.add("/subscriptions/sub", payload, _make_daily_table())
+
+        assert len(index._entries) == 1
+        assert len(os.listdir(tmp_path)) == 2
+
+    def test_expired_entries_are_deleted(self, tmp_path):
+        today = datetime.now(timezone.utc).date()
+        payload = _make_payload("DAILY", ["ResourceId"], today, today)
+        RollupIndex(str(tmp_path), ttl=60).add(
+            "/subscriptions/sub", payload, _make_daily_table()
+        )
+
+        index = RollupIndex(str(tmp_path))
+        with patch("azurecost.rollup.time.time", return_value=4e9):
+            assert index.find("/subscriptions/sub", payload) is None
+        assert os.listdir(tmp_path) == []
+
+    def test_entries_are_kept_on_disk(self, tmp_path):
+        payload = _make_payload(
+            "DAILY", ["ResourceId"], date(2024, 1, 1), date(2024, 2, 29)
+        )
+        RollupIndex(str(tmp_path)).add(
+            "/subscriptions/sub", payload, _make_daily_table()
+        )
+
+        index = RollupIndex(str(tmp_path))
+        result = index.find(
+            "/subscriptions/sub",
+            _make_payload(
+                "MONTHLY", ["ResourceGroup"], date(2024, 1, 1), date(2024, 2, 29)
+            ),
+        )
+        assert len(result) == 3
+        assert len(index._entries) == 1
+
+
+class TestCoreRollup:
+    def _make_client(self):
+        def usage(scope, payload, **kwargs):
+            names = [g["name"] for g in payload["dataset"].get("grouping", [])]
+            start = payload["time_period"].from_property.date()
+            rows = []
+            for i in range((payload["time_period"].to.date() - start).days + 1):
+                day = int((start + timedelta(days=i)).strftime("%Y%m%d"))
+                rows.append([1.0, day, RESOURCE_A, "App Service", "USD"])
+                rows.append([2.0, day, RESOURCE_B, "Storage", "USD"])
+            usage = Mock()
+            usage.columns = []
+            for name in ["Cost", "UsageDate"] + names + ["Currency"]:
+                col = Mock()
+                col.name = name
+                usage.columns.append(col)
+            usage.rows = [
+                [row[0], row[1]]
+                + [row[2] if n == "ResourceId" else row[3] for n in names]
+                + [row[4]]
+                for row in rows
+            ]
+            usage.next_link = None
+            return usage
+
+        client = Mock()
+        client.query.usage.side_effect = usage
+        return client
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "sub"})
+    def test_later_queries_are_computed_locally(self):
+        client = self._make_client()
+        session = Session(credential=Mock(), rollup_index=RollupIndex())
+
+        def make_core(granularity, dimensions):
+            return Core(
+                False,
+                granularity,
+                dimensions,
+                cost_management_client=client,
+                session=session,
+                chunk_by_month=False,
+            )
+
+        make_core("DAILY", ["ResourceId", "ServiceName"]).get_usage(62)
+        assert client.query.usage.call_count == 1
+
+        total_results, results = make_core("MONTHLY", ["ResourceGroup"]).get_usage(1)
+        assert client.query.usage.call_count == 1
+        assert {r["ResourceGroup"] for r in results} == {"rg-a", "rg-b"}
+        assert len(total_results) == len({r["BillingMonth"] for r in results})
+
+        core = make_core("DAILY", ["ServiceName"])
+        rows = list(core.iter_usage(7))
+        assert client.query.usage.call_count == 1
+        assert {r["ServiceName"] for r in rows} == {"App Service", "Storage"}
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "sub"})
+    def test_total_query_is_sent_without_derive_total(self):
+        client = self._make_client()
+        core = Core(
+            False,
+            "DAILY",
+            ["ServiceName"],
+            cost_management_client=client,
+            session=Session(credential=Mock(), rollup_index=RollupIndex()),
+            derive_total=False,
+        )
+        core.get_usage(3)
+        assert client.query.usage.call_count == 2
@@ -0,0 +1,100 @@
+import pytest
+from unittest.mock import Mock
+from azure.core.exceptions import HttpResponseError
+from azurecost.scheduler import RequestScheduler, TokenBucket, get_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def make_error(status_code, headers=None):
+    response = Mock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.reason = "Too Many Requests"
+    response.text.return_value = ""
+    return HttpResponseError(response=response)
+
+
+class TestTokenBucket:
+    def test_burst_then_spaced_slots(self):
+        bucket = TokenBucket(rate=60, burst=2, now=0.0)
+        assert bucket.reserve(0.0) == 0
+        assert bucket.reserve(0.0) == 0
+        assert bucket.reserve(0.0) == pytest.approx(1.0)
+        assert bucket.reserve(0.0) == pytest.approx(2.0)
+
+    def test_block_delays_next_reservation(self):
+        bucket = TokenBucket(rate=60, burst=5, now=0.0)
+        bucket.block(0.0, 10.0)
+        assert bucket.reserve(0.0) == pytest.approx(10.0)
+        assert bucket.reserve(0.0) == pytest.approx(11.0)
+
+
+class TestRequestScheduler:
+    def test_call_returns_result(self):
+        scheduler = RequestScheduler()
+        assert scheduler.call("/subscriptions/x", lambda a: a + 1, 1) == 2
+        assert scheduler.stats["requests"] == 1
+
+    def test_retries_after_throttling(self):
+        clock = FakeClock()
+        scheduler = RequestScheduler(backoff_base=0.0, sleep=clock.sleep, clock=clock)
+        func = Mock(side_effect=[make_error(429, {"Retry-After": "5"}), "ok"])
+
+        assert scheduler.call("/subscriptions/x", func) == "ok"
+        assert func.call_count == 2
+        assert clock.now == pytest.approx(5.0)
+        assert scheduler.stats["throttled"] == 1
+        assert scheduler.stats["retried"] == 1
+        assert scheduler.stats["waited"] == pytest.approx(5.0)
+
+    def test_gives_up_after_retry_budget(self):
+        clock = FakeClock()
+        scheduler = RequestScheduler(max_retries=2, sleep=clock.sleep, clock=clock)
+        func = Mock(side_effect=make_error(429))
+
+        with pytest.raises(HttpResponseError):
+            scheduler.call("/subscriptions/x", func)
+        assert func.call_count == 3
+
+    def test_does_not_retry_client_errors(self):
+        scheduler = RequestScheduler()
+        func = Mock(side_effect=make_error(400))
+
+        with pytest.raises(HttpResponseError):
+            scheduler.call("/subscriptions/x", func)
+        assert func.call_count == 1
+
+    def test_buckets_are_per_scope(self):
+        clock = FakeClock()
+        scheduler = RequestScheduler(rate=60, burst=1, sleep=clock.sleep, clock=clock)
+        scheduler.call("/subscriptions/a", lambda: None)
+        scheduler.call("/subscriptions/b", lambda: None)
+        assert clock.now == 0
+        scheduler.call("/subscriptions/a", lambda: None)
+        assert clock.now == pytest.approx(1.0)
+
+
+def test_get_retry_after_uses_longest_header():
+    response = Mock()
+    response.headers = {
+        "x-ms-ratelimit-microsoft.costmanagement-qpu-retry-after": "10",
+        "x-ms-ratelimit-microsoft.costmanagement-entity-retry-after": "30",
+    }
+    assert get_retry_after(response) == 30.0
+
+
+def test_get_retry_after_without_headers():
+    response = Mock()
+    response.headers = {}
+    assert get_retry_after(response) is None
+    assert get_retry_after(None) is None
@@ -0,0 +1,232 @@
+import json
+import os
+import threading
+import pytest
+from unittest.mock import Mock, patch
+from urllib.error import HTTPError
+from urllib.request import urlopen
+from azurecost.core import Core
+from azurecost.server import CostServer, parse_query, Query
+
+
+def _make_usage():
+    usage = Mock()
+    usage.columns = []
+    for name in ["Cost", "BillingMonth", "ServiceName", "Currency"]:
+        col = Mock()
+        col.name = name
+        usage.columns.append(col)
+    usage.rows = [
+        [100.0, "2023-08-01T00:00:00", "Storage", "USD"],
+        [50.0, "2023-08-01T00:00:00", "Bandwidth", "USD"],
+    ]
+    usage.next_link = None
+    return usage
+
+
+def _make_query(**kwargs):
+    return parse_query({"subscription": ["test-sub"], **kwargs})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestParseQuery:
+    def test_defaults(self):
+        assert parse_query({}) == Query(
+            None, None, (), False, "MONTHLY", ("ServiceName",), 1
+        )
+
+    def test_values(self):
+        query = parse_query(
+            {
+                "scope": ["a", "b/rg"],
+                "all_subscriptions": ["true"],
+                "granularity": ["daily"],
+                "dimensions": ["ServiceName", "ResourceGroup"],
+                "ago": ["7"],
+            }
+        )
+        assert query.scopes == ("a", "b/rg")
+        assert query.all_subscriptions
+        assert query.granularity == "DAILY"
+        assert query.dimensions == ("ServiceName", "ResourceGroup")
+        assert query.ago == 7
+
+    def test_filters_and_tags(self):
+        query = parse_query(
+            {
+                "dimensions": ["tag:env"],
+                "filter": ["ServiceName=Storage,Bandwidth"],
+                "tag": ["env=prod"],
+            }
+        )
+        assert query.dimensions == ("tag:env",)
+        assert query.filters == (("ServiceName", ("Storage", "Bandwidth")),)
+        assert query.tags == (("env", ("prod",)),)
+        hash(query)
+
+    @pytest.mark.parametrize(
+        "params",
+        [
+            {"granularity": ["HOURLY"]},
+            {"ago": ["x"]},
+            {"ago": ["-1"]},
+            {"dimensions": ["Nope"]},
+            {"filter": ["Nope=x"]},
+            {"tag": ["env"]},
+        ],
+    )
+    def test_invalid_values(self, params):
+        with pytest.raises(ValueError):
+            parse_query(params)
+
+
+class TestCostServer:
+    def _make_server(self, **kwargs):
+        self.mock_client = Mock()
+        self.mock_client.query.usage.side_effect = lambda *a, **k: _make_usage()
+        self.cores = []
+
+        def core_factory(query):
+            with patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"}):
+                core = Core(
+                    False,
+                    query.granularity,
+                    list(query.dimensions),
+                    cost_management_client=self.mock_client,
+                )
+            self.cores.append(core)
+            return core
+
+        return CostServer(core_factory=core_factory, **kwargs)
+
+    def test_query_returns_pivoted_json(self):
+        server = self._make_server()
+        result = server.query(_make_query())
+
+        assert result["currency"] == "USD"
+        assert result["periods"] == ["2023-08"]
+        assert result["rows"] == [
+            {"scope": None, "key": "total", "costs": {"2023-08": 150.0}},
+            {"scope": None, "key": "Storage", "costs": {"2023-08": 100.0}},
+            {"scope": None, "key": "Bandwidth", "costs": {"2023-08": 50.0}},
+        ]
+
+    def test_query_as_table(self):
+        server = self._make_server()
+        assert "Storage" in server.query(_make_query(), "table")
+
+    def test_results_are_cached(self):
+        server = self._make_server()
+        server.query(_make_query())
+        server.query(_make_query())
+
+        assert self.mock_client.query.usage.call_count == 1
+        assert server.stats == {"hits": 1, "misses": 1, "coalesced": 0}
+
+    def test_results_expire(self):
+        clock = FakeClock()
+        server = self._make_server(ttl=10, clock=clock)
+        server.query(_make_query())
+        clock.now = 11
+        server.query(_make_query())
+
+        assert self.mock_client.query.usage.call_count == 2
+
+    def test_least_recently_used_is_evicted(self):
+        server = self._make_server(max_results=2)
+        server.query(_make_query(ago=["1"]))
+        server.query(_make_query(ago=["2"]))
+        server.query(_make_query(ago=["1"]))
+        server.query(_make_query(ago=["3"]))
+
+        assert _make_query(ago=["1"]) in server._results
+        assert _make_query(ago=["2"]) not in server._results
+
+    def test_identical_queries_are_coalesced(self):
+        started = threading.Event()
+        release = threading.Event()
+        core = Mock()
+
+        def get_usage(ago):
+            started.set()
+            release.wait(5)
+            return [], []
+
+        core.get_usage.side_effect = get_usage
+        core_factory = Mock(return_value=core)
+        server = CostServer(core_factory=core_factory)
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(server.get_usage(_make_query()))
+            )
+            for _ in range(3)
+        ]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while server.stats["coalesced"] < 2:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert core_factory.call_count == 1
+        assert len(results) == 3
+        assert all(result is results[0] for result in results)
+
+    def test_errors_are_not_cached(self):
+        core_factory = Mock(side_effect=ValueError("Subscription name is required."))
+        server = CostServer(core_factory=core_factory)
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                server.query(_make_query())
+        assert core_factory.call_count == 2
+
+
+class TestHttpApi:
+    @pytest.fixture
+    def base_url(self):
+        test = TestCostServer()
+        cost_server = test._make_server()
+        server = cost_server.make_server("127.0.0.1", 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+        server.shutdown()
+        server.server_close()
+
+    def test_cost(self, base_url):
+        with urlopen(f"{base_url}/cost?subscription=x&dimensions=ServiceName") as res:
+            body = json.load(res)
+        assert body["rows"][0]["key"] == "total"
+
+    def test_cost_as_table(self, base_url):
+        with urlopen(f"{base_url}/cost?format=table") as res:
+            assert res.headers["Content-Type"].startswith("text/plain")
+            assert "Storage" in res.read().decode()
+
+    def test_invalid_query(self, base_url):
+        with pytest.raises(HTTPError) as e:
+            urlopen(f"{base_url}/cost?granularity=HOURLY")
+        assert e.value.code == 400
+        assert "Invalid granularity" in json.load(e.value)["error"]
+
+    def test_stats_and_healthz(self, base_url):
+        with urlopen(f"{base_url}/healthz") as res:
+            assert json.load(res) == {"status": "ok"}
+        with urlopen(f"{base_url}/stats") as res:
+            assert json.load(res)["misses"] == 0
+
+    def test_not_found(self, base_url):
+        with pytest.raises(HTTPError) as e:
+            urlopen(f"{base_url}/nope")
+        assert e.value.code == 404
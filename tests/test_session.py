@@ -0,0 +1,107 @@
+import os
+import pytest
+import time
+from unittest.mock import Mock, patch
+from azure.core.credentials import AccessToken
+from azure.core.pipeline import PipelineContext, PipelineRequest
+from azure.core.rest import HttpRequest
+from azurecost.core import Core
+from azurecost.session import CachingCredential, Session
+
+
+class TestCachingCredential:
+    def test_reuses_token_until_expiry(self):
+        inner = Mock()
+        inner.get_token.return_value = AccessToken("token", int(time.time()) + 3600)
+        credential = CachingCredential(inner)
+
+        assert credential.get_token("scope").token == "token"
+        assert credential.get_token("scope").token == "token"
+        assert inner.get_token.call_count == 1
+
+    def test_refreshes_token_near_expiry(self):
+        inner = Mock()
+        inner.get_token.return_value = AccessToken("token", int(time.time()) + 60)
+        credential = CachingCredential(inner, refresh_margin=300)
+
+        credential.get_token("scope")
+        credential.get_token("scope")
+        assert inner.get_token.call_count == 2
+
+    def test_tokens_are_cached_per_scope(self):
+        inner = Mock()
+        inner.get_token.return_value = AccessToken("token", int(time.time()) + 3600)
+        credential = CachingCredential(inner)
+
+        credential.get_token("scope-a")
+        credential.get_token("scope-b")
+        assert inner.get_token.call_count == 2
+
+    def test_claims_bypass_cache(self):
+        inner = Mock()
+        inner.get_token.return_value = AccessToken("token", int(time.time()) + 3600)
+        credential = CachingCredential(inner)
+
+        credential.get_token("scope")
+        credential.get_token("scope", claims="challenge")
+        assert inner.get_token.call_count == 2
+
+
+class TestSession:
+    def test_default_is_shared(self):
+        assert Session.default() is Session.default()
+
+    @patch("azure.identity.AzureCliCredential")
+    def test_credential_type_skips_default_credential(self, mock_cli_credential):
+        session = Session(credential_type="cli")
+        assert session.credential.credential is mock_cli_credential.return_value
+        assert session.credential is session.credential
+
+    def test_unknown_credential_type(self):
+        with pytest.raises(ValueError, match="Unknown credential type"):
+            Session(credential_type="unknown").credential
+
+    @patch("azure.mgmt.costmanagement.CostManagementClient")
+    def test_clients_share_transport(self, mock_client_class):
+        session = Session(credential=Mock())
+        client = session.get_cost_management_client()
+
+        assert session.get_cost_management_client() is client
+        assert mock_client_class.call_count == 1
+        assert mock_client_class.call_args[1]["transport"] is session.transport
+
+    @patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+    def test_core_instances_share_session_clients(self):
+        session = Mock()
+        core1 = Core(False, session=session)
+        core2 = Core(False, session=session)
+
+        assert core1.cost_management_client is core2.cost_management_client
+        assert core1.credential is session.credential
+
+    @patch("azure.mgmt.costmanagement.CostManagementClient")
+    def test_endpoint(self, mock_client_class):
+        Session(
+            credential=Mock(), endpoint="https://example.com/"
+        ).get_cost_management_client()
+        kwargs = mock_client_class.call_args[1]
+        assert kwargs["base_url"] == "https://example.com"
+        assert "authentication_policy" not in kwargs
+
+    @patch("azure.mgmt.costmanagement.CostManagementClient")
+    def test_http_endpoint_sends_token(self, mock_client_class):
+        session = Session(credential_type="none", endpoint="http://127.0.0.1:8100")
+        session.get_cost_management_client()
+        policy = mock_client_class.call_args[1]["authentication_policy"]
+        request = PipelineRequest(
+            HttpRequest("GET", "http://127.0.0.1:8100/subscriptions"),
+            PipelineContext(None),
+        )
+        policy.on_request(request)
+        assert request.http_request.headers["Authorization"] == "Bearer offline"
+
+    @patch("azure.mgmt.costmanagement.CostManagementClient")
+    def test_record_dir_wraps_client(self, mock_client_class, tmp_path):
+        session = Session(credential=Mock(), record_dir=str(tmp_path))
+        client = session.get_cost_management_client()
+        assert client.client is mock_client_class.return_value
@@ -0,0 +1,27 @@
+import subprocess
+import sys
+
+
+def run_isolated(code):
+    return subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.split()
+
+
+def test_import_does_not_load_azure_sdk():
+    heavy = run_isolated(
+        "import sys, azurecost, azurecost.commands; "
+        "print(*[m for m in sys.modules if m.startswith(('azure.', 'tabulate'))])"
+    )
+    assert heavy == []
+
+
+def test_version_does_not_load_azure_sdk():
+    output = run_isolated(
+        "import sys\n"
+        "from click.testing import CliRunner\n"
+        "from azurecost import commands\n"
+        "print(CliRunner().invoke(commands.cli, ['--version']).output)\n"
+        "print(*[m for m in sys.modules if m.startswith(('azure.', 'tabulate'))])"
+    )
+    assert len(output) == 1
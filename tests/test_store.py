@@ -0,0 +1,107 @@
+import os
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+from azurecost.core import Core
+from azurecost.store import CostStore
+
+
+def make_usage(columns, rows):
+    usage = Mock()
+    usage.columns = []
+    for name in columns:
+        col = Mock()
+        col.name = name
+        usage.columns.append(col)
+    usage.rows = rows
+    usage.next_link = None
+    return usage
+
+
+def date_key(d):
+    return int(d.strftime("%Y%m%d"))
+
+
+class TestCostStore:
+    def test_plan_without_entry_fetches_whole_window(self, tmp_path):
+        store = CostStore(str(tmp_path))
+        start, end = date(2023, 8, 1), date(2023, 8, 31)
+        assert store.plan(None, "DAILY", start, end) == start
+
+    def test_plan_skips_settled_window(self, tmp_path):
+        store = CostStore(str(tmp_path))
+        entry = {"synced_from": "2023-08-01", "settled_until": "2023-08-31"}
+        assert store.plan(entry, "DAILY", date(2023, 8, 10), date(2023, 8, 31)) is None
+
+    def test_plan_fetches_after_settled_date(self, tmp_path):
+        store = CostStore(str(tmp_path))
+        entry = {"synced_from": "2023-08-01", "settled_until": "2023-08-20"}
+        assert store.plan(entry, "DAILY", date(2023, 8, 1), date(2023, 8, 31)) == date(
+            2023, 8, 21
+        )
+
+    def test_plan_refetches_when_window_grows_backwards(self, tmp_path):
+        store = CostStore(str(tmp_path))
+        entry = {"synced_from": "2023-08-01", "settled_until": "2023-08-31"}
+        assert store.plan(entry, "DAILY", date(2023, 7, 1), date(2023, 8, 31)) == date(
+            2023, 7, 1
+        )
+
+    def test_merge_replaces_unsettled_rows(self, tmp_path):
+        store = CostStore(str(tmp_path))
+        entry = {
+            "synced_from": "2023-08-01",
+            "settled_until": "2023-08-01",
+            "columns": ["Cost", "UsageDate"],
+            "rows": [[1.0, 20230801], [2.0, 20230802]],
+        }
+        merged = store.merge(
+            entry,
+            "DAILY",
+            date(2023, 8, 1),
+            date(2023, 8, 3),
+            date(2023, 8, 2),
+            ["Cost", "UsageDate"],
+            [[2.5, 20230802], [3.0, 20230803]],
+        )
+        assert merged["rows"] == [[1.0, 20230801], [2.5, 20230802], [3.0, 20230803]]
+        assert merged["synced_from"] == "2023-08-01"
+        assert merged["settled_until"] == "2023-08-03"
+
+    def test_get_settled_until_monthly_is_month_end(self, tmp_path):
+        store = CostStore(str(tmp_path))
+        settled_until = store.get_settled_until("MONTHLY")
+        assert (settled_until + timedelta(days=1)).day == 1
+
+
+@patch.dict(os.environ, {"AZURE_SUBSCRIPTION_ID": "test-sub-id"})
+def test_core_sync_fetches_only_unsettled_days(tmp_path):
+    today = datetime.now(timezone.utc).date()
+    days = [today - timedelta(days=i) for i in range(10, -1, -1)]
+    mock_client = Mock()
+    mock_client.query.usage.side_effect = lambda scope, payload: make_usage(
+        ["Cost", "UsageDate"],
+        [
+            [1.0, date_key(d)]
+            for d in days
+            if d >= payload["time_period"].from_property.date()
+        ],
+    )
+
+    core = Core(
+        False,
+        granularity="DAILY",
+        dimensions=["ServiceName"],
+        cost_management_client=mock_client,
+        store=CostStore(str(tmp_path)),
+    )
+    total_results, _ = core.get_usage(ago=10)
+    assert len(total_results) == 11
+
+    mock_client.query.usage.reset_mock()
+    total_results, _ = core.get_usage(ago=10)
+    assert len(total_results) == 11
+    fetch_from = min(
+        call[0][1]["time_period"].from_property.date()
+        for call in mock_client.query.usage.call_args_list
+    )
+    assert fetch_from == today - timedelta(days=CostStore().settle_days)
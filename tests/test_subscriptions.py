@@ -0,0 +1,113 @@
+import os
+from unittest.mock import Mock, patch
+from azurecost.core import Core
+from azurecost.session import Session
+from azurecost.subscriptions import SubscriptionIndex
+
+
+def _make_client(*subscriptions):
+    client = Mock()
+    client.subscriptions.list.return_value = [
+        Mock(display_name=name, subscription_id=subscription_id, state="Enabled")
+        for name, subscription_id in subscriptions
+    ]
+    return client
+
+
+class TestSubscriptionIndex:
+    def test_resolve_lists_once_for_all_names(self):
+        client = _make_client(("a", "id-a"), ("b", "id-b"))
+        index = SubscriptionIndex(lambda: client)
+
+        assert index.resolve(["a", "b"]) == {"a": "id-a", "b": "id-b"}
+        assert index.get("a") == "id-a"
+        assert client.subscriptions.list.call_count == 1
+
+    def test_miss_refreshes_index(self):
+        client = _make_client(("a", "id-a"))
+        index = SubscriptionIndex(lambda: client, min_refresh_interval=0)
+        index.get("a")
+
+        client.subscriptions.list.return_value = [
+            Mock(display_name="new", subscription_id="id-new", state="Enabled")
+        ]
+        assert index.get("new") == "id-new"
+        assert client.subscriptions.list.call_count == 2
+
+    def test_repeated_miss_is_not_refreshed_immediately(self):
+        client = _make_client(("a", "id-a"))
+        index = SubscriptionIndex(lambda: client)
+
+        assert index.get("missing") is None
+        assert index.get("missing") is None
+        assert client.subscriptions.list.call_count == 1
+
+    def test_expired_index_is_refreshed(self):
+        client = _make_client(("a", "id-a"))
+        index = SubscriptionIndex(lambda: client, ttl=3600)
+        index.get("a")
+
+        with patch("azurecost.subscriptions.time.time", return_value=4e9):
+            index.get("a")
+        assert client.subscriptions.list.call_count == 2
+
+    def test_first_display_name_wins(self):
+        client = _make_client(("a", "id-1"), ("a", "id-2"))
+        index = SubscriptionIndex(lambda: client)
+
+        assert index.get("a") == "id-1"
+
+    def test_index_is_persisted(self, tmp_path):
+        path = str(tmp_path / "subscriptions.json")
+        client = _make_client(("a", "id-a"))
+        SubscriptionIndex(lambda: client, path=path).get("a")
+
+        other = _make_client()
+        assert SubscriptionIndex(lambda: other, path=path).get("a") == "id-a"
+        assert other.subscriptions.list.call_count == 0
+
+    def test_corrupt_file_is_ignored(self, tmp_path):
+        path = tmp_path / "subscriptions.json"
+        path.write_text("{")
+        client = _make_client(("a", "id-a"))
+
+        assert SubscriptionIndex(lambda: client, path=str(path)).get("a") == "id-a"
+
+
+class TestSharedIndex:
+    def test_core_instances_share_session_index(self):
+        client = _make_client(("a", "id-a"), ("b", "id-b"))
+        session = Session(credential=Mock())
+        session._subscription_client = client
+
+        Core(
+            False, subscription_name="a", session=session, cost_management_client=Mock()
+        )
+        core = Core(
+            False,
+            scopes=["a", "b/rg"],
+            session=session,
+            cost_management_client=Mock(),
+        )
+
+        assert [scope.path for scope in core.scopes] == [
+            "/subscriptions/id-a",
+            "/subscriptions/id-b/resourceGroups/rg",
+        ]
+        assert client.subscriptions.list.call_count == 1
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_injected_client_uses_private_index(self):
+        session = Session(credential=Mock())
+        client = _make_client(("a", "id-a"))
+
+        core = Core(
+            False,
+            subscription_name="a",
+            session=session,
+            subscription_client=client,
+            cost_management_client=Mock(),
+        )
+
+        assert core.subscription_id == "id-a"
+        assert core.subscription_index is not session.subscription_index